@@ -1,16 +1,30 @@
 from django.contrib import admin
 
-from .models import City, CitySearchResult, Forecast
+from .models import City, CitySearchResult, Forecast, ForecastArchive
 
 
 @admin.register(City)
 class CityAdmin(admin.ModelAdmin):
-    list_display = ("ref", "name", "latitude", "longitude", "country_code")
+    list_display = (
+        "ref",
+        "name",
+        "latitude",
+        "longitude",
+        "country_code",
+        "fetched_at",
+        "checked_at"
+    )
 
 
 @admin.register(CitySearchResult)
 class CitySearchResultAdmin(admin.ModelAdmin):
-    list_display = ("city", "search")
+    list_display = (
+        "city",
+        "search",
+        "request_count",
+        "window_count",
+        "last_requested_at"
+    )
 
 
 @admin.register(Forecast)
@@ -27,3 +41,23 @@ class ForecastAdmin(admin.ModelAdmin):
     list_filter = (
         "city",
     )
+
+    list_select_related = (
+        "city",
+        "condition"
+    )
+
+
+@admin.register(ForecastArchive)
+class ForecastArchiveAdmin(admin.ModelAdmin):
+    list_display = (
+        "city",
+        "date",
+        "samples",
+        "temperature_min",
+        "temperature_max"
+    )
+
+    list_filter = (
+        "city",
+    )
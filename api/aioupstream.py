@@ -0,0 +1,188 @@
+import asyncio
+import json
+import weakref
+
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import upstream
+from .log import logger
+
+# optional, only the ASGI application needs it
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class Response(object):
+    """The parts of a requests.Response the API's callers rely on."""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncClient(object):
+    """The asyncio counterpart of upstream.Client.
+
+    All coroutines of an event loop share one aiohttp.ClientSession, so
+    connections to the API are kept alive and reused, at most
+    max_connections of them are open at once. Waiting for the API doesn't
+    block a thread, so one process can have as many queries in flight as it
+    has connections.
+    """
+
+    def __init__(self, base_url, connect_timeout, read_timeout, max_retries,
+                 retry_backoff, max_connections):
+        if aiohttp is None:
+            raise ImproperlyConfigured(
+                "The ASGI application needs aiohttp (pip install aiohttp)."
+            )
+
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # waiting for a free connection counts against the connect timeout,
+        # so requests don't queue up forever if all connections are busy
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections),
+            timeout=aiohttp.ClientTimeout(
+                connect=connect_timeout,
+                sock_read=read_timeout
+            ),
+            headers={"Accept": "application/json"},
+            raise_for_status=False
+        )
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            base_url=settings.OPENWEATHERMAPORG_API_URL,
+            connect_timeout=settings.OPENWEATHERMAPORG_CONNECT_TIMEOUT,
+            read_timeout=settings.OPENWEATHERMAPORG_READ_TIMEOUT,
+            max_retries=settings.OPENWEATHERMAPORG_MAX_RETRIES,
+            retry_backoff=settings.OPENWEATHERMAPORG_RETRY_BACKOFF,
+            max_connections=settings.OPENWEATHERMAPORG_MAX_CONNECTIONS
+        )
+
+    async def close(self):
+        await self.session.close()
+
+    async def send(self, url, params):
+        async with self.session.get(url, params=params) as response:
+            return Response(
+                str(response.url),
+                response.status,
+                response.headers,
+                await response.read()
+            )
+
+    async def get(self, endpoint, params):
+        """Send a GET request to an endpoint of the API, retried just like
+        upstream.Client.get().
+
+        :param endpoint: The path relative to the API's base URL, i.e.
+                         "forecast"
+        :param params: A dict with the query parameters
+        :return: The Response of the API
+        :raises UpstreamError: If no usable response could be obtained
+        """
+        url = urljoin(self.base_url, endpoint)
+
+        for attempt in range(self.max_retries + 1):
+
+            response = None
+
+            try:
+                response = await self.send(url, params)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = "{}: {}".format(type(e).__name__, e)
+
+            else:
+                if response.status_code not in upstream.RETRY_STATUS_CODES:
+                    return response
+
+                error = "HTTP {}".format(response.status_code)
+
+            if attempt < self.max_retries:
+                delay = upstream.retry_delay(
+                    attempt,
+                    self.retry_backoff,
+                    response
+                )
+
+                logger.warning(
+                    "Request to %s failed (%s), retrying in %.2fs.",
+                    endpoint,
+                    error,
+                    delay
+                )
+
+                await asyncio.sleep(delay)
+
+        raise upstream.UpstreamError(
+            "The openweathermap.org API is not available ({}).".format(error)
+        )
+
+
+# one client per event loop, its connections can't be shared across loops
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Get the AsyncClient of the current event loop, create it from the
+    settings if needed."""
+    loop = asyncio.get_event_loop()
+    client = _clients.get(loop)
+
+    if client is None:
+        client = _clients[loop] = AsyncClient.from_settings()
+
+    return client
+
+
+async def close_client():
+    """Close the AsyncClient of the current event loop."""
+    client = _clients.pop(asyncio.get_event_loop(), None)
+
+    if client is not None:
+        await client.close()
+
+
+def reset_clients():
+    for loop, client in list(_clients.items()):
+        if loop.is_closed():
+            continue
+
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+        else:
+            loop.run_until_complete(client.close())
+
+    _clients.clear()
+
+
+@receiver(setting_changed)
+def _reset_clients_on_setting_changed(setting, **kwargs):
+    if setting.startswith(upstream.SETTINGS_PREFIX):
+        reset_clients()
+
+
+async def get(endpoint, params):
+    return await get_client().get(endpoint, params)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class ApiConfig(AppConfig):
+    name = "api"
+
+    def ready(self):
+        if settings.FORECAST_PREFETCH_WORKER:
+            from . import prefetch
+            prefetch.start_worker()
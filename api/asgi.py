@@ -0,0 +1,428 @@
+import asyncio
+import datetime
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+from . import aioupstream, budget, coalesce, log, metrics, openweather, \
+    prefetch, serializers, views
+from .log import logger
+
+# the routes served without blocking a thread, all others go to the WSGI
+# application
+ASYNC_ROUTES = frozenset(["weather"])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FORECAST_ASYNC_THREADS
+            )
+
+    return _executor
+
+
+def reset_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+@receiver(setting_changed)
+def _reset_executor_on_setting_changed(setting, **kwargs):
+    if setting == "FORECAST_ASYNC_THREADS":
+        reset_executor()
+
+
+def _call(func, args):
+    # the threads outlive requests, so treat every call like one
+    close_old_connections()
+    return func(*args)
+
+
+async def run_in_thread(func, *args):
+    """Run blocking code - i.e. DB queries - in the thread pool."""
+    return await asyncio.get_event_loop().run_in_executor(
+        get_executor(),
+        _call,
+        func,
+        args
+    )
+
+
+async def query(location):
+    """The async counterpart of openweather.query()."""
+    # may load the city catalog from the DB
+    params = await run_in_thread(openweather.query_params, location)
+
+    start = time.perf_counter()
+
+    try:
+        return openweather.parse_response(
+            await aioupstream.get(openweather.FORECAST_ENDPOINT, params)
+        )
+
+    except Exception as e:
+        metrics.upstream_errors.inc(type(e).__name__)
+        raise
+
+    finally:
+        metrics.upstream_seconds.observe(time.perf_counter() - start)
+
+
+_flights = {}
+
+
+async def refresh_forecasts(location):
+    """The async counterpart of openweather.refresh_forecasts().
+
+    Concurrent refreshes of the same location share one query to the API,
+    the DB lease coordinates them with other processes.
+    """
+    key = openweather.normalize_location(location)
+    flight_key = (asyncio.get_event_loop(), key)
+
+    flight = _flights.get(flight_key)
+
+    if flight is None:
+        flight = _flights[flight_key] = asyncio.ensure_future(
+            _refresh(location, key)
+        )
+        flight.add_done_callback(lambda _: _flights.pop(flight_key, None))
+
+    else:
+        logger.debug("Waiting for fetch of '%s' in progress.", key)
+
+    # a cancelled request must not cancel the fetch others are waiting for
+    await asyncio.shield(flight)
+
+
+async def _refresh(location, key):
+    duration = datetime.timedelta(seconds=settings.FORECAST_FETCH_LEASE)
+
+    token = await run_in_thread(coalesce.acquire_lease, key, duration)
+
+    if token is None:
+        logger.debug("Another process is fetching '%s', waiting.", key)
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + duration.total_seconds()
+
+        while loop.time() < deadline \
+                and await run_in_thread(coalesce.lease_held, key):
+            await asyncio.sleep(coalesce.LEASE_POLL_INTERVAL)
+
+        if await run_in_thread(openweather.known_forecasts, location) \
+                is not None:
+            return
+
+        # the other process failed, so try ourselves
+        await run_in_thread(budget.spend)
+        data = await query(location)
+        await run_in_thread(openweather.ingest_forecasts, location, data)
+        return
+
+    try:
+        await run_in_thread(budget.spend)
+        data = await query(location)
+        await run_in_thread(openweather.ingest_forecasts, location, data)
+
+    finally:
+        await run_in_thread(coalesce.release_lease, key, token)
+
+
+async def search(data_type, location, date, time, temp_scale):
+    """The async counterpart of views.search().
+
+    The forecast is looked up in the thread pool. Only if the API needs to
+    be queried, the lookup is interrupted, the query is awaited and the
+    lookup repeated with the fresh forecasts.
+
+    :return: The rendered response
+    """
+
+    def first_lookup():
+        prefetch.tracker.track(location)
+
+        return views.lookup(
+            data_type,
+            location,
+            date,
+            time,
+            temp_scale,
+            refresh=openweather.require_refresh
+        )
+
+    try:
+        return await run_in_thread(first_lookup)
+
+    except openweather.RefreshRequired:
+        pass
+
+    try:
+        await refresh_forecasts(location)
+
+    except budget.BudgetExhausted:
+        # serve stale forecasts, if there are any
+        return await run_in_thread(
+            views.lookup,
+            data_type,
+            location,
+            date,
+            time,
+            temp_scale,
+            openweather.deny_refresh
+        )
+
+    except Exception as e:
+        metrics.errors.inc(type(e).__name__)
+        return openweather.render(serializers.ErrorSerializer(e).data)
+
+    # the forecasts have just been fetched, don't query the API again
+    return await run_in_thread(
+        views.lookup,
+        data_type,
+        location,
+        date,
+        time,
+        temp_scale,
+        openweather.known_forecasts
+    )
+
+
+def build_environ(scope, body):
+    """Build the WSGI environ of an ASGI HTTP request."""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path,
+        # WSGI wants the bytes of the path as latin-1
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+
+        if name in environ:
+            value = environ[name] + "," + value
+
+        environ[name] = value
+
+    return environ
+
+
+def call_wsgi(application, environ):
+    """Run a WSGI application.
+
+    :return: A tuple (status_code, headers, content)
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+
+    result = application(environ, start_response)
+
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    return response["status"], response["headers"], content
+
+
+class ForecastApplication(object):
+    """An ASGI application serving the ASYNC_ROUTES without blocking a
+    thread while the API is queried.
+
+    All other requests - and requests of browsers, that get the browsable
+    API - are passed on to the WSGI application in the thread pool.
+    """
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+
+        elif scope["type"] == "http":
+            match = self.resolve(scope)
+
+            if match is None:
+                await self.wsgi(scope, receive, send)
+
+            elif match.url_name == "metrics":
+                # rendered right away, a scrape doesn't wait for a thread
+                await self.respond(
+                    send,
+                    200,
+                    [(b"content-type", metrics.CONTENT_TYPE.encode())],
+                    metrics.render()
+                )
+
+            else:
+                start = time.perf_counter()
+                await self.weather(scope, send, **match.kwargs)
+                duration = time.perf_counter() - start
+
+                metrics.request_seconds.observe(duration, match.url_name)
+
+                # the DB queries run in the thread pool, so they aren't
+                # counted here
+                if log.sample_request():
+                    log.log_request(
+                        method=scope["method"],
+                        path=scope["path"],
+                        view=match.url_name,
+                        status=200,
+                        duration_ms=round(duration * 1000, 3)
+                    )
+
+        else:
+            raise ValueError(
+                "Unsupported scope type '{}'.".format(scope["type"])
+            )
+
+    def resolve(self, scope):
+        """Get the ResolverMatch of a request to one of the ASYNC_ROUTES.
+
+        :return: The ResolverMatch or None, if the request is not served
+                 asynchronously
+        """
+        if scope["method"] != "GET":
+            return None
+
+        for name, value in scope.get("headers", []):
+            if name.lower() == b"accept" and b"text/html" in value:
+                return None
+
+        try:
+            match = resolve(scope["path"])
+        except Resolver404:
+            return None
+
+        if match.url_name == "metrics":
+            return match
+
+        if match.url_name not in ASYNC_ROUTES \
+                or match.kwargs["data_type"] not in views.VALID_DATATYPES:
+            return None
+
+        return match
+
+    async def weather(self, scope, send, data_type, location, date, time):
+        query_params = parse_qs(
+            scope.get("query_string", b"").decode("latin-1")
+        )
+
+        content = await search(
+            data_type,
+            location,
+            date,
+            time,
+            query_params.get(
+                views.TEMPERATURE_SCALE_QUERY_PARAM,
+                [views.TEMPERATURE_SCALE_CELSIUS]
+            )[-1]
+        )
+
+        await self.respond(
+            send,
+            200,
+            [
+                (b"content-type", b"application/json"),
+                (b"vary", b"Accept")
+            ],
+            content
+        )
+
+    async def wsgi(self, scope, receive, send):
+        body = []
+
+        while True:
+            message = await receive()
+            body.append(message.get("body", b""))
+
+            if not message.get("more_body"):
+                break
+
+        status, headers, content = await run_in_thread(
+            call_wsgi,
+            self.wsgi_application,
+            build_environ(scope, b"".join(body))
+        )
+
+        await self.respond(send, status, headers, content)
+
+    async def respond(self, send, status, headers, content):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers
+        })
+        await send({
+            "type": "http.response.body",
+            "body": content
+        })
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                await aioupstream.close_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -0,0 +1,178 @@
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+
+from . import metrics, models
+from .log import logger
+
+# requests of users are served first, refreshes in the background only use
+# what's left above OPENWEATHERMAPORG_INTERACTIVE_RESERVE
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+BUCKET_KEY = "openweathermap.org"
+
+
+class BudgetExhausted(Exception):
+
+    def __init__(self, message=None):
+        super().__init__(
+            message or
+            "The budget of calls to openweathermap.org is exhausted, "
+            "please try again later."
+        )
+
+
+class Usage(object):
+    """Counts the calls granted and denied by this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.granted = collections.Counter()
+        self.denied = collections.Counter()
+
+    def record(self, priority, granted):
+        with self.lock:
+            if granted:
+                self.granted[priority] += 1
+            else:
+                self.denied[priority] += 1
+
+    def clear(self):
+        with self.lock:
+            self.granted.clear()
+            self.denied.clear()
+
+    def collect(self):
+        """The counts by (priority, "granted" or "denied")."""
+        with self.lock:
+            counts = {
+                (priority, "granted"): count
+                for priority, count in self.granted.items()
+            }
+            counts.update(
+                ((priority, "denied"), count)
+                for priority, count in self.denied.items()
+            )
+
+        return counts
+
+
+usage = Usage()
+
+metrics.Collector(
+    "openweathermap_budget_calls_total",
+    "Calls to the openweathermap.org API granted and denied by the budget.",
+    "counter",
+    usage.collect,
+    ("priority", "result")
+)
+
+
+def acquire(priority=PRIORITY_INTERACTIVE, key=BUCKET_KEY):
+    """Take a call from the budget shared by all processes.
+
+    :param priority: One of PRIORITIES
+    :param key: The bucket to take the call from
+    :return: False, if the budget is exhausted for now
+    """
+    calls = settings.OPENWEATHERMAPORG_CALLS_PER_MINUTE
+
+    if calls is None:
+        usage.record(priority, True)
+        return True
+
+    # the bucket holds the calls of a minute at most
+    capacity = float(calls)
+    rate = capacity / 60
+
+    needed = 1.0
+
+    if priority != PRIORITY_INTERACTIVE:
+        needed += capacity * settings.OPENWEATHERMAPORG_INTERACTIVE_RESERVE
+
+    now = time.time()
+    refilled = F("tokens") + (now - F("updated_at")) * rate
+
+    # refill the bucket and take a token in a single statement, so
+    # concurrent processes can't take the same one
+    granted = models.CallBucket.objects.filter(
+        key=key,
+        tokens__gte=needed - (now - F("updated_at")) * rate
+    ).update(
+        tokens=Least(refilled, Value(capacity)) - 1,
+        updated_at=now
+    ) > 0
+
+    if not granted and not models.CallBucket.objects.filter(key=key).exists():
+        try:
+            with transaction.atomic():
+                models.CallBucket.objects.create(
+                    key=key,
+                    tokens=capacity - 1,
+                    updated_at=now
+                )
+                granted = True
+
+        except IntegrityError:
+            # created by another process in the meantime
+            return acquire(priority, key)
+
+    usage.record(priority, granted)
+
+    if not granted:
+        logger.warning(
+            "Call budget exhausted, denied a call of priority '%s'.",
+            priority
+        )
+
+    return granted
+
+
+def spend(priority=PRIORITY_INTERACTIVE):
+    """Same as acquire(), but raises BudgetExhausted if there is no call
+    left."""
+    if not acquire(priority):
+        raise BudgetExhausted()
+
+
+def get_usage(key=BUCKET_KEY):
+    """Get the state of the budget.
+
+    :param key: The bucket to look at
+    :return: A dict with the capacity and the calls left of the shared
+             budget as well as the calls granted and denied by this process
+             per priority
+    """
+    calls = settings.OPENWEATHERMAPORG_CALLS_PER_MINUTE
+    tokens = None
+
+    if calls is not None:
+        bucket = models.CallBucket.objects.filter(key=key).first()
+
+        if bucket is None:
+            tokens = float(calls)
+        else:
+            tokens = min(
+                float(calls),
+                bucket.tokens + (time.time() - bucket.updated_at) * calls / 60
+            )
+
+    with usage.lock:
+        return {
+            "capacity": calls,
+            "tokens": tokens,
+            "granted": {
+                priority: usage.granted[priority] for priority in PRIORITIES
+            },
+            "denied": {
+                priority: usage.denied[priority] for priority in PRIORITIES
+            }
+        }
@@ -0,0 +1,329 @@
+import collections
+import datetime
+
+import pytz
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import Max
+
+from . import budget, metrics, models, openweather, upstream
+from .log import logger
+
+# the current weather of up to GROUP_SIZE cities is queried with one call
+GROUP_ENDPOINT = "group"
+GROUP_SIZE = 20
+
+
+class Report(collections.namedtuple(
+        "Report",
+        ("checked", "confirmed", "refreshed", "failed", "skipped", "checks",
+         "fetches"))):
+    """The outcome of refresh(), the number of cities
+
+    - checked: whose current weather has been queried
+    - confirmed: whose forecasts still match their current weather, they
+      are kept as they are and not refreshed
+    - refreshed: whose forecasts have been fetched and stored
+    - failed: whose forecasts could not be fetched
+    - skipped: left for the next cycle, as the budget is exhausted
+
+    and the number of calls to the API, to check the current weather and to
+    fetch forecasts.
+    """
+
+    @property
+    def calls(self):
+        return self.checks + self.fetches
+
+    @property
+    def calls_saved(self):
+        """The fetches the confirmed cities didn't take, less the calls
+        spent on checking - negative, if the checks didn't pay off.
+        Refreshed and failed cities took a call either way."""
+        return self.confirmed - self.checks
+
+
+@metrics.upstream_seconds.time()
+def query_group(refs):
+    """Query the current weather of several cities from the API.
+
+    :param refs: Up to GROUP_SIZE ids of cities of the API
+    :return: A dict with the observed temperature in Celsius per id
+    :raises RuntimeError: If the response reports an error
+    """
+    try:
+        data = openweather.parse_response(upstream.get(
+            GROUP_ENDPOINT,
+            {
+                "APPID": settings.OPENWEATHERMAPORG_API_KEY,
+                "id": ",".join(str(ref) for ref in refs)
+            }
+        ))
+
+    except Exception as e:
+        metrics.upstream_errors.inc(type(e).__name__)
+        raise
+
+    if "list" not in data:
+        raise RuntimeError("Error while querying data, {}.".format(data))
+
+    return {
+        observation["id"]: models.kelvin_to_celsius(
+            observation["main"]["temp"]
+        )
+        for observation in data["list"]
+    }
+
+
+@metrics.upstream_seconds.time()
+def query_forecasts(ref):
+    """Query the forecasts of a city from the API by its id.
+
+    :param ref: The id of the city of the API
+    :return: The decoded response
+    """
+    try:
+        return openweather.parse_response(upstream.get(
+            openweather.FORECAST_ENDPOINT,
+            {
+                "APPID": settings.OPENWEATHERMAPORG_API_KEY,
+                "id": ref
+            }
+        ))
+
+    except Exception as e:
+        metrics.upstream_errors.inc(type(e).__name__)
+        raise
+
+
+def get_confirmed(cities, observed, now, tolerance, max_age):
+    """Find the cities whose forecasts are still good, with two queries for
+    all of them.
+
+    :param cities: The models.City to look at
+    :param observed: A dict with the observed temperature per city ref
+    :param now: The time of the observations
+    :param tolerance: The max. difference of an observed temperature to the
+                      forecast for now, in degrees
+    :param max_age: A timedelta, forecasts fetched before are refreshed no
+                    matter what
+    :return: A set of the ids of the confirmed cities
+    """
+    city_ids = [city.id for city in cities if city.ref in observed]
+
+    if not city_ids:
+        return set()
+
+    # the latest forecast of the slot of now
+    forecasted = dict(
+        models.Forecast.objects
+        .filter(
+            city_id__in=city_ids,
+            timestamp__range=(now - openweather.FORECAST_MAX_AGE, now)
+        )
+        .order_by("timestamp")
+        .values_list("city_id", "temperature")
+    )
+
+    # the last slot tells when the forecasts have been fetched, the API
+    # returns FORECAST_MAX_WINDOW of them
+    last_slots = dict(
+        models.Forecast.objects
+        .filter(city_id__in=city_ids)
+        .order_by()
+        .values("city_id")
+        .annotate(last=Max("timestamp"))
+        .values_list("city_id", "last")
+    )
+
+    fetched_after = now + openweather.FORECAST_MAX_WINDOW - max_age
+
+    return set(
+        city.id
+        for city in cities
+        if city.id in forecasted
+        and last_slots[city.id] >= fetched_after
+        and abs(observed[city.ref] - forecasted[city.id]) <= tolerance
+    )
+
+
+def store(responses, now):
+    """Store the forecasts of several cities with one bulk write.
+
+    :param responses: A list of tuples of the location a city has been
+                      searched for, the models.City and the decoded response
+                      with its forecasts
+    :param now: The time the forecasts have been fetched at
+    :return: The number of cities whose forecasts have been stored
+    """
+    city_forecasts = []
+
+    for location, city, data in responses:
+        city_forecasts.append((
+            location,
+            city,
+            list(openweather.parse_forecasts(data.get("list", ())))
+        ))
+
+    openweather.store_many_forecasts(
+        (city, forecasts) for _, city, forecasts in city_forecasts
+    )
+
+    models.City.objects \
+        .filter(id__in=[city.id for _, city, _ in city_forecasts]) \
+        .update(fetched_at=now)
+
+    for location, city, forecasts in city_forecasts:
+        openweather.refresh_cached_forecasts(city, location, forecasts)
+
+    return len(city_forecasts)
+
+
+def refresh(due, call_budget, now=None):
+    """Refresh the forecasts of known cities with as few calls as possible.
+
+    The current weather of the cities is queried first, GROUP_SIZE cities
+    per call. Cities whose observed temperature is within
+    FORECAST_PREFETCH_GROUP_TOLERANCE degrees of their forecast for now are
+    confirmed - their forecasts are kept without fetching them, the time of
+    the check is recorded as their checked_at. The forecasts of all others
+    are fetched by the ids of their cities and stored together.
+
+    The API is queried concurrently by up to FORECAST_BATCH_WORKERS threads,
+    every call is taken from call_budget and the shared budget. Unlike
+    openweather.refresh_forecasts(), the fetches are not coalesced with
+    those of other processes.
+
+    :param due: A list of tuples of a location and the id of its city, the
+                most important first
+    :param call_budget: The prefetch.CallBudget to take API calls from
+    :param now: The current time, defaults to now
+    :return: A Report
+    """
+    if now is None:
+        now = datetime.datetime.now(tz=pytz.UTC)
+
+    cities = models.City.objects.in_bulk([city_id for _, city_id in due])
+    due = [
+        (location, cities[city_id])
+        for location, city_id in due
+        if city_id in cities
+    ]
+
+    if not due:
+        return Report(0, 0, 0, 0, 0, 0, 0)
+
+    def take_call():
+        return call_budget.acquire() \
+            and budget.acquire(budget.PRIORITY_BACKGROUND)
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(due), settings.FORECAST_BATCH_WORKERS)
+    ) as executor:
+
+        groups = []
+
+        for offset in range(0, len(due), GROUP_SIZE):
+            if not take_call():
+                break
+
+            group = due[offset:offset + GROUP_SIZE]
+            groups.append((
+                group,
+                executor.submit(
+                    query_group,
+                    [city.ref for _, city in group]
+                )
+            ))
+
+        checked = []
+        observed = {}
+
+        for group, future in groups:
+            checked.extend(group)
+
+            try:
+                observed.update(future.result())
+
+            except Exception as e:
+                # the forecasts of the group are fetched instead
+                logger.error("Checking %d cities failed: %s", len(group), e)
+
+        confirmed = get_confirmed(
+            [city for _, city in checked],
+            observed,
+            now,
+            settings.FORECAST_PREFETCH_GROUP_TOLERANCE,
+            datetime.timedelta(
+                seconds=settings.FORECAST_PREFETCH_GROUP_MAX_AGE
+            )
+        )
+
+        fetches = []
+
+        for location, city in checked:
+            if city.id in confirmed:
+                continue
+
+            if not take_call():
+                break
+
+            fetches.append((
+                location,
+                city,
+                executor.submit(query_forecasts, city.ref)
+            ))
+
+        responses = []
+        failed = 0
+
+        for location, city, future in fetches:
+            try:
+                data = future.result()
+
+                if data.get("cod") != "200" \
+                        or data["city"]["id"] != city.ref:
+                    raise RuntimeError(
+                        "Error while querying data, {}.".format(
+                            data.get("message", data.get("cod"))
+                        )
+                    )
+
+                responses.append((location, city, data))
+
+            except Exception as e:
+                logger.error(
+                    "Refreshing forecasts for '%s' failed: %s",
+                    location,
+                    e
+                )
+                failed += 1
+
+    # the forecasts stay as they are, the prefetch picks the cities up
+    # again once they are due by the time of the check
+    if confirmed:
+        models.City.objects \
+            .filter(id__in=confirmed) \
+            .update(checked_at=now)
+
+    refreshed = store(responses, now) if responses else 0
+
+    if settings.FORECAST_SNAPSHOT and refreshed:
+        openweather.request_snapshot()
+
+    report = Report(
+        checked=len(checked),
+        confirmed=len(confirmed),
+        refreshed=refreshed,
+        failed=failed,
+        skipped=len(due) - len(confirmed) - refreshed - failed,
+        checks=len(groups),
+        fetches=len(fetches)
+    )
+
+    for kind in ("confirmed", "refreshed", "failed", "checks", "fetches"):
+        metrics.bulk_refresh.inc(kind, amount=getattr(report, kind))
+
+    return report
@@ -0,0 +1,145 @@
+import threading
+import time
+
+from collections import OrderedDict, defaultdict
+
+
+class ResponseCache(object):
+    """A bounded, thread-safe in-memory cache with LRU eviction and a TTL.
+
+    Every entry belongs to a city, so all entries of a city can be dropped
+    at once when new forecasts for it are stored.
+    """
+
+    def __init__(self, maxsize, ttl):
+        """
+        :param maxsize: The max. number of entries, 0 disables the cache
+        :param ttl: The number of seconds an entry stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_city = defaultdict(set)
+
+        # generation and time of the last invalidation per city, oldest
+        # first, used to refuse entries computed from data that has been
+        # replaced in the meantime - invalidations older than the TTL are
+        # forgotten, values computed before them are refused altogether
+        self.generation = 0
+        self.invalidated = OrderedDict()
+        self.forgotten = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get a cached value.
+
+        :param key: The key of the entry
+        :return: The cached value or None, if there is no valid entry
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, city_id, value = entry
+
+            if expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value, city_id, generation, ttl=None):
+        """Store a value.
+
+        :param key: The key of the entry
+        :param value: The value to cache
+        :param city_id: The id of the city the value was computed for
+        :param generation: The cache's generation at the time the value's
+                           computation started - if the city has been
+                           invalidated since, the value is not stored
+        :param ttl: An optional number of seconds the entry stays valid, if
+                    shorter than the cache's TTL
+        """
+        if not self.maxsize:
+            return
+
+        with self.lock:
+            invalidated, _ = self.invalidated.get(city_id, (-1, None))
+
+            if max(invalidated, self.forgotten) > generation:
+                return
+
+            if key in self.entries:
+                self._remove(key)
+
+            if ttl is None or ttl > self.ttl:
+                ttl = self.ttl
+
+            self.entries[key] = (time.monotonic() + ttl, city_id, value)
+            self.keys_by_city[city_id].add(key)
+
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_city(self, city_id):
+        """Drop all entries of a city."""
+        with self.lock:
+            now = time.monotonic()
+
+            self.generation += 1
+            self.invalidated.pop(city_id, None)
+            self.invalidated[city_id] = (self.generation, now)
+
+            for key in self.keys_by_city.pop(city_id, ()):
+                del self.entries[key]
+
+            while True:
+                generation, invalidated_at = next(
+                    iter(self.invalidated.values())
+                )
+
+                if invalidated_at >= now - self.ttl:
+                    break
+
+                self.invalidated.popitem(last=False)
+                self.forgotten = generation
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.invalidated.clear()
+            self.forgotten = self.generation
+            self.entries.clear()
+            self.keys_by_city.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "invalidated": len(self.invalidated),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _remove(self, key):
+        _, city_id, _ = self.entries.pop(key)
+
+        keys = self.keys_by_city[city_id]
+        keys.discard(key)
+
+        if not keys:
+            del self.keys_by_city[city_id]
@@ -0,0 +1,173 @@
+import gzip
+import itertools
+import json
+import re
+
+from django.db import transaction
+
+from . import locations, models, openweather
+from .log import logger
+
+# fields of a City that are refreshed from the city list
+CITY_UPDATE_FIELDS = ("name", "latitude", "longitude", "country_code")
+
+# stay below SQLite's limit of 999 parameters for the lookup of known refs
+IMPORT_BATCH_SIZE = 500
+
+# anything that separates two cities in the list
+SEPARATORS = re.compile(r"[\s,\[\]]*")
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_city_list(path):
+    """Open a city list as published by openweathermap.org, i.e.
+    city.list.json.gz, gzipped or not.
+
+    :param path: The path of the file
+    :return: A text file object
+    """
+    with open(path, "rb") as f:
+        gzipped = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+    if gzipped:
+        return gzip.open(path, "rt", encoding="utf-8")
+
+    return open(path, encoding="utf-8")
+
+
+def iter_city_list(f, chunk_size=64 * 1024):
+    """Parse a city list incrementally, so only a chunk of the file is held
+    in memory at a time.
+
+    Both the current format - one JSON array of objects - and the older one
+    with a JSON object per line are supported.
+
+    :param f: A text file object
+    :param chunk_size: The number of characters to read at once
+    :return: A generator of the parsed dicts
+    """
+    decoder = json.JSONDecoder()
+
+    buffer = ""
+    position = 0
+    eof = False
+
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+
+        if position < len(buffer):
+            try:
+                city, position = decoder.raw_decode(buffer, position)
+
+            except ValueError:
+                # the city is cut off at the end of the buffer
+                if eof:
+                    raise
+
+            else:
+                yield city
+                continue
+
+        elif eof:
+            return
+
+        # keep the unparsed rest and read on
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def parse_city(city_data):
+    """Turn an entry of the city list into an unsaved City."""
+    return models.City(
+        ref=city_data["id"],
+        name=city_data["name"],
+        latitude=city_data["coord"]["lat"],
+        longitude=city_data["coord"]["lon"],
+        country_code=city_data["country"]
+    )
+
+
+def store_cities(cities):
+    """Insert or update cities by their ref.
+
+    :param cities: A list of unsaved models.City instances
+    :return: A tuple (created, updated) with the number of affected rows
+    """
+    cities = {city.ref: city for city in cities}
+
+    with transaction.atomic():
+
+        existing = models.City.objects.in_bulk(
+            list(cities),
+            field_name="ref"
+        )
+
+        to_create = []
+        to_update = []
+
+        for ref, city in cities.items():
+
+            current = existing.get(ref)
+
+            if current is None:
+                to_create.append(city)
+                continue
+
+            changed = False
+
+            for field in CITY_UPDATE_FIELDS:
+                value = getattr(city, field)
+
+                if getattr(current, field) != value:
+                    setattr(current, field, value)
+                    changed = True
+
+            if changed:
+                to_update.append(current)
+
+        models.City.objects.bulk_create(to_create)
+        openweather.bulk_update(to_update, CITY_UPDATE_FIELDS)
+
+    return len(to_create), len(to_update)
+
+
+def import_cities(city_list, batch_size=IMPORT_BATCH_SIZE):
+    """Load the cities of a city list into the DB, batch by batch.
+
+    :param city_list: An iterable of dicts as found in the city list
+    :param batch_size: The number of cities written at once
+    :return: A tuple (created, updated) with the number of affected rows
+    """
+    created = 0
+    updated = 0
+
+    city_list = iter(city_list)
+
+    while True:
+        batch = [
+            parse_city(city_data)
+            for city_data in itertools.islice(city_list, batch_size)
+        ]
+
+        if not batch:
+            break
+
+        batch_created, batch_updated = store_cities(batch)
+
+        created += batch_created
+        updated += batch_updated
+
+        logger.debug(
+            "Importing cities: %d created, %d updated so far.",
+            created,
+            updated
+        )
+
+    # rebuilt on next use
+    locations.cities.clear()
+    locations.positions.clear()
+
+    return created, updated
@@ -0,0 +1,179 @@
+import datetime
+import threading
+import time
+import uuid
+
+import pytz
+
+from django.db import IntegrityError, transaction
+
+from . import models
+from .log import logger
+
+# how often to check, whether another process finished its fetch
+LEASE_POLL_INTERVAL = 0.1
+
+
+class Flight(object):
+    """A call in progress, concurrent callers wait for its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        """Wait for the outcome of the call.
+
+        :return: The result of the call
+        :raises Exception: The exception raised by the call
+        """
+        self.done.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+class SingleFlight(object):
+    """Make sure a function runs only once at a time per key within this
+    process - concurrent callers for the same key share the result (or the
+    exception) of the call that is already in progress."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def start(self, key):
+        """Register a call for a key, unless one is in progress already.
+
+        :param key: The key identifying the call
+        :return: A tuple of the Flight and whether the caller leads it - the
+                 leader has to finish() it
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+
+            if flight is not None:
+                return flight, False
+
+            flight = self.flights[key] = Flight()
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        """Hand the outcome of a call to the callers waiting for it."""
+        flight.result = result
+        flight.error = error
+
+        with self.lock:
+            del self.flights[key]
+
+        flight.done.set()
+
+    def do(self, key, func):
+        flight, leader = self.start(key)
+
+        if not leader:
+            logger.debug("Waiting for fetch of '%s' in progress.", key)
+            return flight.wait()
+
+        try:
+            result = func()
+
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+
+        self.finish(key, flight, result)
+        return result
+
+
+def acquire_lease(key, duration):
+    """Try to acquire the DB lease for a key.
+
+    :param key: The key to lease
+    :param duration: A timedelta after which the lease is considered
+                     abandoned and can be taken over
+    :return: The token of the lease if it could be acquired or None if
+             another process holds it
+    """
+    now = datetime.datetime.now(tz=pytz.UTC)
+    token = uuid.uuid4().hex
+
+    # take over leases of processes that died while holding them
+    models.FetchLease.objects.filter(key=key, expires_at__lt=now).delete()
+
+    try:
+        with transaction.atomic():
+            models.FetchLease.objects.create(
+                key=key,
+                owner=token,
+                expires_at=now + duration
+            )
+
+    except IntegrityError:
+        return None
+
+    return token
+
+
+def release_lease(key, token):
+    models.FetchLease.objects.filter(key=key, owner=token).delete()
+
+
+def lease_held(key):
+    """Whether a process holds the lease for a key."""
+    return models.FetchLease.objects.filter(
+        key=key,
+        expires_at__gte=datetime.datetime.now(tz=pytz.UTC)
+    ).exists()
+
+
+def wait_for_lease(key, duration):
+    """Wait until the lease for a key is released or has expired."""
+    deadline = time.monotonic() + duration.total_seconds()
+
+    while time.monotonic() < deadline:
+        if not lease_held(key):
+            return
+
+        time.sleep(LEASE_POLL_INTERVAL)
+
+
+def single_flight(flights, key, func, fallback, duration):
+    """Run func at most once at a time per key - across threads via the
+    given SingleFlight and across processes via a lease in the DB.
+
+    :param flights: The SingleFlight used to coalesce calls within this
+                    process
+    :param key: The key identifying the work, i.e. the normalized location
+    :param func: The callable doing the actual work
+    :param fallback: A callable returning the result of the work done by
+                     another process, or None if there is none
+    :param duration: A timedelta for how long the DB lease is held at most
+    :return: The return value of func or fallback
+    """
+
+    def leader():
+        token = acquire_lease(key, duration)
+
+        if token is None:
+            logger.debug("Another process is fetching '%s', waiting.", key)
+
+            wait_for_lease(key, duration)
+
+            result = fallback()
+
+            if result is not None:
+                return result
+
+            # the other process failed, so try ourselves
+            return func()
+
+        try:
+            return func()
+        finally:
+            release_lease(key, token)
+
+    return flights.do(key, leader)
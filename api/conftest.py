@@ -0,0 +1,95 @@
+import datetime
+
+import pytest
+import pytz
+
+from django.urls import reverse
+
+from . import locations, models, openweather, upstream
+from .testdata import load_payload
+from .testdata.server import StubServer
+
+
+@pytest.fixture
+def now_slot():
+    """The start of the current 3 hour forecast slot."""
+    now = datetime.datetime.now(tz=pytz.UTC)
+    return now.replace(
+        hour=now.hour - now.hour % 3,
+        minute=0,
+        second=0,
+        microsecond=0
+    )
+
+
+@pytest.fixture
+def payload(now_slot):
+    """A recorded forecast response, starting with the next slot."""
+    return load_payload(start=now_slot + openweather.FORECAST_MAX_AGE)
+
+
+@pytest.fixture
+def upstream_calls(monkeypatch, payload):
+    """Replace the openweathermap.org API with the recorded payload and
+    keep track of the queried locations."""
+    calls = []
+
+    def fake_query(location, *args, **kwargs):
+        calls.append(location)
+        return payload
+
+    monkeypatch.setattr(openweather, "query", fake_query)
+
+    return calls
+
+
+@pytest.fixture
+def stub_server(settings):
+    """A local stub of the openweathermap.org API the client talks to."""
+    server = StubServer().start()
+
+    settings.OPENWEATHERMAPORG_API_URL = server.url
+    settings.OPENWEATHERMAPORG_RETRY_BACKOFF = 0
+
+    yield server
+
+    upstream.reset_client()
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    openweather.response_cache.clear()
+    openweather.get_forecast_cache().clear()
+    locations.aliases.clear()
+    locations.cities.clear()
+    locations.positions.clear()
+    models.Condition.objects.clear_cache()
+    yield
+    openweather.response_cache.clear()
+    openweather.get_forecast_cache().clear()
+    locations.aliases.clear()
+    locations.cities.clear()
+    locations.positions.clear()
+    models.Condition.objects.clear_cache()
+
+
+@pytest.fixture
+def weather_url(now_slot):
+    """Build the URL of the weather endpoint for a slot after now_slot."""
+
+    def build(data_type="summary", location="Berlin,DE", slots=1,
+              name="weather"):
+        timestamp = now_slot + slots * openweather.FORECAST_MAX_AGE
+
+        return reverse(
+            name,
+            kwargs={
+                "data_type": data_type,
+                "location": location,
+                "date": timestamp.date(),
+                "time": timestamp.time()
+            }
+        )
+
+    return build
@@ -0,0 +1,49 @@
+import math
+
+from . import models
+
+# optional, converts long columns in one go instead of value by value
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# columns shorter than that are converted value by value, even with numpy -
+# creating the arrays would take longer than the loop
+NUMPY_MIN_SIZE = 64
+
+
+def ceil_temperatures(values, unit):
+    """Convert a column of temperatures and round them up, the same as
+    models.Forecast.get_temperature() does for one forecast at a time.
+
+    :param values: A sequence of temperatures in Celsius
+    :param unit: One of models.Forecast.SUPPORTED_TEMPERATURE_UNITS, a falsy
+                 value stands for Celsius
+    :return: A list of ints
+    :raises ValueError: If the unit is not supported
+    """
+    fahrenheit = unit == models.UNIT_FAHRENHEIT
+
+    if not fahrenheit and unit and unit != models.UNIT_CELSIUS:
+        raise ValueError(
+            "Unit {} is not supported, please use any of {}".format(
+                unit,
+                models.Forecast.SUPPORTED_TEMPERATURE_UNITS
+            )
+        )
+
+    if numpy is not None and len(values) >= NUMPY_MIN_SIZE:
+        column = numpy.fromiter(values, dtype=numpy.float64, count=len(values))
+
+        # the operations of models.celsius_to_fahrenheit() in the same order,
+        # so every value is rounded the same
+        if fahrenheit:
+            column = column * 9 / 5 + 32
+
+        return numpy.ceil(column).astype(numpy.int64).tolist()
+
+    if fahrenheit:
+        return list(map(math.ceil, map(models.celsius_to_fahrenheit, values)))
+
+    return list(map(math.ceil, values))
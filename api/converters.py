@@ -45,3 +45,52 @@ class TimeConverter:
                  TimeConverter.FORMAT
         """
         return value.strftime(self.FORMAT)
+
+
+class DateTimeConverter:
+    regex = '[0-9]{12}'
+    FORMAT = "%Y%m%d%H%M"
+
+    def to_python(self, value):
+        """Convert a given URL value to a proper python datetime object.
+
+        :param value: A datetime string in the format YYYYMMDDHHMM
+        :return: A naive datetime instance representing the supplied value
+        """
+        return datetime.datetime.strptime(value, self.FORMAT)
+
+    def to_url(self, value):
+        """Convert a given datetime value to URL representation.
+
+        :param value: A datetime instance
+        :return: A string representation in the format
+                 DateTimeConverter.FORMAT
+        """
+        return value.strftime(self.FORMAT)
+
+
+class CoordinatesConverter:
+    regex = r'-?[0-9]{1,2}(?:\.[0-9]+)?,-?[0-9]{1,3}(?:\.[0-9]+)?'
+
+    def to_python(self, value):
+        """Convert a given URL value to a tuple of coordinates.
+
+        :param value: A string in the format <latitude>,<longitude>, i.e.
+                      52.52,13.41
+        :return: A tuple (latitude, longitude) of floats
+        """
+        latitude, longitude = (float(part) for part in value.split(","))
+
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Coordinates out of range: {}".format(value))
+
+        return latitude, longitude
+
+    def to_url(self, value):
+        """Convert given coordinates to URL representation.
+
+        :param value: A tuple (latitude, longitude)
+        :return: A string representation in the format
+                 <latitude>,<longitude>
+        """
+        return "{},{}".format(*value)
@@ -0,0 +1,160 @@
+import codecs
+import json
+import re
+
+# the whitespace JSON allows between tokens
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# what may follow a value in an object or array
+DELIMITERS = frozenset(" \t\n\r,:]}")
+
+# drop the parsed part of the buffer once it's that long
+COMPACT_THRESHOLD = 64 * 1024
+
+
+class ObjectStream(object):
+    """Parses a JSON object while its text is read, yielding the items of
+    one of its arrays one at a time - the whole object is never held in
+    memory, only the item at hand and the text not parsed yet.
+
+    All other members of the object are decoded as a whole and collected in
+    ``fields``, those following the array only once it has been iterated.
+    """
+
+    def __init__(self, chunks, key):
+        """
+        :param chunks: An iterable of the UTF-8 encoded text in chunks, i.e.
+                       the iter_content() of a streamed requests.Response
+        :param key: The name of the array to iterate
+        """
+        self.chunks = iter(chunks)
+        self.key = key
+        self.fields = {}
+
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+        self.started = False
+
+    def __iter__(self):
+        if self.started:
+            raise RuntimeError("The stream can only be iterated once.")
+
+        self.started = True
+
+        self.expect("{")
+
+        if self.peek() == "}":
+            self.position += 1
+            return
+
+        while True:
+            name = self.value()
+
+            if not isinstance(name, str):
+                raise self.error("Expecting a property name")
+
+            self.expect(":")
+
+            if name == self.key and self.peek() == "[":
+                self.position += 1
+
+                if self.peek() == "]":
+                    self.position += 1
+                else:
+                    while True:
+                        yield self.value()
+
+                        if self.next_token(",]") == "]":
+                            break
+
+            else:
+                self.fields[name] = self.value()
+
+            if self.next_token(",}") == "}":
+                return
+
+    def read(self):
+        """Append the next chunk to the buffer.
+
+        :return: False, if there are no chunks left
+        """
+        if self.exhausted:
+            return False
+
+        # forget what has been parsed already
+        if self.position > COMPACT_THRESHOLD:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.exhausted = True
+            self.buffer += self.text_decoder.decode(b"", final=True)
+            return False
+
+        self.buffer += self.text_decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """Skip whitespace and get the next character, without consuming
+        it."""
+        while True:
+            self.position = WHITESPACE.match(
+                self.buffer,
+                self.position
+            ).end()
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.read():
+                raise self.error("Unexpected end of data")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error("Expecting '{}'".format(char))
+
+        self.position += 1
+
+    def next_token(self, chars):
+        char = self.peek()
+
+        if char not in chars:
+            raise self.error("Expecting one of '{}'".format(chars))
+
+        self.position += 1
+        return char
+
+    def value(self):
+        """Decode the value starting at the current position."""
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer,
+                    self.position
+                )
+
+            except json.JSONDecodeError:
+                # the value might continue in the next chunk
+                if self.read():
+                    continue
+                raise
+
+            # a number at the end of the buffer might continue as well, i.e.
+            # "-2" of "-2.5e3"
+            if (end == len(self.buffer)
+                    or self.buffer[end] not in DELIMITERS) and self.read():
+                continue
+
+            self.position = end
+            return value
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.buffer, self.position)
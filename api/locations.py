@@ -0,0 +1,297 @@
+import math
+import threading
+import unicodedata
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import models, spatial
+
+# country codes people use, that aren't the ISO 3166 ones the API knows
+COUNTRY_CODE_ALIASES = {
+    "uk": "gb",
+}
+
+# locations of the form "id:2950159" refer to a city by its id at
+# openweathermap.org, i.e. the nearest city of a position
+CITY_ID_PREFIX = "id:"
+
+# cities added since the k-d tree was built are searched one by one, until
+# there are that many of them
+POSITION_INDEX_MAX_PENDING = 256
+
+
+def normalize_location(location):
+    """Bring a location into the canonical form it is stored and looked up
+    in, so i.e. "Berlin,DE", "berlin,de" and " Berlin , DE " share one
+    CitySearchResult.
+
+    :param location: The location as searched for
+    :return: The NFKC normalized, case folded location with single spaces
+             and without blanks around the commas
+    """
+    location = unicodedata.normalize("NFKC", location).casefold()
+
+    parts = [" ".join(part.split()) for part in location.split(",")]
+    parts = [part for part in parts if part]
+
+    if len(parts) > 1:
+        parts[-1] = COUNTRY_CODE_ALIASES.get(parts[-1], parts[-1])
+
+    return ",".join(parts)
+
+
+def city_location(ref):
+    """The location referring to a city by its id at openweathermap.org."""
+    return "{}{}".format(CITY_ID_PREFIX, ref)
+
+
+class AliasIndex(object):
+    """An in-memory map of the (normalized) locations searched for to the ids
+    of their cities, so resolving a known location needs no DB query.
+
+    The map is loaded from the DB on first use, locations searched for by
+    other processes in the meantime are looked up in the DB once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.city_ids = None
+
+    def load(self):
+        city_ids = dict(
+            models.CitySearchResult.objects.values_list("search", "city_id")
+        )
+
+        with self.lock:
+            self.city_ids = city_ids
+
+        return city_ids
+
+    def get_many(self, locations, query=True):
+        """Resolve locations to the ids of their cities.
+
+        :param locations: An iterable of normalized locations
+        :param query: Whether to look the locations unknown to this process
+                      up in the DB
+        :return: A dict with the city id of each known location
+        """
+        city_ids = self.city_ids
+
+        if city_ids is None:
+            city_ids = self.load()
+
+        found = {}
+        missing = []
+
+        for location in locations:
+            city_id = city_ids.get(location)
+
+            if city_id is None:
+                missing.append(location)
+            else:
+                found[location] = city_id
+
+        if missing and query:
+            for location, city_id in models.CitySearchResult.objects \
+                    .filter(search__in=missing) \
+                    .values_list("search", "city_id"):
+                self.add(location, city_id)
+                found[location] = city_id
+
+        return found
+
+    def get(self, location, query=True):
+        """Resolve a location to the id of its city.
+
+        :param location: A normalized location
+        :param query: See get_many()
+        :return: The id of the city or None, if the location is unknown
+        """
+        return self.get_many([location], query).get(location)
+
+    def add(self, location, city_id):
+        with self.lock:
+            if self.city_ids is not None:
+                self.city_ids[location] = city_id
+
+    def discard(self, location):
+        with self.lock:
+            if self.city_ids is not None:
+                self.city_ids.pop(location, None)
+
+    def clear(self):
+        with self.lock:
+            self.city_ids = None
+
+
+class CityIndex(object):
+    """An in-memory index of all known cities by "name,country code", so a
+    location can be resolved to the id of its city at openweathermap.org
+    without asking the API - see the import_cities management command.
+
+    Names shared by several cities of a country are left out, those are up
+    to the API to resolve. The index is built on first use.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refs = None
+        self.ambiguous = set()
+
+    def load(self):
+        refs = {}
+        ambiguous = set()
+
+        for name, country_code, ref in models.City.objects \
+                .filter(ref__isnull=False) \
+                .values_list("name", "country_code", "ref") \
+                .iterator():
+
+            location = normalize_location("{},{}".format(name, country_code))
+
+            if refs.setdefault(location, ref) != ref:
+                ambiguous.add(location)
+
+        for location in ambiguous:
+            del refs[location]
+
+        with self.lock:
+            self.refs = refs
+            self.ambiguous = ambiguous
+
+        return refs
+
+    def add(self, city):
+        location = normalize_location(
+            "{},{}".format(city.name, city.country_code)
+        )
+
+        with self.lock:
+            if self.refs is None or location in self.ambiguous:
+                return
+
+            if self.refs.setdefault(location, city.ref) != city.ref:
+                del self.refs[location]
+                self.ambiguous.add(location)
+
+    def get(self, location):
+        """Get the openweathermap.org city id of a location.
+
+        :param location: A normalized location
+        :return: The id or None, if the location isn't unambiguously known
+        """
+        if location.startswith(CITY_ID_PREFIX):
+            try:
+                return int(location[len(CITY_ID_PREFIX):])
+            except ValueError:
+                return None
+
+        refs = self.refs
+
+        if refs is None:
+            refs = self.load()
+
+        return refs.get(location)
+
+    def clear(self):
+        with self.lock:
+            self.refs = None
+            self.ambiguous = set()
+
+
+class PositionIndex(object):
+    """An in-memory k-d tree of the positions of all known cities, to find
+    the city nearest to a position without a DB query.
+
+    The tree is built on first use. Cities created later on are kept aside
+    and searched one by one, until there are POSITION_INDEX_MAX_PENDING of
+    them and the tree is rebuilt.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tree = None
+        self.pending = None
+
+    def load(self):
+        tree = spatial.build_tree([
+            spatial.to_vector(latitude, longitude) + (ref,)
+            for latitude, longitude, ref in models.City.objects
+            .filter(ref__isnull=False)
+            .values_list("latitude", "longitude", "ref")
+            .iterator()
+        ])
+
+        pending = []
+
+        with self.lock:
+            self.tree = tree
+            self.pending = pending
+
+        return tree, pending
+
+    def add(self, city):
+        with self.lock:
+            if self.pending is None or city.ref is None:
+                return
+
+            self.pending.append(
+                spatial.to_vector(city.latitude, city.longitude) + (city.ref,)
+            )
+
+            if len(self.pending) >= POSITION_INDEX_MAX_PENDING:
+                self.tree = None
+                self.pending = None
+
+    def nearest(self, latitude, longitude):
+        """Find the city nearest to a position.
+
+        :param latitude: The latitude in degrees
+        :param longitude: The longitude in degrees
+        :return: A tuple (ref, distance in km) of the city or (None, None),
+                 if there are no cities
+        """
+        with self.lock:
+            tree, pending = self.tree, self.pending
+
+        if pending is None:
+            tree, pending = self.load()
+
+        vector = spatial.to_vector(latitude, longitude)
+
+        point, distance = spatial.nearest(tree, vector)
+
+        for other in list(pending):
+            other_distance = math.sqrt(
+                sum((a - b) ** 2 for a, b in zip(other, vector))
+            )
+
+            if other_distance < distance:
+                point, distance = other, other_distance
+
+        if point is None:
+            return None, None
+
+        return point[3], spatial.chord_to_km(distance)
+
+    def clear(self):
+        with self.lock:
+            self.tree = None
+            self.pending = None
+
+
+aliases = AliasIndex()
+cities = CityIndex()
+positions = PositionIndex()
+
+
+@receiver(post_delete, sender=models.CitySearchResult)
+def _discard_deleted_alias(instance, **kwargs):
+    aliases.discard(instance.search)
+
+
+@receiver(post_delete, sender=models.City)
+def _forget_deleted_city(**kwargs):
+    cities.clear()
+    positions.clear()
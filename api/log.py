@@ -1,15 +1,34 @@
+import json
 import logging
-import sys
+import random
+
+from django.conf import settings
 
 LOGGER_NAME = "openweathermap_rest.api"
+REQUEST_LOGGER_NAME = LOGGER_NAME + ".requests"
 
+# handlers and levels are configured by LOGGING in the settings
 logger = logging.getLogger(LOGGER_NAME)
-# logger.setLevel(logging.DEBUG)
-
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+request_logger = logging.getLogger(REQUEST_LOGGER_NAME)
+
+
+def sample_request():
+    """Decide whether to log a request, see FORECAST_REQUEST_LOG_SAMPLE_RATE.
+
+    :return: True, if the request should be logged
+    """
+    rate = settings.FORECAST_REQUEST_LOG_SAMPLE_RATE
+
+    return rate > 0 \
+        and (rate >= 1 or random.random() < rate) \
+        and request_logger.isEnabledFor(logging.INFO)
+
+
+def log_request(**fields):
+    """Log a structured record of a request as a line of JSON, the fields
+    are available to handlers as the record's "request" attribute, too."""
+    request_logger.info(
+        "%s",
+        json.dumps(fields, sort_keys=True, default=str),
+        extra={"request": fields}
+    )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import budget
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the calls to the openweathermap.org API left in the budget "
+        "shared by all processes."
+    )
+
+    def handle(self, *args, **options):
+        usage = budget.get_usage()
+
+        if usage["capacity"] is None:
+            self.stdout.write("The calls to the API are not limited.")
+            return
+
+        self.stdout.write(
+            "{:.1f} of {} calls per minute left.".format(
+                usage["tokens"],
+                usage["capacity"]
+            )
+        )
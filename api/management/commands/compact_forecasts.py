@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import openweather, retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove old forecasts, optionally keeping daily aggregates of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=settings.FORECAST_RETENTION_MAX_AGE,
+            help="Remove forecasts older than that many seconds."
+        )
+        parser.add_argument(
+            "--max-per-city",
+            type=int,
+            default=settings.FORECAST_RETENTION_MAX_PER_CITY,
+            help="Keep no more than the newest that many forecasts per city."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.FORECAST_RETENTION_BATCH_SIZE,
+            help="The max. number of rows deleted per transaction."
+        )
+        parser.add_argument(
+            "--archive",
+            action="store_true",
+            default=settings.FORECAST_RETENTION_ARCHIVE,
+            help="Keep the removed forecasts as daily aggregates."
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_false",
+            dest="archive",
+            help="Don't keep the removed forecasts, even if "
+                 "FORECAST_RETENTION_ARCHIVE is set."
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and compact every --interval seconds."
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.FORECAST_RETENTION_INTERVAL,
+            help="The number of seconds between two runs."
+        )
+
+    def handle(self, *args, **options):
+
+        while True:
+            start = time.perf_counter()
+
+            removed = retention.compact(
+                max_age=options["max_age"],
+                max_per_city=options["max_per_city"],
+                batch_size=options["batch_size"],
+                archive=options["archive"]
+            )
+
+            self.stdout.write(
+                "{} forecasts removed in {:.1f}s.".format(
+                    removed,
+                    time.perf_counter() - start
+                )
+            )
+
+            if not options["loop"]:
+                # the snapshot is rebuilt in the background
+                openweather.snapshot_writer.flush()
+                break
+
+            time.sleep(options["interval"])
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the city list of openweathermap.org, i.e. city.list.json.gz "
+        "from http://bulk.openweathermap.org/sample/, so locations can be "
+        "resolved to cities without asking the API. Running processes pick "
+        "up the cities after a restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="The city list, either gzipped or plain JSON."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=catalog.IMPORT_BATCH_SIZE,
+            help="The number of cities written at once."
+        )
+
+    def handle(self, *args, **options):
+        with catalog.open_city_list(options["path"]) as f:
+            created, updated = catalog.import_cities(
+                catalog.iter_city_list(f),
+                batch_size=options["batch_size"]
+            )
+
+        self.stdout.write(
+            "{} cities created, {} updated.".format(created, updated)
+        )
@@ -0,0 +1,108 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import openweather, prefetch
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the forecasts of the most requested locations before they "
+        "expire."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=settings.FORECAST_PREFETCH_TOP,
+            help="The max. number of locations to keep fresh."
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=settings.FORECAST_PREFETCH_BUDGET,
+            help="The max. number of API calls per minute."
+        )
+        parser.add_argument(
+            "--lead",
+            type=int,
+            default=settings.FORECAST_PREFETCH_LEAD,
+            help="Refresh forecasts that many seconds before they expire."
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            default=settings.FORECAST_PREFETCH_BULK,
+            help="Check the current weather of the cities first and only "
+                 "fetch the forecasts that are off."
+        )
+        parser.add_argument(
+            "--no-bulk",
+            action="store_false",
+            dest="bulk",
+            help="Refresh one location at a time, even if "
+                 "FORECAST_PREFETCH_BULK is set."
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and refresh every --interval seconds."
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.FORECAST_PREFETCH_INTERVAL,
+            help="The number of seconds between two refresh cycles."
+        )
+
+    def handle(self, *args, **options):
+        budget = prefetch.CallBudget(options["budget"])
+        lead = datetime.timedelta(seconds=options["lead"])
+
+        while True:
+            if options["bulk"]:
+                report = prefetch.prefetch_bulk(
+                    budget,
+                    top=options["top"],
+                    lead=lead
+                )
+
+                self.stdout.write(
+                    "{} checked, {} confirmed, {} refreshed, {} failed, "
+                    "{} skipped, {} calls ({} checks), {} calls "
+                    "saved.".format(
+                        report.checked,
+                        report.confirmed,
+                        report.refreshed,
+                        report.failed,
+                        report.skipped,
+                        report.calls,
+                        report.checks,
+                        report.calls_saved
+                    )
+                )
+
+            else:
+                refreshed, failed, skipped = prefetch.prefetch(
+                    budget,
+                    top=options["top"],
+                    lead=lead
+                )
+
+                self.stdout.write(
+                    "{} refreshed, {} failed, {} skipped.".format(
+                        refreshed,
+                        failed,
+                        skipped
+                    )
+                )
+
+            if not options["loop"]:
+                # the snapshot is rebuilt in the background
+                openweather.snapshot_writer.flush()
+                break
+
+            time.sleep(options["interval"])
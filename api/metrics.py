@@ -0,0 +1,310 @@
+import bisect
+import functools
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# in seconds, from a cached lookup to a slow call to the API
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0
+)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+enabled = settings.FORECAST_METRICS
+
+
+@receiver(setting_changed)
+def _toggle_on_setting_changed(setting, value, **kwargs):
+    global enabled
+
+    if setting == "FORECAST_METRICS":
+        enabled = value
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ""
+
+    return "{{{}}}".format(",".join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"')
+        )
+        for name, value in pairs
+    ))
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value))
+
+
+class Registry(object):
+    """All metrics of this process, in the order they are rendered."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+        return metric
+
+    def render(self):
+        """Render all metrics in the Prometheus text format.
+
+        Every metric is copied under its own lock, so the requests updating
+        it are blocked only for the time of that copy.
+
+        :return: The text as bytes
+        """
+        with self.lock:
+            metrics = list(self.metrics)
+
+        lines = []
+
+        for metric in metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type))
+            lines.extend(metric.render())
+
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+registry = Registry()
+
+
+class Counter(object):
+    """A value that only goes up, optionally per set of labels."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+
+        self.lock = threading.Lock()
+        self.values = {}
+
+        registry.register(self)
+
+    def inc(self, *labelvalues, amount=1):
+        if not enabled:
+            return
+
+        with self.lock:
+            self.values[labelvalues] = \
+                self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self.values.get(labelvalues, 0)
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+
+        return [
+            "{}{} {}".format(
+                self.name,
+                format_labels(self.labelnames, labelvalues),
+                format_value(value)
+            )
+            for labelvalues, value in values
+        ]
+
+
+class Histogram(object):
+    """Counts observations in buckets, i.e. durations."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+
+        self.lock = threading.Lock()
+        # per set of labels: a list of the (non-cumulative) count per
+        # bucket, followed by the count of values above the last bucket
+        # and the sum of all values
+        self.values = {}
+
+        registry.register(self)
+
+    def observe(self, value, *labelvalues):
+        if not enabled:
+            return
+
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            counts = self.values.get(labelvalues)
+
+            if counts is None:
+                counts = self.values[labelvalues] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *labelvalues):
+        """Decorate a function to observe the duration of its calls."""
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not enabled:
+                    return func(*args, **kwargs)
+
+                start = time.perf_counter()
+
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *labelvalues)
+
+            return wrapper
+
+        return decorator
+
+    def get_count(self, *labelvalues):
+        counts = self.values.get(labelvalues)
+        return sum(counts[:-1]) if counts else 0
+
+    def render(self):
+        with self.lock:
+            values = sorted(
+                (labelvalues, list(counts))
+                for labelvalues, counts in self.values.items()
+            )
+
+        lines = []
+
+        for labelvalues, counts in values:
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+
+                lines.append("{}_bucket{} {}".format(
+                    self.name,
+                    format_labels(
+                        self.labelnames,
+                        labelvalues,
+                        [("le", format_value(bound))]
+                    ),
+                    cumulative
+                ))
+
+            labels = format_labels(self.labelnames, labelvalues)
+
+            lines.append("{}_sum{} {}".format(
+                self.name,
+                labels,
+                format_value(counts[-1])
+            ))
+            lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+
+        return lines
+
+
+class Collector(object):
+    """Values that are kept elsewhere - i.e. the stats of a cache - and
+    only collected when the metrics are rendered."""
+
+    def __init__(self, name, help, type, collect, labelnames=()):
+        """
+        :param collect: A callable returning a dict of the values by tuples
+                        of label values
+        """
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = labelnames
+        self.collect = collect
+
+        registry.register(self)
+
+    def render(self):
+        return [
+            "{}{} {}".format(
+                self.name,
+                format_labels(self.labelnames, labelvalues),
+                format_value(value)
+            )
+            for labelvalues, value in sorted(self.collect().items())
+        ]
+
+
+def render():
+    return registry.render()
+
+
+upstream_seconds = Histogram(
+    "openweathermap_upstream_request_seconds",
+    "Duration of queries to the openweathermap.org API, incl. retries."
+)
+
+upstream_errors = Counter(
+    "openweathermap_upstream_errors_total",
+    "Failed queries to the openweathermap.org API by error type.",
+    ("type",)
+)
+
+bulk_refresh = Counter(
+    "forecast_bulk_refresh_total",
+    "Cities confirmed, refreshed or failed and calls to the "
+    "openweathermap.org API made by bulk refreshes, to check the current "
+    "weather and to fetch forecasts.",
+    ("kind",)
+)
+
+stage_seconds = Histogram(
+    "forecast_stage_seconds",
+    "Duration of the stages of answering a request.",
+    labelnames=("stage",)
+)
+
+forecast_cache_requests = Counter(
+    "forecast_cache_requests_total",
+    "Lookups in the shared forecast cache by result.",
+    ("result",)
+)
+
+errors = Counter(
+    "forecast_errors_total",
+    "Errors reported to clients by type.",
+    ("type",)
+)
+
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Duration of requests by view.",
+    labelnames=("view",)
+)
+
+request_queries = Histogram(
+    "http_request_db_queries",
+    "Number of DB queries per request by view.",
+    buckets=QUERY_COUNT_BUCKETS,
+    labelnames=("view",)
+)
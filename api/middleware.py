@@ -0,0 +1,51 @@
+import time
+
+from django.db import connection
+
+from . import log, metrics
+
+
+class InstrumentationMiddleware(object):
+    """Observes the duration and the number of DB queries of each request,
+    labelled with the name of the view, and logs a sample of the requests
+    as structured records."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = log.sample_request()
+
+        if not (metrics.enabled or sampled):
+            return self.get_response(request)
+
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "other"
+
+        metrics.request_seconds.observe(duration, view)
+        metrics.request_queries.observe(queries[0], view)
+
+        if sampled:
+            log.log_request(
+                method=request.method,
+                path=request.path,
+                view=view,
+                status=response.status_code,
+                duration_ms=round(duration * 1000, 3),
+                db_queries=queries[0]
+            )
+
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 2.0.7 on 2026-10-18 13:39
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_forecasts(apps, schema_editor):
+    # keep the most recently added forecast of each city and slot
+    Forecast = apps.get_model('api', 'Forecast')
+
+    duplicates = Forecast.objects \
+        .values('city', 'timestamp') \
+        .annotate(count=Count('id'), latest=Max('id')) \
+        .filter(count__gt=1)
+
+    for duplicate in duplicates:
+        Forecast.objects \
+            .filter(city=duplicate['city'], timestamp=duplicate['timestamp']) \
+            .exclude(id=duplicate['latest']) \
+            .delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_fetchlease'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_forecasts,
+            migrations.RunPython.noop
+        ),
+        migrations.AlterUniqueTogether(
+            name='forecast',
+            unique_together={('city', 'timestamp')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.0.7 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_forecast_city_timestamp_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='fetched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='citysearchresult',
+            name='last_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='citysearchresult',
+            name='request_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 2.0.7 on 2026-10-18 14:20
+
+import unicodedata
+
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def normalize_location(location):
+    # a copy of api.locations.normalize_location at the time of writing
+    location = unicodedata.normalize('NFKC', location).casefold()
+
+    parts = [' '.join(part.split()) for part in location.split(',')]
+    parts = [part for part in parts if part]
+
+    if len(parts) > 1:
+        parts[-1] = {'uk': 'gb'}.get(parts[-1], parts[-1])
+
+    return ','.join(parts)
+
+
+def fold_searches(apps, schema_editor):
+    # keep the most requested spelling of each location - and its city - and
+    # add up the requests of all of them
+    CitySearchResult = apps.get_model('api', 'CitySearchResult')
+
+    spellings = defaultdict(list)
+
+    for search in CitySearchResult.objects.order_by('id').iterator():
+        spellings[normalize_location(search.search)].append(search)
+
+    for location, searches in spellings.items():
+
+        if len(searches) == 1 and searches[0].search == location:
+            continue
+
+        kept = max(searches, key=lambda search: search.request_count)
+
+        CitySearchResult.objects \
+            .filter(id__in=[search.id for search in searches]) \
+            .exclude(id=kept.id) \
+            .delete()
+
+        requested_at = [
+            search.last_requested_at
+            for search in searches
+            if search.last_requested_at
+        ]
+
+        kept.search = location
+        kept.request_count = sum(search.request_count for search in searches)
+        kept.last_requested_at = max(requested_at) if requested_at else None
+        kept.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_request_tracking'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fold_searches,
+            migrations.RunPython.noop
+        ),
+    ]
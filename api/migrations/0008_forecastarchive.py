@@ -0,0 +1,32 @@
+# Generated by Django 2.0.13 on 2026-10-18 14:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_callbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('samples', models.PositiveIntegerField()),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('temperature_sum', models.FloatField()),
+                ('pressure_sum', models.FloatField()),
+                ('humidity_sum', models.FloatField()),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_forecasts', to='api.City')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='forecastarchive',
+            unique_together={('city', 'date')},
+        ),
+    ]
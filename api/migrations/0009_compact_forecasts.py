@@ -0,0 +1,272 @@
+# Generated by Django 2.0.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery
+from django.db.models.functions import Cast
+import django.db.models.deletion
+
+import api.models
+
+# the scale of the fixed-point columns, see api.models.FixedPointField
+SCALES = {
+    'temperature': 100,
+    'pressure': 100,
+    'humidity': 10,
+}
+
+
+class ToEpoch(Func):
+    """The seconds since the epoch of a UTC datetime column."""
+
+    output_field = models.IntegerField()
+
+    def as_sqlite(self, compiler, connection):
+        return self.as_sql(
+            compiler,
+            connection,
+            template='CAST(ROUND((julianday(%(expressions)s) - 2440587.5) '
+                     '* 86400) AS integer)'
+        )
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(
+            compiler,
+            connection,
+            template='CAST(EXTRACT(EPOCH FROM %(expressions)s) AS integer)'
+        )
+
+    def as_mysql(self, compiler, connection):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', "
+                     "%(expressions)s)"
+        )
+
+
+class FromEpoch(Func):
+    """The UTC datetime of seconds since the epoch."""
+
+    output_field = models.DateTimeField()
+
+    def as_sqlite(self, compiler, connection):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="datetime(%(expressions)s, 'unixepoch')"
+        )
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(
+            compiler,
+            connection,
+            template='TO_TIMESTAMP(%(expressions)s)'
+        )
+
+    def as_mysql(self, compiler, connection):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="TIMESTAMPADD(SECOND, %(expressions)s, "
+                     "'1970-01-01 00:00:00')"
+        )
+
+
+def compact_forecasts(apps, schema_editor):
+    # copy the forecasts into the new columns: the timestamp as seconds since
+    # the epoch, the measurements as fixed-point integers and the description
+    # as a reference to its condition - one UPDATE for all rows
+    Condition = apps.get_model('api', 'Condition')
+    Forecast = apps.get_model('api', 'Forecast')
+
+    Condition.objects.bulk_create(
+        Condition(description=description)
+        for description in Forecast.objects
+        .order_by()
+        .values_list('description', flat=True)
+        .distinct()
+    )
+
+    Forecast.objects.update(
+        condition=Subquery(
+            Condition.objects
+            .filter(description=OuterRef('description'))
+            .values('id')[:1]
+        ),
+        epoch=ToEpoch(F('timestamp')),
+        **{
+            '{}_fixed'.format(field): Cast(
+                Func(F(field) * scale, function='ROUND'),
+                models.IntegerField()
+            )
+            for field, scale in SCALES.items()
+        }
+    )
+
+
+def expand_forecasts(apps, schema_editor):
+    Condition = apps.get_model('api', 'Condition')
+    Forecast = apps.get_model('api', 'Forecast')
+
+    Forecast.objects.update(
+        description=Subquery(
+            Condition.objects
+            .filter(id=OuterRef('condition_id'))
+            .values('description')[:1]
+        ),
+        timestamp=FromEpoch(F('epoch')),
+        **{
+            field: Cast(
+                '{}_fixed'.format(field),
+                models.FloatField()
+            ) / float(scale)
+            for field, scale in SCALES.items()
+        }
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_forecastarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Condition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=256, unique=True)),
+            ],
+        ),
+
+        # the new columns, until the forecasts are copied
+        migrations.AddField(
+            model_name='forecast',
+            name='condition',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='forecasts', to='api.Condition'),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='epoch',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='temperature_fixed',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='pressure_fixed',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='humidity_fixed',
+            field=models.IntegerField(null=True),
+        ),
+
+        # the old columns, nullable so they can be restored when reverted
+        migrations.AlterField(
+            model_name='forecast',
+            name='timestamp',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='description',
+            field=models.CharField(max_length=256, null=True),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='temperature',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='pressure',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='humidity',
+            field=models.FloatField(null=True),
+        ),
+
+        migrations.RunPython(compact_forecasts, expand_forecasts),
+
+        migrations.AlterUniqueTogether(
+            name='forecast',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='forecast',
+            name='timestamp',
+        ),
+        migrations.RemoveField(
+            model_name='forecast',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='forecast',
+            name='temperature',
+        ),
+        migrations.RemoveField(
+            model_name='forecast',
+            name='pressure',
+        ),
+        migrations.RemoveField(
+            model_name='forecast',
+            name='humidity',
+        ),
+        migrations.RenameField(
+            model_name='forecast',
+            old_name='epoch',
+            new_name='timestamp',
+        ),
+        migrations.RenameField(
+            model_name='forecast',
+            old_name='temperature_fixed',
+            new_name='temperature',
+        ),
+        migrations.RenameField(
+            model_name='forecast',
+            old_name='pressure_fixed',
+            new_name='pressure',
+        ),
+        migrations.RenameField(
+            model_name='forecast',
+            old_name='humidity_fixed',
+            new_name='humidity',
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='condition',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='forecasts', to='api.Condition'),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='timestamp',
+            field=api.models.EpochField(),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='temperature',
+            field=api.models.FixedPointField(decimal_places=2),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='pressure',
+            field=api.models.FixedPointField(decimal_places=2),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='humidity',
+            field=api.models.FixedPointField(decimal_places=1),
+        ),
+        migrations.AlterUniqueTogether(
+            name='forecast',
+            unique_together={('city', 'timestamp')},
+        ),
+    ]
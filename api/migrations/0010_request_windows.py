@@ -0,0 +1,28 @@
+# Generated by Django 2.0.13 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_compact_forecasts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citysearchresult',
+            name='previous_window_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='citysearchresult',
+            name='window',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='citysearchresult',
+            name='window_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
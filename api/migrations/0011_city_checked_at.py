@@ -0,0 +1,18 @@
+# Generated by Django 2.0.13 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_request_windows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,11 @@
+import datetime
 import math
+import threading
 
-from django.db import models
+import pytz
+
+from django import forms
+from django.db import IntegrityError, models, transaction
 
 KELVIN_CELSIUS_OFFSET = -273.15
 UNIT_CELSIUS = "℃"
@@ -19,6 +24,76 @@ def celsius_to_fahrenheit(value):
     return value * 9 / 5 + 32
 
 
+class EpochField(models.IntegerField):
+    """An aware datetime, stored as the whole seconds since the epoch."""
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, datetime.datetime):
+            return value
+
+        return datetime.datetime.fromtimestamp(int(value), tz=pytz.UTC)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+
+        if isinstance(value, datetime.datetime):
+            return int(value.timestamp())
+
+        return int(value)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**dict(
+            {"form_class": forms.DateTimeField},
+            **kwargs
+        ))
+
+
+class FixedPointField(models.IntegerField):
+    """A float, stored as an integer of its value times 10^decimal_places."""
+
+    def __init__(self, *args, decimal_places=2, **kwargs):
+        self.decimal_places = decimal_places
+        self.scale = 10 ** decimal_places
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["decimal_places"] = self.decimal_places
+        return name, path, args, kwargs
+
+    def quantize(self, value):
+        """Round a value to what will be stored of it."""
+        return round(float(value), self.decimal_places)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+
+        return value / self.scale
+
+    def to_python(self, value):
+        if value is None:
+            return None
+
+        return float(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+
+        return int(round(float(value) * self.scale))
+
+    def formfield(self, **kwargs):
+        return super().formfield(**dict(
+            {"form_class": forms.FloatField},
+            **kwargs
+        ))
+
+
 class City(models.Model):
 
     ref = models.IntegerField(null=True, blank=True, unique=True)
@@ -27,6 +102,13 @@ class City(models.Model):
     longitude = models.FloatField()
     country_code = models.CharField(max_length=2)
 
+    # when we last stored forecasts for the city
+    fetched_at = models.DateTimeField(null=True, blank=True)
+
+    # when a bulk refresh last found its forecasts to still match the
+    # current weather, without fetching them - see api.bulk
+    checked_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return u"{}, {}".format(
             self.name,
@@ -49,6 +131,110 @@ class CitySearchResult(models.Model):
         related_name="searches"
     )
 
+    # how often and when this location has been requested, used to decide
+    # which forecasts are worth refreshing in the background
+    request_count = models.PositiveIntegerField(default=0)
+    last_requested_at = models.DateTimeField(null=True, blank=True)
+
+    # the requests within the FORECAST_PREFETCH_WINDOW numbered window and
+    # the one before, so locations are ranked by how busy they are now
+    window = models.PositiveIntegerField(default=0)
+    window_count = models.PositiveIntegerField(default=0)
+    previous_window_count = models.PositiveIntegerField(default=0)
+
+
+class ConditionManager(models.Manager):
+    """Resolves the descriptions of forecasts to the ids of their
+    conditions. There are only a few of them and they never change, so the
+    ids are kept in memory once known."""
+
+    def __init__(self):
+        super().__init__()
+
+        self.lock = threading.Lock()
+        self.ids = {}
+
+    def get_ids(self, descriptions):
+        """Get the ids of the conditions of descriptions, creating the
+        missing ones.
+
+        :param descriptions: An iterable of descriptions
+        :return: A dict with the id of each description
+        """
+        descriptions = set(descriptions)
+
+        with self.lock:
+            ids = {
+                description: self.ids[description]
+                for description in descriptions
+                if description in self.ids
+            }
+
+        missing = descriptions.difference(ids)
+
+        if missing:
+            ids.update(
+                self.filter(description__in=missing)
+                .values_list("description", "id")
+            )
+
+            for description in missing.difference(ids):
+                # another process might create it at the same time
+                try:
+                    with transaction.atomic():
+                        ids[description] = self.create(
+                            description=description
+                        ).id
+
+                except IntegrityError:
+                    ids[description] = self.get(description=description).id
+
+            with self.lock:
+                self.ids.update(ids)
+
+        return ids
+
+    def assign(self, forecasts):
+        """Set the condition of forecasts created with a description."""
+        forecasts = [
+            forecast
+            for forecast in forecasts
+            if forecast.condition_id is None
+            and forecast._description is not None
+        ]
+
+        if not forecasts:
+            return
+
+        ids = self.get_ids(forecast._description for forecast in forecasts)
+
+        for forecast in forecasts:
+            forecast.condition_id = ids[forecast._description]
+
+    def clear_cache(self):
+        with self.lock:
+            self.ids.clear()
+
+
+class Condition(models.Model):
+    """The description of the weather of forecasts, i.e. "light rain" -
+    stored once and referred to by all forecasts sharing it."""
+
+    description = models.CharField(max_length=256, unique=True)
+
+    objects = ConditionManager()
+
+    def __str__(self):
+        return self.description
+
+
+class ForecastManager(models.Manager):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        Condition.objects.assign(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Forecast(models.Model):
 
@@ -63,18 +249,53 @@ class Forecast(models.Model):
         related_name="forecasts"
     )
 
-    timestamp = models.DateTimeField()
-    description = models.CharField(max_length=256)
+    # the columns are kept small, there are many forecasts: the timestamp
+    # as seconds since the epoch, the measurements as fixed-point integers
+    # and the description as a reference to its condition
+    timestamp = EpochField()
+
+    condition = models.ForeignKey(
+        "Condition",
+        on_delete=models.PROTECT,
+        related_name="forecasts",
+        # conditions are never deleted, so there's no need to look up their
+        # forecasts
+        db_index=False
+    )
+
+    # in Celsius, the precision allows for a proper conversion to Fahrenheit
+    temperature = FixedPointField(decimal_places=2)
+
+    pressure = FixedPointField(decimal_places=2)
+    humidity = FixedPointField(decimal_places=1)
+
+    objects = ForecastManager()
+
+    # set on forecasts created with a description, until they are saved
+    _description = None
+
+    class Meta:
+        # there is only one forecast per city and slot - the unique index
+        # also serves the lookups of a city's forecasts by time
+        unique_together = (
+            ("city", "timestamp"),
+        )
+
+    @property
+    def description(self):
+        if self._description is not None:
+            return self._description
 
-    # we will store in Celsius, but with full float precision to allow for
-    # proper conversion to Farenheit, if needed - we can pre-calculate
-    # Fahrenheit and stored it as well, but for now, runtime is not that much
-    # of a concern and we don't wan't to bloat the DB with redundant data if
-    # not really needed.
-    temperature = models.FloatField()
+        return self.condition.description
 
-    pressure = models.FloatField()
-    humidity = models.FloatField()
+    @description.setter
+    def description(self, value):
+        self._description = value
+        self.condition_id = None
+
+    def save(self, *args, **kwargs):
+        Condition.objects.assign([self])
+        super().save(*args, **kwargs)
 
     def get_temperature(self, unit):
 
@@ -92,3 +313,53 @@ class Forecast(models.Model):
             )
 
         return math.ceil(value)
+
+
+class FetchLease(models.Model):
+    """Marks a fetch from the openweathermap.org API in progress, so other
+    processes wait for its result instead of fetching the same data."""
+
+    key = models.CharField(max_length=128, unique=True)
+    owner = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()
+
+
+class CallBucket(models.Model):
+    """The token bucket limiting the calls to the openweathermap.org API of
+    all processes sharing the DB, see api.budget."""
+
+    key = models.CharField(max_length=64, unique=True)
+    tokens = models.FloatField()
+
+    # seconds since the epoch, so the refill can be calculated in SQL
+    updated_at = models.FloatField()
+
+
+class ForecastArchive(models.Model):
+    """The forecasts of a city and day removed by the retention, downsampled
+    to their extremes and sums - see api.retention. Sums rather than means
+    are kept, so the forecasts of a day can be archived in several runs."""
+
+    city = models.ForeignKey(
+        "City",
+        on_delete=models.CASCADE,
+        related_name="archived_forecasts"
+    )
+
+    date = models.DateField()
+    samples = models.PositiveIntegerField()
+
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_sum = models.FloatField()
+    pressure_sum = models.FloatField()
+    humidity_sum = models.FloatField()
+
+    class Meta:
+        unique_together = (
+            ("city", "date"),
+        )
+
+    def get_mean(self, field):
+        """The mean of "temperature", "pressure" or "humidity" of the day."""
+        return getattr(self, "{}_sum".format(field)) / self.samples
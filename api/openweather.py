@@ -1,11 +1,22 @@
-import requests
+import bisect
+import collections
 import datetime
+import hashlib
+import logging
 import pytz
-import traceback
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
 
-from . import models
+from . import budget, cache, coalesce, conversions, jsonstream, locations, \
+    metrics, models, renderers, snapshot, upstream
+from .locations import normalize_location
 from .log import logger
 
 # forecasts are valid for 3 hours
@@ -16,134 +27,878 @@ FORECAST_MAX_WINDOW = datetime.timedelta(days=5)
 
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-API_URL = (
-    "http://api.openweathermap.org/data/2.5/forecast"
-    "?q={{query}}&APPID={api_key}".format(
-        api_key=settings.OPENWEATHERMAPORG_API_KEY
-    )
+FORECAST_ENDPOINT = "forecast"
+
+# the bytes read at once from a streamed response of the API
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# the data types of serialize_forecast_rows(), None stands for all values
+PRERENDERED_DATA_TYPES = (None, "temperature", "pressure", "humidity")
+
+# the rendered responses of the weather endpoints - they are only valid as
+# long as the forecasts they are based on
+response_cache = cache.ResponseCache(
+    maxsize=settings.FORECAST_RESPONSE_CACHE_SIZE,
+    ttl=FORECAST_MAX_AGE.total_seconds()
 )
 
+metrics.Collector(
+    "forecast_response_cache_requests_total",
+    "Lookups in the response cache of this process by result.",
+    "counter",
+    lambda: {
+        ("hit",): response_cache.hits,
+        ("miss",): response_cache.misses
+    },
+    ("result",)
+)
 
-def query(location):
-    url = API_URL.format(query=location)
-    result = requests.get(url)
+metrics.Collector(
+    "forecast_response_cache_evictions_total",
+    "Entries of the response cache of this process dropped to make room - "
+    "raise FORECAST_RESPONSE_CACHE_SIZE, if they keep going up.",
+    "counter",
+    lambda: {(): response_cache.evictions}
+)
 
-    logger.debug("{} --> {}".format(url, result.text))
 
-    # TODO: handle non 200 HTTP codes
-    return result.json()
+@metrics.upstream_seconds.time()
+def query(location, stream=False):
+    """Query the forecasts of a location from the API.
 
+    :param location: The location as searched for
+    :param stream: Whether to parse the body while it's read - only the
+                   time until the headers have been read is measured then
+    :return: The decoded response or a ForecastStream of it
+    """
+    try:
+        response = upstream.get(
+            FORECAST_ENDPOINT,
+            query_params(location),
+            stream
+        )
 
-def add_forecasts(location):
-    data = query(location)
+        if stream:
+            logger.debug("%s --> streamed", response.url)
+            return ForecastStream(response)
 
-    # check the response
-    if data["cod"] == "200":
+        return parse_response(response)
+
+    except Exception as e:
+        metrics.upstream_errors.inc(type(e).__name__)
+        raise
+
+
+def query_params(location):
+    location = normalize_location(location)
+
+    params = {
+        "APPID": settings.OPENWEATHERMAPORG_API_KEY
+    }
+
+    # query known cities by their id, so the API doesn't need to guess
+    ref = locations.cities.get(location)
+
+    if ref is None:
+        params["q"] = location
+    else:
+        params["id"] = ref
+
+    return params
+
+
+def parse_response(response):
+    # decoding the body just to log it is expensive
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s --> %s", response.url, response.text)
+
+    # the API reports errors like unknown locations as JSON as well, so
+    # those are left to the caller - anything else is unusable
+    try:
+        return response.json()
+    except ValueError:
+        raise upstream.UpstreamError(
+            "Invalid response from the openweathermap.org API "
+            "(HTTP {}).".format(response.status_code)
+        )
 
-        city_data = data["city"]
 
+class ForecastStream(jsonstream.ObjectStream):
+    """A response of the API, yielding the entries of its "list" while it's
+    read. The other members of the response are in ``fields``, once the
+    entries have been iterated."""
+
+    def __init__(self, response):
+        super().__init__(
+            upstream.iter_content(response, STREAM_CHUNK_SIZE),
+            "list"
+        )
+
+        self.status_code = response.status_code
+
+    def __iter__(self):
         try:
-            city = models.City.objects.get(ref=city_data["id"])
+            yield from super().__iter__()
 
-        except models.City.DoesNotExist:
+        except ValueError:
+            metrics.upstream_errors.inc(upstream.UpstreamError.__name__)
 
-            city = models.City(
-                ref=city_data["id"],
-                name=city_data["name"],
-                latitude=city_data["coord"]["lat"],
-                longitude=city_data["coord"]["lon"],
-                country_code=city_data["country"]
+            raise upstream.UpstreamError(
+                "Invalid response from the openweathermap.org API "
+                "(HTTP {}).".format(self.status_code)
             )
 
-            city.save()
+        except upstream.UpstreamError as e:
+            metrics.upstream_errors.inc(type(e).__name__)
+            raise
+
+
+# fields that get refreshed, if we already know a forecast slot
+FORECAST_UPDATE_FIELDS = (
+    "condition_id",
+    "temperature",
+    "pressure",
+    "humidity"
+)
+
+# keep (fields * 2 + 1) * batch size below SQLite's limit of 999 parameters
+BULK_UPDATE_BATCH_SIZE = 100
+
+# the forecasts of a response are written in batches of that many
+INGEST_BATCH_SIZE = 100
+
+
+def parse_forecast(forecast_data):
+    """Turn a single entry of the upstream "list" into an unsaved Forecast.
+
+    :param forecast_data: A dict as found in the "list" of the upstream
+                          forecast response
+    :return: A models.Forecast instance without a city
+    :raises ValueError: If the entry's timestamp can not be parsed
+    """
+    timestamp = pytz.UTC.localize(
+        datetime.datetime.strptime(
+            forecast_data["dt_txt"],
+            DATETIME_FORMAT
+        )
+    )
+
+    # round the measurements to the precision they are stored with, so
+    # forecasts served before and after they are stored are the same
+    fields = models.Forecast._meta
+
+    return models.Forecast(
+        timestamp=timestamp,
+        description=", ".join(
+            [
+                condition["description"]
+                for condition in forecast_data["weather"]
+            ]
+        ),
+        temperature=fields.get_field("temperature").quantize(
+            models.kelvin_to_celsius(forecast_data["main"]["temp"])
+        ),
+        pressure=fields.get_field("pressure").quantize(
+            forecast_data["main"]["pressure"]
+        ),
+        humidity=fields.get_field("humidity").quantize(
+            forecast_data["main"]["humidity"]
+        )
+    )
+
+
+def parse_forecasts(entries):
+    """Parse the entries of the upstream "list", skipping invalid ones.
+
+    :param entries: An iterable of the entries
+    :return: A generator of unsaved models.Forecast instances
+    """
+    for forecast_data in entries:
 
         try:
-            search_result = models.CitySearchResult.objects.get(
-                search=location,
-                city=city
+            yield parse_forecast(forecast_data)
+
+        except ValueError:
+            logger.exception("Skipping an invalid forecast slot.")
+
+
+def bulk_update(objs, fields, batch_size=BULK_UPDATE_BATCH_SIZE):
+    """Write the given fields of already saved objects with one UPDATE
+    statement per batch instead of one per object.
+
+    :param objs: A list of saved model instances of the same model
+    :param fields: The names of the fields to write
+    :param batch_size: The max. number of objects per UPDATE statement
+    :return: The number of updated rows
+    """
+    if not objs:
+        return 0
+
+    model = type(objs[0])
+    updated = 0
+
+    for offset in range(0, len(objs), batch_size):
+        batch = objs[offset:offset + batch_size]
+
+        updates = {}
+
+        for field in fields:
+            output_field = model._meta.get_field(field)
+
+            updates[field] = Case(
+                *[
+                    When(
+                        pk=obj.pk,
+                        then=Value(
+                            getattr(obj, field),
+                            output_field=output_field
+                        )
+                    )
+                    for obj in batch
+                ],
+                output_field=output_field
             )
 
-        except models.CitySearchResult.DoesNotExist:
+        updated += model.objects \
+            .filter(pk__in=[obj.pk for obj in batch]) \
+            .update(**updates)
+
+    return updated
+
+
+def store_forecasts(city, forecasts):
+    """Insert or update the forecasts of a city in one go.
+
+    Existing forecasts for the covered time window are loaded with a single
+    query, new slots are written with one bulk INSERT and known slots with
+    batched UPDATEs, all within one transaction.
+
+    :param city: The models.City the forecasts belong to
+    :param forecasts: An iterable of unsaved models.Forecast instances
+    :return: A tuple (created, updated) with the number of affected rows
+    """
+    return store_many_forecasts([(city, forecasts)])
+
+
+def store_many_forecasts(city_forecasts):
+    """Same as store_forecasts(), for the forecasts of several cities - they
+    are written with the same statements and in one transaction.
 
-            search_result = models.CitySearchResult(
-                search=location,
-                city=city
+    :param city_forecasts: An iterable of tuples of a models.City and an
+                           iterable of its unsaved models.Forecast instances
+    :return: A tuple (created, updated) with the number of affected rows
+    """
+
+    # there can only be one forecast per city and slot, so if the upstream
+    # reports a slot more than once, the last one wins
+    forecasts = {
+        (city.id, forecast.timestamp): (city, forecast)
+        for city, city_forecasts in city_forecasts
+        for forecast in city_forecasts
+    }
+
+    if not forecasts:
+        return 0, 0
+
+    timestamps = [timestamp for _, timestamp in forecasts]
+
+    with transaction.atomic():
+
+        models.Condition.objects.assign(
+            forecast for _, forecast in forecasts.values()
+        )
+
+        existing = {
+            (forecast.city_id, forecast.timestamp): forecast
+            for forecast in models.Forecast.objects.filter(
+                city_id__in=set(city_id for city_id, _ in forecasts),
+                timestamp__range=(min(timestamps), max(timestamps))
             )
+        }
 
-            search_result.save()
+        to_create = []
+        to_update = []
 
-        for forecast_data in data["list"]:
+        for key, (city, forecast) in forecasts.items():
 
-            try:
+            current = existing.get(key)
 
-                # We might have a previous forecast, so make sure, we
-                # don't produce duplicates. Technically this should
-                # NOT happen, but just to be save.
+            if current is None:
+                forecast.city = city
+                to_create.append(forecast)
+                continue
 
-                timestamp = pytz.UTC.localize(
-                    datetime.datetime.strptime(
-                        forecast_data["dt_txt"],
-                        DATETIME_FORMAT
-                    )
-                )
+            changed = False
 
-                logger.debug("Adding forecast for '{}' @ {}".format(
-                    location,
-                    timestamp
-                ))
+            for name in FORECAST_UPDATE_FIELDS:
+                field = models.Forecast._meta.get_field(name)
+                value = getattr(forecast, name)
 
-                try:
-                    forecast = models.Forecast.objects.get(
-                        city=city,
-                        timestamp=timestamp
-                    )
+                # compare what is stored, not the floats
+                if field.get_prep_value(getattr(current, name)) != \
+                        field.get_prep_value(value):
+                    setattr(current, name, value)
+                    changed = True
 
-                    forecast.temperature = models.kelvin_to_celsius(
-                        forecast_data["main"]["temp"]
-                    )
-                    forecast.pressure = forecast_data["main"]["pressure"]
-                    forecast.humidity = forecast_data["main"]["humidity"]
-
-                except models.Forecast.DoesNotExist:
-
-                    forecast = models.Forecast(
-                        city=city,
-                        timestamp=timestamp,
-                        description=", ".join(
-                            [
-                                condition["description"]
-                                for condition in forecast_data["weather"]
-                            ]
-                        ),
-                        temperature=models.kelvin_to_celsius(
-                            forecast_data["main"]["temp"]
-                        ),
-                        pressure=forecast_data["main"]["pressure"],
-                        humidity=forecast_data["main"]["humidity"]
-                    )
+            if changed:
+                to_update.append(current)
+
+        models.Forecast.objects.bulk_create(to_create)
+        bulk_update(to_update, FORECAST_UPDATE_FIELDS)
+
+    return len(to_create), len(to_update)
+
+
+def add_forecasts(location, priority=budget.PRIORITY_INTERACTIVE):
+    budget.spend(priority)
+    return ingest_forecasts(location, query(location, stream=True))
+
+
+def read_forecasts(entries):
+    """Parse the entries of a response while it's read.
+
+    The forecasts are kept as tuples instead of models.Forecast instances,
+    which take several times their memory, and the descriptions - there
+    are only a few distinct ones - are interned.
+
+    :param entries: An iterable of the entries of the upstream "list"
+    :return: A list of tuples (timestamp, description, temperature,
+             pressure, humidity)
+    """
+    return [
+        (
+            forecast.timestamp,
+            sys.intern(forecast.description),
+            forecast.temperature,
+            forecast.pressure,
+            forecast.humidity
+        )
+        for forecast in parse_forecasts(entries)
+    ]
+
+
+def build_forecasts(rows):
+    """Turn tuples of read_forecasts() into unsaved models.Forecast
+    instances."""
+    return [
+        models.Forecast(
+            timestamp=timestamp,
+            description=description,
+            temperature=temperature,
+            pressure=pressure,
+            humidity=humidity
+        )
+        for timestamp, description, temperature, pressure, humidity in rows
+    ]
+
+
+def write_forecasts(location, rows, city_data):
+    """The writes of ingest_forecasts(), to be run in a transaction.
+
+    :param location: The location the API has been queried for
+    :param rows: The forecasts as returned by read_forecasts()
+    :param city_data: The "city" of the response
+    :return: A tuple of the models.City, whether it has been created, the
+             models.CitySearchResult and the number of created and updated
+             forecasts
+    """
+    city, city_created = models.City.objects.get_or_create(
+        ref=city_data["id"],
+        defaults={
+            "name": city_data["name"],
+            "latitude": city_data["coord"]["lat"],
+            "longitude": city_data["coord"]["lon"],
+            "country_code": city_data["country"]
+        }
+    )
+
+    search, _ = models.CitySearchResult.objects.get_or_create(
+        search=normalize_location(location),
+        defaults={
+            "city": city
+        }
+    )
+
+    created = updated = 0
+
+    for offset in range(0, len(rows), INGEST_BATCH_SIZE):
+        batch_created, batch_updated = store_forecasts(
+            city,
+            build_forecasts(rows[offset:offset + INGEST_BATCH_SIZE])
+        )
+
+        created += batch_created
+        updated += batch_updated
+
+    city.fetched_at = datetime.datetime.now(tz=pytz.UTC)
+    city.save(update_fields=["fetched_at"])
 
-                forecast.save()
+    return city, city_created, search, created, updated
 
-            except ValueError:
-                logger.error(traceback.format_exc())
 
-        return city.forecasts
+@metrics.stage_seconds.time("ingest")
+def ingest_forecasts(location, data):
+    """Store the forecasts of an API response.
 
+    The response is parsed while it's read, before any write: the
+    forecasts are kept compactly (see read_forecasts()), so a streamed
+    response is never held in memory, and the transaction is only opened
+    once it has been read completely and checked. They are written in
+    batches of INGEST_BATCH_SIZE.
+
+    :param location: The location the API has been queried for
+    :param data: The decoded response of the API or a ForecastStream of it
+    :return: The forecasts of the matching city
+    :raises RuntimeError: If the response reports an error
+    """
+    if isinstance(data, dict):
+        entries, fields = data.get("list", ()), data
     else:
+        # the fields are complete, once the entries have been iterated
+        entries, fields = data, data.fields
+
+    rows = read_forecasts(entries)
+
+    # check the response
+    if fields.get("cod") != "200":
         # sth. went wrong
         raise RuntimeError("Error while querying data, {}.".format(
-            data
+            fields
         ))
 
+    try:
+        with transaction.atomic():
+            city, city_created, search, created, updated = write_forecasts(
+                location,
+                rows,
+                fields["city"]
+            )
+
+    except Exception:
+        # conditions created by the rolled back writes are gone again
+        models.Condition.objects.clear_cache()
+        raise
+
+    locations.aliases.add(search.search, search.city_id)
+
+    if city_created:
+        locations.cities.add(city)
+        locations.positions.add(city)
+
+    # the forecasts are committed now, their cache entries are refreshed
+    # batch by batch
+    for offset in range(0, len(rows), INGEST_BATCH_SIZE):
+        forecasts = build_forecasts(rows[offset:offset + INGEST_BATCH_SIZE])
+
+        for forecast in forecasts:
+            forecast.city = city
+
+        refresh_cached_forecasts(city, location, forecasts)
+
+    if settings.FORECAST_SNAPSHOT:
+        request_snapshot()
+
+    logger.debug(
+        "Stored forecasts for '%s': %d created, %d updated.",
+        location,
+        created,
+        updated
+    )
+
+    return city.forecasts
+
+
+def refresh_cached_forecasts(city, location, forecasts):
+    """Drop what the caches hold for stored forecasts - and, with
+    FORECAST_PRERENDER, render their responses.
+
+    :param city: The models.City the forecasts belong to
+    :param location: The location that has just been searched for
+    :param forecasts: The stored models.Forecast instances
+    """
+    response_cache.invalidate_city(city.id)
+    invalidate_cached_forecasts(city, location, forecasts)
+
+    if settings.FORECAST_PRERENDER:
+        prerender_forecasts(city, forecasts)
+
+
+@metrics.stage_seconds.time("snapshot")
+def write_snapshot():
+    """Rebuild the snapshot of the current forecasts, see api.snapshot."""
+    count = snapshot.write(
+        settings.FORECAST_SNAPSHOT_PATH,
+        datetime.datetime.now(tz=pytz.UTC) - FORECAST_MAX_AGE
+    )
+
+    if count is not None:
+        logger.debug("Wrote a snapshot of %d forecasts.", count)
+
+
+snapshot_writer = snapshot.Writer(write_snapshot)
+
+
+def request_snapshot():
+    """Have the snapshot rebuilt after forecasts have been stored or removed
+    - by the snapshot_writer in the background, unless FORECAST_SNAPSHOT_DELAY
+    is None."""
+    delay = settings.FORECAST_SNAPSHOT_DELAY
+
+    if delay is None:
+        write_snapshot()
+    else:
+        snapshot_writer.request(delay)
+
+
+def get_snapshot_forecast(location, timestamp, auto_update, now):
+    """Look a forecast up in the snapshot, without a DB query.
+
+    Only forecasts get_forecast() would serve as fresh are taken from the
+    snapshot, all others take the way through the DB.
+
+    :param location: The location as searched for
+    :param timestamp: An aware datetime
+    :param auto_update: As passed to get_forecast()
+    :param now: The current time
+    :return: A models.Forecast with its max_age or None
+    """
+    current = snapshot.get(settings.FORECAST_SNAPSHOT_PATH)
+
+    if current is None:
+        return None
+
+    location = normalize_location(location)
+    city_id = current.searches.get(location)
+
+    if city_id is None:
+        city_id = locations.aliases.get(location, query=False)
+
+    if city_id is None:
+        return None
+
+    found = current.find(city_id, timestamp, FORECAST_MAX_AGE.total_seconds())
+
+    if found is None:
+        return None
+
+    forecast, fetched_at = found
+    max_age = FORECAST_MAX_AGE
+
+    if auto_update and timestamp > now \
+            and settings.FORECAST_STALE_WHILE_REVALIDATE:
+
+        stale_after = datetime.timedelta(
+            seconds=settings.FORECAST_STALE_AFTER
+        )
+
+        if fetched_at is None or now - fetched_at > stale_after:
+            return None
+
+        max_age = min(max_age, stale_after - (now - fetched_at))
+
+    forecast.max_age = max_age.total_seconds()
+
+    return forecast
+
+
+_flights = coalesce.SingleFlight()
+
+
+def get_slot(timestamp):
+    """Get the index of the 3 hour forecast slot a timestamp falls into.
+
+    :param timestamp: An aware datetime
+    :return: The number of whole FORECAST_MAX_AGE periods since the epoch
+    """
+    return int(timestamp.timestamp() // FORECAST_MAX_AGE.total_seconds())
+
+
+def get_forecast_cache():
+    return caches[settings.FORECAST_CACHE_ALIAS]
+
+
+def forecast_cache_key(location, slot):
+    """Get the key of a forecast lookup in the shared forecast cache.
+
+    :param location: The location as searched for
+    :param slot: The forecast slot of the lookup, see get_slot()
+    :return: A key that is safe to use with any cache backend
+    """
+    return "forecast:{}:{}".format(
+        hashlib.md5(
+            normalize_location(location).encode("utf-8")
+        ).hexdigest(),
+        slot
+    )
+
+
+def invalidate_cached_forecasts(city, location, forecasts):
+    """Drop the cached lookups of all slots of the given forecasts, for all
+    locations that are known to resolve to the city.
+
+    :param city: The models.City the forecasts belong to
+    :param location: The location that has just been searched for
+    :param forecasts: The stored models.Forecast instances
+    """
+    searches = set(
+        city.searches.values_list("search", flat=True)
+    )
+    searches.add(location)
+
+    slots = set(get_slot(forecast.timestamp) for forecast in forecasts)
+
+    get_forecast_cache().delete_many([
+        forecast_cache_key(search, slot)
+        for search in searches
+        for slot in slots
+    ])
+
+
+def prerendered_cache_key(city_id, slot, data_type, temperature_unit):
+    """Get the key of a rendered response in the shared forecast cache.
+
+    :param city_id: The id of the models.City
+    :param slot: The forecast slot, see get_slot()
+    :param data_type: One of PRERENDERED_DATA_TYPES
+    :param temperature_unit: One of models.Forecast.SUPPORTED_TEMPERATURE_UNITS
+    :return: A key that is safe to use with any cache backend
+    """
+    return "rendered:{}:{}:{}:{}".format(
+        city_id,
+        slot,
+        data_type or "summary",
+        temperature_unit
+    )
+
+
+@metrics.stage_seconds.time("prerender")
+def prerender_forecasts(city, forecasts):
+    """Render the responses to all requests for the given forecasts and put
+    them into the shared forecast cache, so requests of any process are
+    answered without a DB query.
+
+    Only forecasts starting their slot are rendered, those are the ones all
+    timestamps of the slot resolve to - requests for other slots take the
+    usual way.
+
+    :param city: The models.City the forecasts belong to
+    :param forecasts: The stored models.Forecast instances
+    """
+    period = FORECAST_MAX_AGE.total_seconds()
+
+    forecasts = [
+        forecast
+        for forecast in forecasts
+        if forecast.timestamp.timestamp() % period == 0
+    ]
+
+    rows = [
+        [getattr(forecast, field) for field in FORECAST_VALUE_FIELDS]
+        for forecast in forecasts
+    ]
+
+    # as long as get_forecast() would serve the forecasts as fresh
+    ttl = period
+
+    if settings.FORECAST_STALE_WHILE_REVALIDATE:
+        ttl = min(ttl, settings.FORECAST_STALE_AFTER)
+
+    rendered = {}
+
+    for data_type in PRERENDERED_DATA_TYPES:
+        for temperature_unit in models.Forecast.SUPPORTED_TEMPERATURE_UNITS:
+            data = serialize_forecast_rows(
+                rows,
+                temperature_unit == models.UNIT_FAHRENHEIT,
+                data_type
+            )
+
+            for forecast, forecast_data in zip(forecasts, data):
+                key = prerendered_cache_key(
+                    city.id,
+                    get_slot(forecast.timestamp),
+                    data_type,
+                    temperature_unit
+                )
+                rendered[key] = render(forecast_data)
+
+    get_forecast_cache().set_many(rendered, ttl)
+
+
+def get_prerendered(location, slot, data_type, temperature_unit):
+    """Get a response rendered by prerender_forecasts().
+
+    Only locations this process knows are looked up, resolving others would
+    take a DB query.
+
+    :param location: The location as searched for
+    :param slot: The forecast slot, see get_slot()
+    :param data_type: One of PRERENDERED_DATA_TYPES
+    :param temperature_unit: One of models.Forecast.SUPPORTED_TEMPERATURE_UNITS
+    :return: A tuple of the id of the city and the rendered response, both
+             None if there is none
+    """
+    city_id = locations.aliases.get(normalize_location(location), query=False)
+
+    if city_id is None:
+        return None, None
+
+    content = get_forecast_cache().get(
+        prerendered_cache_key(city_id, slot, data_type, temperature_unit)
+    )
+
+    if content is None:
+        return None, None
+
+    metrics.forecast_cache_requests.inc("prerendered")
+
+    return city_id, content
+
+
+def get_city(location):
+    """Get the city of a location we have searched for before.
+
+    :param location: The location as searched for
+    :return: The matching models.City or None
+    """
+    location = normalize_location(location)
+    city_id = locations.aliases.get(location)
+
+    if city_id is not None:
+        try:
+            return models.City.objects.get(id=city_id)
+
+        except models.City.DoesNotExist:
+            # deleted by another process
+            locations.aliases.discard(location)
+
+    # the city might be known by its name, i.e. from the city list or from
+    # searches for another spelling
+    ref = locations.cities.get(location)
 
-def serialize_forecast(forecast, use_fahrenheit=False):
+    if ref is None:
+        return None
+
+    return models.City.objects.filter(ref=ref).first()
+
+
+def known_forecasts(location):
+    """Get the forecasts of a location we have searched for before.
+
+    :param location: The location as searched for
+    :return: The forecasts of the matching city or None
+    """
+    city = get_city(location)
+
+    if city is None:
+        return None
+
+    return city.forecasts
+
+
+def refresh_forecasts(location, priority=budget.PRIORITY_INTERACTIVE):
+    """Same as add_forecasts, but concurrent refreshes of the same location
+    - within this process or any other one sharing the DB - are coalesced
+    into a single query to the API.
+
+    :param location: The location to query the API for
+    :param priority: The budget.PRIORITIES the query is made with
+    :return: The forecasts of the matching city
+    :raises budget.BudgetExhausted: If the API must not be called for now
+    """
+    return coalesce.single_flight(
+        _flights,
+        normalize_location(location),
+        lambda: add_forecasts(location, priority),
+        lambda: known_forecasts(location),
+        datetime.timedelta(seconds=settings.FORECAST_FETCH_LEASE)
+    )
+
+
+_revalidations = set()
+_revalidations_lock = threading.Lock()
+_revalidation_executor = None
+
+
+def get_revalidation_executor():
+    global _revalidation_executor
+
+    with _revalidations_lock:
+        if _revalidation_executor is None:
+            _revalidation_executor = ThreadPoolExecutor(
+                max_workers=settings.FORECAST_REVALIDATE_WORKERS
+            )
+
+    return _revalidation_executor
+
+
+def revalidate(location, city):
+    """Refresh the forecasts of a city in the background, unless that is
+    already in progress.
+
+    :param location: The location to query the API for
+    :param city: The models.City the location resolves to
+    :return: A Future of the refresh or None, if one is already running
+    """
+    with _revalidations_lock:
+        if city.id in _revalidations:
+            return None
+
+        _revalidations.add(city.id)
+
+    def run():
+        try:
+            return refresh_forecasts(location, budget.PRIORITY_BACKGROUND)
+
+        except budget.BudgetExhausted:
+            logger.info(
+                "Not revalidating forecasts for '%s', the call budget is "
+                "exhausted.",
+                location
+            )
+
+        except Exception as e:
+            logger.error(
+                "Revalidating forecasts for '%s' failed: %s",
+                location,
+                e
+            )
+
+        finally:
+            with _revalidations_lock:
+                _revalidations.discard(city.id)
+
+            connection.close()
+
+    try:
+        return get_revalidation_executor().submit(run)
+
+    except Exception:
+        with _revalidations_lock:
+            _revalidations.discard(city.id)
+        raise
+
+
+def serialize_forecast(forecast, use_fahrenheit=False, temperature=None):
+    """Render a forecast.
+
+    :param forecast: The models.Forecast to render
+    :param use_fahrenheit: Whether to render the temperature in Fahrenheit
+    :param temperature: The rendered temperature, if it has been converted
+                        along with others already - see
+                        conversions.ceil_temperatures()
+    :return: The data of the forecast
+    """
     temperature_unit = models.UNIT_FAHRENHEIT \
         if use_fahrenheit \
         else models.UNIT_CELSIUS
 
-    temperature_value = forecast.get_temperature(unit=temperature_unit)
+    if temperature is None:
+        temperature_value = forecast.get_temperature(unit=temperature_unit)
+    else:
+        temperature_value = temperature
 
-    return {
+    data = {
         "status": "success",
         "timestamp": forecast.timestamp.strftime(DATETIME_FORMAT),
         "description": forecast.description,
@@ -161,6 +916,91 @@ def serialize_forecast(forecast, use_fahrenheit=False):
         }
     }
 
+    # served while fresh forecasts are being fetched
+    if getattr(forecast, "stale", False):
+        data["stale"] = True
+
+    return data
+
+
+# the fields needed to render a forecast, see serialize_forecast_rows()
+FORECAST_VALUE_FIELDS = (
+    "timestamp",
+    "description",
+    "temperature",
+    "pressure",
+    "humidity"
+)
+
+# the columns of the FORECAST_VALUE_FIELDS, to look them up with values_list()
+FORECAST_VALUE_COLUMNS = (
+    "timestamp",
+    "condition__description",
+    "temperature",
+    "pressure",
+    "humidity"
+)
+
+
+@metrics.stage_seconds.time("serialize")
+def serialize_forecast_rows(rows, use_fahrenheit=False, data_type=None):
+    """Render many forecasts at once, without instantiating models.
+
+    :param rows: An iterable of tuples with the FORECAST_VALUE_FIELDS of
+                 the forecasts
+    :param use_fahrenheit: Whether to render temperatures in Fahrenheit
+    :param data_type: None to render all values or one of "temperature",
+                      "pressure" or "humidity" to render only that one
+    :return: A list with the data of serialize_forecast() - or just the
+             part for the data_type - per row
+    """
+    temperature_unit = models.UNIT_FAHRENHEIT \
+        if use_fahrenheit \
+        else models.UNIT_CELSIUS
+
+    rows = list(rows)
+
+    # all temperatures of the response in one go
+    temperatures = conversions.ceil_temperatures(
+        [row[2] for row in rows],
+        temperature_unit
+    )
+
+    result = []
+
+    for (timestamp, description, _, pressure, humidity), temperature in zip(
+        rows,
+        temperatures
+    ):
+
+        values = {
+            "temperature": {
+                "value": temperature,
+                "unit": temperature_unit
+            },
+            "humidity": {
+                "value": humidity,
+                "unit": "%"
+            },
+            "pressure": {
+                "value": pressure,
+                "unit": "hPa"
+            }
+        }
+
+        if data_type:
+            data = values[data_type]
+        else:
+            data = values
+            data["description"] = description
+
+        data["status"] = "success"
+        data["timestamp"] = timestamp.strftime(DATETIME_FORMAT)
+
+        result.append(data)
+
+    return result
+
 
 def serialize_error(message):
     return {
@@ -169,6 +1009,12 @@ def serialize_error(message):
     }
 
 
+def render(data):
+    """Render response data to the JSON bytes the API responds with."""
+    return renderers.render(data)
+
+
+@metrics.stage_seconds.time("filter")
 def filter_forecasts(forecasts, from_date, to_date):
     if not forecasts:
         return None
@@ -177,20 +1023,59 @@ def filter_forecasts(forecasts, from_date, to_date):
     # order descending by timestamp, so the latest forecast is on top
     return forecasts \
         .filter(timestamp__range=(from_date, to_date)) \
+        .select_related("condition") \
         .order_by("-timestamp") \
         .first()
 
 
-def get_forecast(location, timestamp, auto_update=False):
+class RefreshRequired(Exception):
+    """Raised by require_refresh(), so callers querying the API on their own
+    - like the ASGI application - can take over when get_forecast() needs
+    fresh forecasts."""
+
+
+def require_refresh(location):
+    raise RefreshRequired(location)
+
+
+def deny_refresh(location):
+    """Used in place of refresh_forecasts(), if the call budget has been
+    found exhausted already."""
+    raise budget.BudgetExhausted()
+
+
+@metrics.stage_seconds.time("get_forecast")
+def get_forecast(location, timestamp, auto_update=False, refresh=None):
+
+    # how to get fresh forecasts of the location, if needed
+    if refresh is None:
+        refresh = refresh_forecasts
 
     now = datetime.datetime.now(tz=pytz.UTC)
     max_forecast = now + FORECAST_MAX_WINDOW
 
     if timestamp > max_forecast:
-        raise ValueError("Can not get forecasts further out than 5 days.")
+        raise out_of_window_error()
+
+    # all timestamps within a forecast slot resolve to the same forecast, so
+    # see if anybody looked that up recently
+    forecast_cache = get_forecast_cache()
+    cache_key = forecast_cache_key(location, get_slot(timestamp))
 
-    # assume we don't know the location
-    city = None
+    forecast = forecast_cache.get(cache_key)
+
+    if forecast is not None:
+        metrics.forecast_cache_requests.inc("hit")
+        return forecast
+
+    metrics.forecast_cache_requests.inc("miss")
+
+    if settings.FORECAST_SNAPSHOT:
+        forecast = get_snapshot_forecast(location, timestamp, auto_update, now)
+
+        if forecast is not None:
+            metrics.forecast_cache_requests.inc("snapshot")
+            return forecast
 
     # flag to ensure, we don't request the forecasts more than once per
     # invocation
@@ -199,16 +1084,10 @@ def get_forecast(location, timestamp, auto_update=False):
     # assume no available forecasts
     forecasts = []
 
-    # see, if we know that location from previous searches
-    try:
-        search = models.CitySearchResult.objects.get(search=location)
-        city = search.city
-
-    except models.CitySearchResult.DoesNotExist:
-        # we have not searched for that location before, so we'll trigger a
-        # query to the openweather API - that way we will get a) the city
-        # lookup and b) current forecast data in one API call
-        pass
+    # see, if we know that location from previous searches - if not, we'll
+    # trigger a query to the openweather API, that way we will get a) the
+    # city lookup and b) current forecast data in one API call
+    city = get_city(location)
 
     if city:
         # get our forecasts
@@ -216,14 +1095,12 @@ def get_forecast(location, timestamp, auto_update=False):
 
     else:
         if timestamp >= now:
-            forecasts = add_forecasts(location)
+            forecasts = refresh(location)
             forecasts_requested = True
         else:
             logger.debug(
-                "Timestamp {} is in the past, no reason "
-                "to query API".format(
-                    timestamp.strftime(DATETIME_FORMAT)
-                )
+                "Timestamp %s is in the past, no reason to query API",
+                timestamp
             )
 
     # We now have a list of forecasts, so go and see, if we have one that
@@ -234,15 +1111,69 @@ def get_forecast(location, timestamp, auto_update=False):
 
     oldest_timestamp = timestamp - FORECAST_MAX_AGE
 
-    logger.debug("DB lookup yielded {} forecasts for {}.".format(
-        forecasts.count() if forecasts else 0,
-        location
-    ))
-
     # we should only get one result from the filter max - but to be sure
     # order descending by timestamp, so the latest forecast is on top
     forecast = filter_forecasts(forecasts, oldest_timestamp, timestamp)
 
+    # how long the forecast may be served without looking at the DB again
+    max_age = FORECAST_MAX_AGE
+
+    if forecast and auto_update and timestamp > now \
+            and settings.FORECAST_STALE_WHILE_REVALIDATE:
+
+        stale_after = datetime.timedelta(
+            seconds=settings.FORECAST_STALE_AFTER
+        )
+        max_staleness = datetime.timedelta(
+            seconds=settings.FORECAST_MAX_STALENESS
+        )
+
+        # if we didn't know the city, we have just fetched its forecasts -
+        # forecasts stored before fetch times were recorded count as stale
+        if city is None:
+            age = datetime.timedelta(0)
+        elif city.fetched_at is None:
+            age = max_staleness
+        else:
+            age = now - city.fetched_at
+
+        if age <= stale_after:
+            max_age = min(max_age, stale_after - age)
+
+        elif age <= max_staleness:
+            logger.debug(
+                "Forecasts for '%s' are stale, revalidating.",
+                location
+            )
+
+            forecast.stale = True
+            revalidate(location, city)
+
+        else:
+            logger.debug(
+                "Forecasts for '%s' are too old to be served.",
+                location
+            )
+
+            try:
+                forecasts = refresh(location)
+
+            except budget.BudgetExhausted:
+                logger.info(
+                    "Call budget exhausted, serving stale forecasts for "
+                    "'%s'.",
+                    location
+                )
+
+                forecast.stale = True
+
+            else:
+                forecast = filter_forecasts(
+                    forecasts, oldest_timestamp, timestamp
+                )
+
+            forecasts_requested = True
+
     if not forecast:
 
         if auto_update:
@@ -257,7 +1188,7 @@ def get_forecast(location, timestamp, auto_update=False):
                         "API."
                     )
 
-                    forecasts = add_forecasts(location)
+                    forecasts = refresh(location)
                     forecast = filter_forecasts(
                         forecasts, oldest_timestamp, timestamp
                     )
@@ -280,16 +1211,310 @@ def get_forecast(location, timestamp, auto_update=False):
             )
 
     if forecast:
+        forecast.max_age = max_age.total_seconds()
+
+        if not getattr(forecast, "stale", False):
+            forecast_cache.set(cache_key, forecast, forecast.max_age)
+
         return forecast
     else:
-        raise RuntimeError(
-            "Unfortunately there's no data for "
-            "'{location}' on {timestamp}".format(
-                location=location,
-                timestamp=timestamp.strftime(DATETIME_FORMAT)
+        raise no_data_error(location, timestamp)
+
+
+def get_forecast_range(location, from_date, to_date, auto_update=False):
+    """Get all forecasts for a location within a time window.
+
+    :param location: The location to get the forecasts for
+    :param from_date: An aware datetime where the window starts
+    :param to_date: An aware datetime where the window ends
+    :param auto_update: Whether to query the API, if there are no
+                        forecasts for a window in the future
+    :return: A list of tuples with the FORECAST_VALUE_FIELDS of the
+             forecasts, ordered by timestamp
+    """
+    now = datetime.datetime.now(tz=pytz.UTC)
+
+    if from_date > to_date:
+        raise ValueError("The start of the range needs to be before its end.")
+
+    if from_date > now + FORECAST_MAX_WINDOW:
+        raise out_of_window_error()
+
+    forecasts = known_forecasts(location)
+    forecasts_requested = False
+
+    if forecasts is None and auto_update and to_date >= now:
+        forecasts = refresh_forecasts(location)
+        forecasts_requested = True
+
+    def lookup():
+        if forecasts is None:
+            return []
+
+        return list(
+            forecasts
+            .filter(timestamp__range=(from_date, to_date))
+            .order_by("timestamp")
+            .values_list(*FORECAST_VALUE_COLUMNS)
+        )
+
+    rows = lookup()
+
+    if not rows and auto_update and to_date > now and not forecasts_requested:
+        forecasts = refresh_forecasts(location)
+        rows = lookup()
+
+    return rows
+
+
+def out_of_window_error():
+    return ValueError("Can not get forecasts further out than 5 days.")
+
+
+def no_data_error(location, timestamp):
+    return RuntimeError(
+        "Unfortunately there's no data for "
+        "'{location}' on {timestamp}".format(
+            location=location,
+            timestamp=timestamp.strftime(DATETIME_FORMAT)
+        )
+    )
+
+
+def refresh_many(locations):
+    """Refresh the forecasts of several locations - the API is queried
+    concurrently, the responses are stored one after the other by the
+    calling thread, as most DBs serialize the writes anyway.
+
+    Like refresh_forecasts(), a location that is being refreshed already -
+    within this process or any other one sharing the DB - is not queried
+    again, its refresh is waited for instead. Every query takes a call from
+    the budget, locations it is exhausted for get a budget.BudgetExhausted.
+
+    :param locations: An iterable of locations to query the API for
+    :return: A dict mapping each location to the id of its city or to the
+             exception raised while refreshing it
+    """
+    locations = list(locations)
+    results = {}
+
+    if not locations:
+        return results
+
+    duration = datetime.timedelta(seconds=settings.FORECAST_FETCH_LEASE)
+
+    # the refreshes this call does itself and those it waits for
+    leading = {}
+    joined = {}
+
+    for location in locations:
+        key = normalize_location(location)
+        flight, leader = _flights.start(key)
+
+        if leader:
+            leading[location] = (key, flight)
+        else:
+            joined[location] = flight
+
+    leases = {}
+
+    def land(location, forecasts=None, error=None):
+        key, flight = leading.pop(location)
+
+        if key in leases:
+            coalesce.release_lease(key, leases.pop(key))
+
+        _flights.finish(key, flight, forecasts, error)
+
+        results[location] = error if error is not None \
+            else forecasts.instance.id
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=min(len(locations), settings.FORECAST_BATCH_WORKERS)
+        ) as executor:
+
+            futures = {}
+
+            for location, (key, _) in leading.items():
+                token = coalesce.acquire_lease(key, duration)
+
+                # another process is refreshing the location
+                if token is None:
+                    continue
+
+                leases[key] = token
+
+                if budget.acquire():
+                    futures[location] = executor.submit(query, location)
+
+            for location, (key, _) in list(leading.items()):
+                try:
+                    if location in futures:
+                        forecasts = ingest_forecasts(
+                            location,
+                            futures[location].result()
+                        )
+
+                    elif key in leases:
+                        raise budget.BudgetExhausted()
+
+                    else:
+                        logger.debug(
+                            "Another process is fetching '%s', waiting.",
+                            key
+                        )
+
+                        coalesce.wait_for_lease(key, duration)
+                        forecasts = known_forecasts(location)
+
+                        # the other process failed, so try ourselves
+                        if forecasts is None:
+                            forecasts = add_forecasts(location)
+
+                except Exception as e:
+                    land(location, error=e)
+
+                else:
+                    land(location, forecasts)
+
+    finally:
+        # don't leave anyone waiting for refreshes that never happened
+        for location in list(leading):
+            land(location, error=RuntimeError(
+                "Refreshing forecasts for '{}' failed.".format(location)
+            ))
+
+    for location, flight in joined.items():
+        try:
+            results[location] = flight.wait().instance.id
+
+        except Exception as e:
+            results[location] = e
+
+    return results
+
+
+def get_forecast_batch(items, auto_update=False):
+    """Get the forecasts for many locations and timestamps at once.
+
+    Known locations are resolved with one query and their forecasts are
+    loaded with another one. Unknown locations, or ones without data for
+    a requested future timestamp, are fetched from the API concurrently if
+    auto_update is enabled.
+
+    :param items: A list of (location, timestamp) tuples
+    :param auto_update: Whether to query the API for missing data
+    :return: A list with a models.Forecast or the exception explaining why
+             there is none for each item, in the order of items
+    """
+    now = datetime.datetime.now(tz=pytz.UTC)
+    max_forecast = now + FORECAST_MAX_WINDOW
+
+    # different spellings of a location share its city and its refresh
+    items = [
+        (normalize_location(location), timestamp)
+        for location, timestamp in items
+    ]
+
+    results = [None] * len(items)
+    pending = []
+
+    for index, (location, timestamp) in enumerate(items):
+        if timestamp > max_forecast:
+            results[index] = out_of_window_error()
+        else:
+            pending.append(index)
+
+    if not pending:
+        return results
+
+    # resolve all known locations in one go
+    cities = locations.aliases.get_many(
+        set(items[index][0] for index in pending)
+    )
+
+    refreshed = set()
+
+    def refresh(locations):
+        refreshed.update(locations)
+
+        for location, result in refresh_many(locations).items():
+            if isinstance(result, Exception):
+                for index in pending:
+                    if items[index][0] == location:
+                        results[index] = result
+            else:
+                cities[location] = result
+
+        pending[:] = [index for index in pending if results[index] is None]
+
+    if auto_update:
+        refresh(set(
+            items[index][0] for index in pending
+            if items[index][0] not in cities and items[index][1] >= now
+        ))
+
+    def lookup(indices):
+        """Find the forecasts of the given items with a single query."""
+        indices = [index for index in indices if items[index][0] in cities]
+
+        if not indices:
+            return
+
+        timestamps = [items[index][1] for index in indices]
+
+        forecasts = collections.defaultdict(list)
+
+        for forecast in models.Forecast.objects.filter(
+            city_id__in=set(cities[items[index][0]] for index in indices),
+            timestamp__range=(
+                min(timestamps) - FORECAST_MAX_AGE,
+                max(timestamps)
             )
+        ).select_related("condition").order_by("timestamp"):
+            forecasts[forecast.city_id].append(forecast)
+
+        slots = {
+            city_id: [forecast.timestamp for forecast in city_forecasts]
+            for city_id, city_forecasts in forecasts.items()
+        }
+
+        for index in indices:
+            location, timestamp = items[index]
+            city_id = cities[location]
+            city_forecasts = forecasts[city_id]
+
+            # the latest forecast that is at most 3 hours older than the
+            # requested timestamp
+            position = bisect.bisect_right(slots.get(city_id, []), timestamp)
+
+            if position and city_forecasts[position - 1].timestamp >= \
+                    timestamp - FORECAST_MAX_AGE:
+                results[index] = city_forecasts[position - 1]
+
+    lookup(pending)
+    pending[:] = [index for index in pending if results[index] is None]
+
+    if auto_update:
+        missing = set(
+            items[index][0] for index in pending
+            if items[index][1] > now and items[index][0] not in refreshed
         )
 
+        if missing:
+            refresh(missing)
+            lookup([
+                index for index in pending
+                if items[index][0] in missing
+            ])
+
+    for index in pending:
+        if results[index] is None:
+            results[index] = no_data_error(*items[index])
+
+    return results
+
 
 def get_data(location, timestamp, auto_update=False):
     try:
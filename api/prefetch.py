@@ -0,0 +1,354 @@
+import collections
+import datetime
+import threading
+import time
+
+import pytz
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import bulk, models, openweather
+from .budget import BudgetExhausted, PRIORITY_BACKGROUND
+from .log import logger
+
+
+class RequestTracker(object):
+    """Counts the requests per location in memory and writes them to the
+    DB in batches, so the request path doesn't pay for an UPDATE."""
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.last_flush = time.monotonic()
+
+        # the thread writing the counts, while it's running
+        self.flusher = None
+
+    def track(self, location):
+        location = openweather.normalize_location(location)
+
+        with self.lock:
+            self.counts[location] += 1
+
+            flusher = None
+
+            if self.flusher is None and \
+                    time.monotonic() - self.last_flush >= self.flush_interval:
+                flusher = self.flusher = threading.Thread(
+                    target=self.flush_in_background,
+                    name="request-tracker-flush",
+                    daemon=True
+                )
+
+        # the request goes on, the counts are written by another thread
+        if flusher is not None:
+            flusher.start()
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+
+        except Exception as e:
+            logger.error("Writing the request counts failed: %s", e)
+
+        finally:
+            with self.lock:
+                self.flusher = None
+
+            connection.close()
+
+    def flush(self):
+        """Write the collected request counts to the DB.
+
+        :return: The number of locations that have been updated
+        """
+        with self.lock:
+            counts = self.counts
+            self.counts = collections.Counter()
+            self.last_flush = time.monotonic()
+
+        now = datetime.datetime.now(tz=pytz.UTC)
+        window = get_window(now, settings.FORECAST_PREFETCH_WINDOW)
+
+        # locations we have never searched for don't have a row yet, their
+        # requests are lost - they will be counted from their next request
+        for location, count in counts.items():
+            models.CitySearchResult.objects.filter(search=location).update(
+                request_count=F("request_count") + count,
+                last_requested_at=now,
+                # counts of windows that have passed move on or are dropped
+                previous_window_count=Case(
+                    When(window=window, then=F("previous_window_count")),
+                    When(window=window - 1, then=F("window_count")),
+                    default=Value(0),
+                    output_field=IntegerField()
+                ),
+                window_count=Case(
+                    When(window=window, then=F("window_count") + count),
+                    default=Value(count),
+                    output_field=IntegerField()
+                ),
+                window=window
+            )
+
+        return len(counts)
+
+
+def get_window(now, seconds):
+    """Get the number of the request counting window a time is in.
+
+    :param now: An aware datetime
+    :param seconds: The length of the windows
+    :return: An int
+    """
+    return int(now.timestamp() // seconds)
+
+
+def recent_requests(window):
+    """An expression of the requests of a location within the current and
+    the previous window - those of older windows don't count."""
+    return Case(
+        When(
+            window=window,
+            then=F("window_count") + F("previous_window_count")
+        ),
+        When(window=window - 1, then=F("window_count")),
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+class CallBudget(object):
+    """Limits the number of API calls within a sliding window."""
+
+    def __init__(self, calls, period=60):
+        self.calls = calls
+        self.period = period
+        self.history = collections.deque()
+
+    def acquire(self):
+        """Take one call from the budget.
+
+        :return: False, if the budget is exhausted for now
+        """
+        now = time.monotonic()
+
+        while self.history and self.history[0] <= now - self.period:
+            self.history.popleft()
+
+        if len(self.history) >= self.calls:
+            return False
+
+        self.history.append(now)
+        return True
+
+
+def get_due_cities(top, window, lead):
+    """Get the cities of the most requested locations, whose forecasts are
+    about to expire.
+
+    :param top: The max. number of locations to consider
+    :param window: A timedelta, only locations requested within that time
+                   are considered - and ranked by their requests within
+                   the current and the previous window of that length
+    :param lead: A timedelta how long before expiry forecasts are due
+    :return: A list of tuples of a search string and the id of its city, one
+             per city, most requested lately first
+    """
+    now = datetime.datetime.now(tz=pytz.UTC)
+
+    searches = models.CitySearchResult.objects \
+        .filter(last_requested_at__gte=now - window) \
+        .annotate(
+            recent_count=recent_requests(
+                get_window(now, window.total_seconds())
+            )
+        ) \
+        .order_by("-recent_count", "-request_count") \
+        .values_list(
+            "search",
+            "city_id",
+            "city__fetched_at",
+            "city__checked_at"
+        )
+
+    due = []
+    cities = set()
+
+    due_before = now - (openweather.FORECAST_MAX_AGE - lead)
+
+    # a city might have been searched for with different strings, the most
+    # requested one is used for its refresh
+    for search, city_id, fetched_at, checked_at in searches.iterator():
+
+        if city_id in cities:
+            continue
+
+        cities.add(city_id)
+
+        # forecasts a bulk refresh has confirmed are due by that time
+        refreshed_at = max(
+            (value for value in (fetched_at, checked_at) if value is not None),
+            default=None
+        )
+
+        if refreshed_at is None or refreshed_at < due_before:
+            due.append((search, city_id))
+
+        if len(cities) >= top:
+            break
+
+    return due
+
+
+def get_due_locations(top, window, lead):
+    """Same as get_due_cities(), but only the search strings."""
+    return [search for search, _ in get_due_cities(top, window, lead)]
+
+
+def get_defaults(top, window, lead):
+    """Fill in the settings for the arguments of a prefetch left at None."""
+    if top is None:
+        top = settings.FORECAST_PREFETCH_TOP
+    if window is None:
+        window = datetime.timedelta(seconds=settings.FORECAST_PREFETCH_WINDOW)
+    if lead is None:
+        lead = datetime.timedelta(seconds=settings.FORECAST_PREFETCH_LEAD)
+
+    return top, window, lead
+
+
+def prefetch(budget, top=None, window=None, lead=None):
+    """Refresh the forecasts of the most requested locations, that are
+    about to expire, as long as the budget allows.
+
+    :param budget: The CallBudget to take API calls from
+    :param top: The max. number of locations to keep fresh
+    :param window: A timedelta, only locations requested within that time
+                   are considered
+    :param lead: A timedelta how long before expiry forecasts are refreshed
+    :return: A tuple (refreshed, failed, skipped) with the number of
+             locations
+    """
+    top, window, lead = get_defaults(top, window, lead)
+
+    locations = get_due_locations(top, window, lead)
+
+    refreshed = 0
+    failed = 0
+
+    for location in locations:
+
+        if not budget.acquire():
+            break
+
+        try:
+            openweather.refresh_forecasts(location, PRIORITY_BACKGROUND)
+            refreshed += 1
+
+        except BudgetExhausted:
+            logger.info("Prefetch: the shared call budget is exhausted.")
+            break
+
+        except Exception as e:
+            logger.error(
+                "Refreshing forecasts for '%s' failed: %s",
+                location,
+                e
+            )
+            failed += 1
+
+    skipped = len(locations) - refreshed - failed
+
+    logger.info(
+        "Prefetch: %d refreshed, %d failed, %d skipped.",
+        refreshed,
+        failed,
+        skipped
+    )
+
+    return refreshed, failed, skipped
+
+
+def prefetch_bulk(budget, top=None, window=None, lead=None):
+    """Same as prefetch(), but checks the current weather of the cities
+    first and fetches only the forecasts that are off, see bulk.refresh().
+
+    :return: A bulk.Report
+    """
+    top, window, lead = get_defaults(top, window, lead)
+
+    report = bulk.refresh(get_due_cities(top, window, lead), budget)
+
+    logger.info(
+        "Prefetch: %d checked, %d confirmed, %d refreshed, %d failed, "
+        "%d skipped, %d calls (%d checks), %d calls saved.",
+        report.checked,
+        report.confirmed,
+        report.refreshed,
+        report.failed,
+        report.skipped,
+        report.calls,
+        report.checks,
+        report.calls_saved
+    )
+
+    return report
+
+
+class PrefetchWorker(threading.Thread):
+    """Periodically writes the request counts and refreshes the forecasts
+    of the most requested locations."""
+
+    daemon = True
+
+    def __init__(self, interval=None, budget=None):
+        super().__init__(name="forecast-prefetch")
+
+        self.interval = interval or settings.FORECAST_PREFETCH_INTERVAL
+        self.budget = budget or CallBudget(settings.FORECAST_PREFETCH_BUDGET)
+        self.stopped = threading.Event()
+
+    def run_once(self):
+        tracker.flush()
+
+        if settings.FORECAST_PREFETCH_BULK:
+            return prefetch_bulk(self.budget)
+
+        return prefetch(self.budget)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.run_once()
+
+            except Exception as e:
+                logger.error("Prefetch failed: %s", e)
+
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+tracker = RequestTracker(settings.REQUEST_TRACKING_FLUSH_INTERVAL)
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker():
+    """Start the process wide PrefetchWorker, if it isn't running yet."""
+    global _worker
+
+    with _worker_lock:
+        if _worker is None:
+            _worker = PrefetchWorker()
+            _worker.start()
+
+    return _worker
@@ -0,0 +1,74 @@
+import json
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+# optional, a faster encoder than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the Accept headers of clients that take JSON, everything else - i.e. the
+# text/html of browsers asking for the browsable API - is negotiated
+JSON_ACCEPT_HEADERS = frozenset(["", "*/*", "application/json"])
+
+# types the encoders don't know, i.e. lazy translations in error messages
+_default = encoders.JSONEncoder().default
+
+# set up once, json.dumps() creates an encoder per call if it's configured
+_encoder = json.JSONEncoder(
+    ensure_ascii=False,
+    separators=(",", ":"),
+    default=_default
+)
+
+
+def render(data):
+    """Render data to compact JSON, the same JSONRenderer renders it to.
+
+    :param data: The data to render
+    :return: The UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+
+    # keep the output a strict subset of javascript, as JSONRenderer does
+    return _encoder.encode(data) \
+        .replace("\u2028", "\\u2028") \
+        .replace("\u2029", "\\u2029") \
+        .encode("utf-8")
+
+
+class FastJSONRenderer(JSONRenderer):
+    """A JSONRenderer rendering with render() - only indented JSON, i.e. the
+    one the browsable API shows, takes the way of the JSONRenderer."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        if accepted_media_type and "indent" in accepted_media_type \
+                or renderer_context and "indent" in renderer_context:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return render(data)
+
+
+class FastContentNegotiation(DefaultContentNegotiation):
+    """Skip the negotiation for clients that take JSON anyway, the
+    renderers are only negotiated if a client might want another format."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+
+        if not format_suffix \
+                and format_query_param not in request.query_params \
+                and request.META.get("HTTP_ACCEPT", "") in JSON_ACCEPT_HEADERS:
+
+            for renderer in renderers:
+                if isinstance(renderer, JSONRenderer):
+                    return renderer, renderer.media_type
+
+        return super().select_renderer(request, renderers, format_suffix)
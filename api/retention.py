@@ -0,0 +1,194 @@
+import datetime
+
+import pytz
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import models, openweather
+from .log import logger
+
+# the fields of ForecastArchive merged when a day is archived in several runs
+ARCHIVE_UPDATE_FIELDS = (
+    "samples",
+    "temperature_min",
+    "temperature_max",
+    "temperature_sum",
+    "pressure_sum",
+    "humidity_sum"
+)
+
+
+def archive_forecasts(rows):
+    """Add forecasts to the daily aggregates of their cities.
+
+    :param rows: An iterable of tuples with the city id, timestamp,
+                 temperature, pressure and humidity of the forecasts
+    :return: The number of days created or updated
+    """
+    days = {}
+
+    for city_id, timestamp, temperature, pressure, humidity in rows:
+        key = (city_id, timestamp.date())
+        day = days.get(key)
+
+        if day is None:
+            days[key] = models.ForecastArchive(
+                city_id=city_id,
+                date=key[1],
+                samples=1,
+                temperature_min=temperature,
+                temperature_max=temperature,
+                temperature_sum=temperature,
+                pressure_sum=pressure,
+                humidity_sum=humidity
+            )
+        else:
+            merge(day, 1, temperature, temperature, temperature, pressure,
+                  humidity)
+
+    if not days:
+        return 0
+
+    existing = models.ForecastArchive.objects.filter(
+        city_id__in=set(city_id for city_id, _ in days),
+        date__in=set(date for _, date in days)
+    )
+
+    updated = []
+
+    for archived in existing:
+        day = days.pop((archived.city_id, archived.date), None)
+
+        if day is not None:
+            merge(archived, *[getattr(day, field)
+                              for field in ARCHIVE_UPDATE_FIELDS])
+            updated.append(archived)
+
+    openweather.bulk_update(updated, ARCHIVE_UPDATE_FIELDS)
+    models.ForecastArchive.objects.bulk_create(days.values())
+
+    return len(updated) + len(days)
+
+
+def merge(day, samples, temperature_min, temperature_max, temperature_sum,
+          pressure_sum, humidity_sum):
+    """Merge aggregated forecasts into a models.ForecastArchive."""
+    day.samples += samples
+    day.temperature_min = min(day.temperature_min, temperature_min)
+    day.temperature_max = max(day.temperature_max, temperature_max)
+    day.temperature_sum += temperature_sum
+    day.pressure_sum += pressure_sum
+    day.humidity_sum += humidity_sum
+
+
+def delete_forecasts(forecasts, batch_size, archive):
+    """Delete forecasts in batches of one transaction each, so writers are
+    never locked out for long.
+
+    :param forecasts: A queryset of the models.Forecast to delete
+    :param batch_size: The max. number of rows deleted per transaction
+    :param archive: Whether to add the forecasts to the ForecastArchive
+    :return: The number of deleted forecasts
+    """
+    removed = 0
+
+    while True:
+        with transaction.atomic():
+            rows = list(
+                forecasts
+                .order_by("id")
+                .values_list(
+                    "id",
+                    "city_id",
+                    "timestamp",
+                    "temperature",
+                    "pressure",
+                    "humidity"
+                )[:batch_size]
+            )
+
+            if not rows:
+                return removed
+
+            if archive:
+                archive_forecasts(row[1:] for row in rows)
+
+            deleted, _ = models.Forecast.objects \
+                .filter(id__in=[row[0] for row in rows]) \
+                .delete()
+
+            removed += deleted
+
+
+def compact(max_age=None, max_per_city=None, batch_size=None, archive=None):
+    """Remove old forecasts, so the Forecast table stays bounded.
+
+    The caches aren't touched, they might serve removed forecasts of past
+    slots until they expire.
+
+    :param max_age: Remove forecasts older than that many seconds, defaults
+                    to FORECAST_RETENTION_MAX_AGE
+    :param max_per_city: Keep no more than the newest that many forecasts
+                         per city, defaults to
+                         FORECAST_RETENTION_MAX_PER_CITY
+    :param batch_size: The max. number of rows deleted per transaction,
+                       defaults to FORECAST_RETENTION_BATCH_SIZE
+    :param archive: Whether to keep the removed forecasts as daily
+                    aggregates, defaults to FORECAST_RETENTION_ARCHIVE
+    :return: The number of removed forecasts
+    """
+    if max_age is None:
+        max_age = settings.FORECAST_RETENTION_MAX_AGE
+    if max_per_city is None:
+        max_per_city = settings.FORECAST_RETENTION_MAX_PER_CITY
+    if batch_size is None:
+        batch_size = settings.FORECAST_RETENTION_BATCH_SIZE
+    if archive is None:
+        archive = settings.FORECAST_RETENTION_ARCHIVE
+
+    removed = 0
+
+    if max_age is not None:
+        oldest = datetime.datetime.now(tz=pytz.UTC) \
+            - datetime.timedelta(seconds=max_age)
+
+        removed += delete_forecasts(
+            models.Forecast.objects.filter(timestamp__lt=oldest),
+            batch_size,
+            archive
+        )
+
+    if max_per_city is not None:
+        city_ids = list(
+            models.Forecast.objects
+            .values("city_id")
+            .annotate(forecasts=Count("id"))
+            .filter(forecasts__gt=max_per_city)
+            .values_list("city_id", flat=True)
+        )
+
+        for city_id in city_ids:
+            # the newest of the forecasts to remove
+            newest = models.Forecast.objects \
+                .filter(city_id=city_id) \
+                .order_by("-timestamp") \
+                .values_list("timestamp", flat=True)[max_per_city]
+
+            removed += delete_forecasts(
+                models.Forecast.objects.filter(
+                    city_id=city_id,
+                    timestamp__lte=newest
+                ),
+                batch_size,
+                archive
+            )
+
+    if removed:
+        logger.info("Removed %d forecasts.", removed)
+
+        if settings.FORECAST_SNAPSHOT:
+            openweather.request_snapshot()
+
+    return removed
@@ -8,7 +8,8 @@ class CelsiusForecastSerializer(serializers.BaseSerializer):
     def to_representation(self, obj):
         return openweather.serialize_forecast(
             obj,
-            use_fahrenheit=False
+            use_fahrenheit=False,
+            temperature=self.context.get("temperature")
         )
 
 
@@ -17,7 +18,8 @@ class FahrenheitForecastSerializer(serializers.BaseSerializer):
     def to_representation(self, obj):
         return openweather.serialize_forecast(
             obj,
-            use_fahrenheit=True
+            use_fahrenheit=True,
+            temperature=self.context.get("temperature")
         )
 
 
@@ -43,6 +45,9 @@ class PartialSerializer(serializers.BaseSerializer):
             partial_data["status"] = "success"
             partial_data["timestamp"] = obj["timestamp"]
 
+            if obj.get("stale"):
+                partial_data["stale"] = True
+
             return partial_data
 
         else:
@@ -0,0 +1,450 @@
+import array
+import bisect
+import datetime
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import pytz
+
+from django.db import connection, transaction
+
+from . import models
+from .log import logger
+
+MAGIC = b"FORECAST"
+VERSION = 2
+
+# magic, version, generation, number of cities and forecasts, length of the
+# metadata
+HEADER = struct.Struct("=8sQqQQQ")
+
+# the columns of the forecasts and their array type codes, the fixed-point
+# measurements are kept as they are stored, see models.FixedPointField
+FORECAST_COLUMNS = (
+    ("timestamp", "q"),
+    ("condition_id", "i"),
+    ("temperature", "i"),
+    ("pressure", "i"),
+    ("humidity", "i")
+)
+
+# the rows read from the DB at once while a snapshot is written
+FETCH_SIZE = 10000
+
+
+def write(path, since):
+    """Write the forecasts of all cities to a snapshot file.
+
+    The file is written next to path and moved into place in one step, so
+    readers either see the previous snapshot or the new one, never a part
+    of it. The generation of a snapshot is the latest time a city has been
+    fetched at, a snapshot never replaces one of a later generation that
+    has been written in the meantime.
+
+    :param path: The path of the snapshot
+    :param since: An aware datetime, older forecasts are left out
+    :return: The number of forecasts in the snapshot or None, if a later one
+             has been written in the meantime
+    """
+    fields = models.Forecast._meta
+    quote_name = connection.ops.quote_name
+
+    city_ids = array.array("q")
+    offsets = array.array("q")
+    fetched_at = array.array("d")
+    columns = [array.array(typecode) for _, typecode in FORECAST_COLUMNS]
+
+    # read everything in one transaction, so the snapshot is consistent
+    with transaction.atomic(), connection.cursor() as cursor:
+        cities = dict(models.City.objects.values_list("id", "fetched_at"))
+
+        # the columns as they are stored, without converting each value to
+        # a python one and back
+        cursor.execute(
+            "SELECT {city}, {columns} FROM {table} WHERE {timestamp} >= %s "
+            "ORDER BY {city}, {timestamp}".format(
+                city=quote_name(fields.get_field("city").column),
+                columns=", ".join(
+                    quote_name(fields.get_field(name).column)
+                    for name, _ in FORECAST_COLUMNS
+                ),
+                table=quote_name(fields.db_table),
+                timestamp=quote_name(fields.get_field("timestamp").column)
+            ),
+            [fields.get_field("timestamp").get_prep_value(since)]
+        )
+
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+
+            if not rows:
+                break
+
+            # a column at a time
+            rows = list(zip(*rows))
+
+            for position, city_id in enumerate(rows[0], len(columns[0])):
+                if not city_ids or city_ids[-1] != city_id:
+                    city_ids.append(city_id)
+                    offsets.append(position)
+
+                    fetched = cities.get(city_id)
+                    fetched_at.append(
+                        fetched.timestamp() if fetched is not None
+                        else math.nan
+                    )
+
+            for column, values in zip(columns, rows[1:]):
+                column.extend(values)
+
+        offsets.append(len(columns[0]))
+
+        generation = get_generation(cities.values())
+
+        known = set(city_ids)
+
+        metadata = json.dumps({
+            "conditions": dict(
+                models.Condition.objects.values_list("id", "description")
+            ),
+            "searches": {
+                search: city_id
+                for search, city_id in models.CitySearchResult.objects
+                .values_list("search", "city_id")
+                if city_id in known
+            }
+        }).encode("utf-8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(
+                MAGIC,
+                VERSION,
+                generation,
+                len(city_ids),
+                len(columns[0]),
+                len(metadata)
+            ))
+
+            # the 8 byte columns first, so all of them are aligned
+            city_ids.tofile(f)
+            offsets.tofile(f)
+            fetched_at.tofile(f)
+
+            for column in columns:
+                column.tofile(f)
+
+            f.write(metadata)
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        with _write_lock:
+            current = read_generation(path)
+
+            if current is not None and current > generation:
+                logger.debug(
+                    "Dropping a snapshot of generation %d, %d has been "
+                    "written in the meantime.",
+                    generation,
+                    current
+                )
+                os.unlink(temp_path)
+                return None
+
+            os.replace(temp_path, path)
+
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return len(columns[0])
+
+
+def get_generation(fetched_at):
+    """Get the generation of a snapshot of cities.
+
+    :param fetched_at: The times the cities have been fetched at, None for
+                       cities that never have been
+    :return: The latest time as microseconds since the epoch, 0 if there is
+             none
+    """
+    return max(
+        (
+            int(value.timestamp() * 1000000)
+            for value in fetched_at
+            if value is not None
+        ),
+        default=0
+    )
+
+
+def read_generation(path):
+    """Get the generation of the snapshot at path.
+
+    :param path: The path of the snapshot
+    :return: The generation or None, if there is no snapshot of this version
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+
+    if len(header) < HEADER.size:
+        return None
+
+    magic, version, generation = HEADER.unpack(header)[:3]
+
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    return generation
+
+
+class Writer(object):
+    """Rebuilds a snapshot in a background thread, so refreshes don't wait
+    for it. Requests arriving while a rebuild is pending or running are
+    collected into the next one, so there is at most one rebuild in flight
+    per process."""
+
+    def __init__(self, write):
+        """
+        :param write: The function rebuilding the snapshot
+        """
+        self.write = write
+
+        self.lock = threading.Lock()
+        self.pending = False
+
+        # the thread rebuilding the snapshot, while it's running
+        self.thread = None
+
+    def request(self, delay):
+        """Have the snapshot rebuilt.
+
+        :param delay: The number of seconds to wait for further requests
+                      before rebuilding
+        """
+        with self.lock:
+            self.pending = True
+
+            if self.thread is not None:
+                return
+
+            thread = self.thread = threading.Thread(
+                target=self.run,
+                args=(delay,),
+                name="snapshot-writer",
+                daemon=True
+            )
+
+        thread.start()
+
+    def run(self, delay):
+        try:
+            while True:
+                time.sleep(delay)
+
+                with self.lock:
+                    if not self.pending:
+                        self.thread = None
+                        return
+
+                    self.pending = False
+
+                try:
+                    self.write()
+
+                except Exception as e:
+                    logger.error("Writing the snapshot failed: %s", e)
+
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Wait until the requested rebuilds are done, i.e. before the
+        process exits."""
+        with self.lock:
+            thread = self.thread
+
+        if thread is not None:
+            thread.join()
+
+
+class Snapshot(object):
+    """A snapshot file written by write(), memory-mapped - the columns are
+    read right from the pages the OS shares between all processes mapping
+    the same file. The forecasts are sorted by city and time, so a lookup is
+    a binary search for the city and one within its forecasts."""
+
+    def __init__(self, path):
+        """
+        :param path: The path of the snapshot
+        :raises ValueError: If the file is not a snapshot of this version
+        """
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmap) < HEADER.size:
+            raise ValueError("Not a forecast snapshot: {}".format(path))
+
+        magic, version, self.generation, cities, forecasts, \
+            metadata_length = HEADER.unpack_from(self.mmap)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a forecast snapshot: {}".format(path))
+
+        view = memoryview(self.mmap)
+        offset = HEADER.size
+
+        def column(typecode, count):
+            nonlocal offset
+
+            size = array.array(typecode).itemsize * count
+            values = view[offset:offset + size].cast(typecode)
+            offset += size
+
+            return values
+
+        self.city_ids = column("q", cities)
+        self.offsets = column("q", cities + 1)
+        self.fetched_at = column("d", cities)
+
+        self.columns = {
+            name: column(typecode, forecasts)
+            for name, typecode in FORECAST_COLUMNS
+        }
+
+        metadata = json.loads(
+            bytes(view[offset:offset + metadata_length]).decode("utf-8")
+        )
+
+        self.conditions = {
+            int(condition_id): description
+            for condition_id, description in metadata["conditions"].items()
+        }
+        self.searches = metadata["searches"]
+
+    def is_current(self, stat):
+        """Whether the snapshot is the file of the given os.stat() result."""
+        return (self.stat.st_dev, self.stat.st_ino, self.stat.st_mtime_ns) \
+            == (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+
+    def find(self, city_id, timestamp, max_age):
+        """Find the latest forecast of a city at the given time.
+
+        :param city_id: The id of the city
+        :param timestamp: An aware datetime
+        :param max_age: The max. number of seconds the forecast may start
+                        before timestamp
+        :return: A tuple of an unsaved models.Forecast and the time the
+                 city's forecasts have been fetched at (None, if unknown) -
+                 or None, if there is no forecast
+        """
+        index = bisect.bisect_left(self.city_ids, city_id)
+
+        if index == len(self.city_ids) or self.city_ids[index] != city_id:
+            return None
+
+        timestamps = self.columns["timestamp"]
+        seconds = timestamp.timestamp()
+
+        position = bisect.bisect_right(
+            timestamps,
+            math.floor(seconds),
+            self.offsets[index],
+            self.offsets[index + 1]
+        )
+
+        if position == self.offsets[index] \
+                or timestamps[position - 1] < math.ceil(seconds - max_age):
+            return None
+
+        position -= 1
+
+        fields = models.Forecast._meta
+
+        values = {
+            name: fields.get_field(name).from_db_value(
+                self.columns[name][position], None, None
+            )
+            for name, _ in FORECAST_COLUMNS
+            if name != "condition_id"
+        }
+
+        forecast = models.Forecast(
+            city_id=city_id,
+            description=self.conditions[
+                self.columns["condition_id"][position]
+            ],
+            **values
+        )
+
+        fetched_at = self.fetched_at[index]
+
+        if math.isnan(fetched_at):
+            fetched_at = None
+        else:
+            fetched_at = datetime.datetime.fromtimestamp(fetched_at, pytz.UTC)
+
+        return forecast, fetched_at
+
+
+_lock = threading.Lock()
+_current = None
+
+# taken while a snapshot is checked against the current one and moved into
+# its place
+_write_lock = threading.Lock()
+
+
+def get(path):
+    """Get the snapshot at path - once it has been replaced, the new one is
+    mapped with the next call.
+
+    :param path: The path of the snapshot
+    :return: A Snapshot or None, if there is none
+    """
+    global _current
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    current = _current
+
+    if current is not None and current.path == path \
+            and current.is_current(stat):
+        return current
+
+    with _lock:
+        current = _current
+
+        if current is None or current.path != path \
+                or not current.is_current(stat):
+            try:
+                current = Snapshot(path)
+
+            except (OSError, ValueError):
+                logger.exception("Could not open the snapshot %s.", path)
+                return None
+
+            # the previous one is unmapped, once no lookup uses it anymore
+            _current = current
+
+    return current
@@ -0,0 +1,94 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_vector(latitude, longitude):
+    """Map a position to a point on the unit sphere, so the euclidean
+    distance of two points grows with their distance on the globe - without
+    special cases for the poles or the antimeridian.
+
+    :param latitude: The latitude in degrees
+    :param longitude: The longitude in degrees
+    :return: A tuple (x, y, z)
+    """
+    latitude = math.radians(latitude)
+    longitude = math.radians(longitude)
+
+    return (
+        math.cos(latitude) * math.cos(longitude),
+        math.cos(latitude) * math.sin(longitude),
+        math.sin(latitude)
+    )
+
+
+def chord_to_km(distance):
+    """Convert the distance of two points on the unit sphere to kilometers
+    on the surface of the earth."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(distance / 2, 1.0))
+
+
+def build_tree(points):
+    """Build a k-d tree of points.
+
+    :param points: A list of tuples (x, y, z, value), it is reordered
+    :return: The root node, a tuple (point, axis, left, right), or None if
+             there are no points
+    """
+    def build(points, axis):
+        if not points:
+            return None
+
+        points.sort(key=lambda point: point[axis])
+        median = len(points) // 2
+        next_axis = (axis + 1) % 3
+
+        return (
+            points[median],
+            axis,
+            build(points[:median], next_axis),
+            build(points[median + 1:], next_axis)
+        )
+
+    return build(points, 0)
+
+
+def nearest(tree, vector):
+    """Find the point of a k-d tree closest to vector.
+
+    :param tree: A tree as built by build_tree()
+    :param vector: A tuple (x, y, z)
+    :return: A tuple (point, distance) or (None, inf) for an empty tree
+    """
+    x, y, z = vector
+    best = [None, math.inf]
+
+    def search(node):
+        point, axis, left, right = node
+
+        distance = (
+            (point[0] - x) ** 2 +
+            (point[1] - y) ** 2 +
+            (point[2] - z) ** 2
+        )
+
+        if distance < best[1]:
+            best[0] = point
+            best[1] = distance
+
+        offset = vector[axis] - point[axis]
+
+        near, far = (left, right) if offset < 0 else (right, left)
+
+        if near is not None:
+            search(near)
+
+        # the other side can only hold a closer point, if the splitting
+        # plane is closer than the best point so far
+        if far is not None and offset * offset < best[1]:
+            search(far)
+
+    if tree is not None:
+        search(tree)
+
+    return best[0], math.sqrt(best[1])
@@ -0,0 +1,208 @@
+import asyncio
+import json
+
+from urllib.parse import unquote
+
+import pytest
+
+from django.core.handlers.wsgi import WSGIHandler
+
+from . import aioupstream, asgi, metrics, models, openweather, upstream
+from .testdata.server import StubResponse
+
+requires_aiohttp = pytest.mark.skipif(
+    aioupstream.aiohttp is None,
+    reason="aiohttp is not installed"
+)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    yield loop
+
+    loop.run_until_complete(aioupstream.close_client())
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def app(settings):
+    # SQLite's in-memory test DB doesn't cope with concurrent writers
+    settings.FORECAST_ASYNC_THREADS = 1
+
+    return asgi.ForecastApplication(WSGIHandler())
+
+
+def request(app, path, query_string=b"", headers=(), method="GET"):
+    """Send a request to an ASGI application.
+
+    :return: A tuple (status, headers, body)
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def call():
+        await app(
+            {
+                "type": "http",
+                "method": method,
+                "path": unquote(path),
+                "query_string": query_string,
+                "headers": [(b"host", b"testserver")] + list(headers)
+            },
+            receive,
+            send
+        )
+
+        start, body = messages
+        return start["status"], dict(start["headers"]), body["body"]
+
+    return call()
+
+
+@requires_aiohttp
+def test_async_client(stub_server, loop):
+    stub_server.enqueue(
+        StubResponse(status=503, headers={"Retry-After": "0"}),
+        StubResponse({"cod": "200"})
+    )
+    stub_server.default = StubResponse({"cod": "200", "list": []})
+
+    response = loop.run_until_complete(
+        aioupstream.get("forecast", {"q": "Berlin,DE"})
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"cod": "200"}
+
+    for _ in range(3):
+        assert loop.run_until_complete(
+            aioupstream.get("forecast", {"q": "Berlin,DE"})
+        ).json() == {"cod": "200", "list": []}
+
+    # all requests, including the retry, share one connection
+    assert len(stub_server.requests) == 5
+    assert stub_server.requests[0] == (
+        "/data/2.5/forecast",
+        {"q": ["Berlin,DE"]}
+    )
+    assert len(stub_server.connections) == 1
+
+
+@requires_aiohttp
+def test_async_client_concurrency(stub_server, loop, settings):
+    settings.OPENWEATHERMAPORG_MAX_CONNECTIONS = 4
+    stub_server.default = StubResponse({"cod": "200"}, delay=0.2)
+
+    responses = loop.run_until_complete(
+        asyncio.gather(*[
+            aioupstream.get("forecast", {"q": "Berlin,DE"})
+            for _ in range(12)
+        ])
+    )
+
+    assert [response.status_code for response in responses] == [200] * 12
+    assert stub_server.max_active == 4
+    assert len(stub_server.connections) == 4
+
+
+@requires_aiohttp
+def test_async_client_errors(stub_server, loop, settings):
+    settings.OPENWEATHERMAPORG_MAX_RETRIES = 1
+    stub_server.default = StubResponse(status=502)
+
+    with pytest.raises(openweather.upstream.UpstreamError):
+        loop.run_until_complete(aioupstream.get("forecast", {}))
+
+    assert len(stub_server.requests) == 2
+
+
+@requires_aiohttp
+@pytest.mark.django_db(transaction=True)
+def test_weather(stub_server, payload, loop, app, client, weather_url):
+    stub_server.default = StubResponse(payload, delay=0.1)
+
+    url = weather_url("temperature", slots=2)
+
+    # concurrent requests for a location share one query
+    responses = loop.run_until_complete(
+        asyncio.gather(*[
+            request(app, url, query_string=b"temp_scale=f")
+            for _ in range(5)
+        ])
+    )
+
+    assert len(stub_server.requests) == 1
+
+    expected = client.get(url, {"temp_scale": "f"}).json()
+
+    assert expected["status"] == "success"
+    assert expected["unit"] == models.UNIT_FAHRENHEIT
+
+    for status, headers, body in responses:
+        assert status == 200
+        assert headers[b"content-type"] == b"application/json"
+        assert json.loads(body.decode("utf-8")) == expected
+
+    assert len(stub_server.requests) == 1
+
+
+@requires_aiohttp
+@pytest.mark.django_db(transaction=True)
+def test_weather_errors(stub_server, loop, app, weather_url):
+    status, _, body = loop.run_until_complete(
+        request(app, weather_url(location="Nowhere"))
+    )
+
+    assert status == 200
+    assert json.loads(body.decode("utf-8"))["status"] == "error"
+    assert len(stub_server.requests) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_weather_errors_are_counted(loop, app, weather_url, monkeypatch):
+
+    async def failing_query(location):
+        raise upstream.UpstreamError("down")
+
+    monkeypatch.setattr(asgi, "query", failing_query)
+
+    errors = metrics.errors.get("UpstreamError")
+
+    status, _, body = loop.run_until_complete(request(app, weather_url()))
+
+    assert json.loads(body.decode("utf-8"))["status"] == "error"
+    assert metrics.errors.get("UpstreamError") == errors + 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_wsgi_fallback(stub_server, loop, app, weather_url):
+    # invalid data types, unknown paths and other views
+    for path, status in (
+        (weather_url("invalid"), 404),
+        ("/unknown/", 404),
+        ("/weather/docs/", 200)
+    ):
+        assert loop.run_until_complete(request(app, path))[0] == status
+
+    # browsers get the browsable API
+    status, headers, _ = loop.run_until_complete(
+        request(app, weather_url(), headers=[(b"accept", b"text/html")])
+    )
+
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/html")
+
+    status, _, _ = loop.run_until_complete(
+        request(app, "/weather/batch/", method="POST")
+    )
+
+    assert status == 400
@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import models, openweather
+
+
+@pytest.fixture
+def locations_upstream(monkeypatch, payload):
+    """Answer queries with a different city per location, unless it's
+    "Nowhere"."""
+    calls = []
+    refs = {}
+
+    def fake_query(location, *args, **kwargs):
+        calls.append(location)
+
+        if location == "nowhere":
+            return {"cod": "404", "message": "city not found"}
+
+        ref = refs.setdefault(location, len(refs) + 1)
+
+        return dict(
+            payload,
+            city=dict(payload["city"], id=ref, name=location)
+        )
+
+    monkeypatch.setattr(openweather, "query", fake_query)
+
+    return calls
+
+
+def post_batch(client, items):
+    return client.post(
+        reverse("weather-batch"),
+        json.dumps(items),
+        content_type="application/json"
+    )
+
+
+def item(location, timestamp, **kwargs):
+    return dict(
+        kwargs,
+        location=location,
+        datetime=timestamp.strftime(openweather.DATETIME_FORMAT)
+    )
+
+
+@pytest.mark.django_db
+def test_batch(client, locations_upstream, now_slot):
+    slot = openweather.FORECAST_MAX_AGE
+
+    items = [
+        item("Berlin,DE", now_slot + slot),
+        item("Hamburg,DE", now_slot + 2 * slot, data_type="temperature",
+             temp_scale="f"),
+        item("Nowhere", now_slot + slot),
+        item("Berlin,DE", now_slot + 2 * slot + slot / 2,
+             data_type="pressure"),
+        {"location": "Berlin,DE"},
+        item("Berlin,DE", now_slot + 6 * openweather.FORECAST_MAX_WINDOW),
+        item("Berlin,DE", now_slot + slot, data_type="invalid"),
+    ]
+
+    response = post_batch(client, items)
+    assert response.status_code == 200
+
+    results = response.json()
+    assert len(results) == len(items)
+
+    berlin = openweather.get_forecast("Berlin,DE", now_slot + slot)
+    assert results[0] == openweather.serialize_forecast(berlin)
+
+    assert results[1]["status"] == "success"
+    assert results[1]["unit"] == models.UNIT_FAHRENHEIT
+    assert results[1]["timestamp"] == (now_slot + 2 * slot).strftime(
+        openweather.DATETIME_FORMAT
+    )
+
+    assert results[2]["status"] == "error"
+    assert "city not found" in results[2]["message"]
+
+    assert results[3]["status"] == "success"
+    assert results[3]["unit"] == "hPa"
+    assert results[3]["timestamp"] == results[1]["timestamp"]
+
+    assert results[4]["status"] == "error"
+    assert "datetime" in results[4]["message"]
+
+    assert results[5] == {
+        "status": "error",
+        "message": "Can not get forecasts further out than 5 days."
+    }
+
+    assert results[6]["status"] == "error"
+    assert "data_type" in results[6]["message"]
+
+    # every unknown location is queried exactly once
+    assert sorted(locations_upstream) == ["berlin,de", "hamburg,de", "nowhere"]
+
+
+@pytest.mark.django_db
+def test_batch_queries_known_locations_in_bulk(
+        client, locations_upstream, now_slot):
+
+    locations = ["City {}".format(index) for index in range(20)]
+
+    for location in locations:
+        openweather.add_forecasts(location)
+
+    items = [
+        item(location, now_slot + slot * openweather.FORECAST_MAX_AGE)
+        for location in locations
+        for slot in range(1, 9)
+    ]
+
+    with CaptureQueriesContext(connection) as queries:
+        results = post_batch(client, items).json()
+
+    assert [result["status"] for result in results] == \
+        ["success"] * len(items)
+
+    # one query to resolve the locations, one for all forecasts
+    assert len(queries.captured_queries) == 2
+    assert len(locations_upstream) == len(locations)
+
+
+@pytest.mark.django_db
+def test_batch_rejects_invalid_requests(client, settings, now_slot):
+    response = post_batch(client, {"location": "Berlin,DE"})
+    assert response.status_code == 400
+
+    settings.FORECAST_BATCH_MAX_ITEMS = 1
+
+    response = post_batch(
+        client,
+        [item("Berlin,DE", now_slot)] * 2
+    )
+    assert response.status_code == 400
+    assert response.json()["status"] == "error"
@@ -0,0 +1,142 @@
+import datetime
+
+import pytest
+import pytz
+
+from django.core.management import call_command
+from django.db.models import F
+
+from . import budget, models, openweather
+
+
+@pytest.fixture
+def calls_per_minute(settings):
+    settings.OPENWEATHERMAPORG_CALLS_PER_MINUTE = 4
+    settings.OPENWEATHERMAPORG_INTERACTIVE_RESERVE = 0.5
+    budget.usage.clear()
+    yield
+    budget.usage.clear()
+
+
+def age_bucket(seconds):
+    models.CallBucket.objects.update(updated_at=F("updated_at") - seconds)
+
+
+@pytest.mark.django_db
+def test_token_bucket(calls_per_minute):
+    assert [budget.acquire() for _ in range(5)] == [True] * 4 + [False]
+
+    # refilled at 4 calls per minute, up to the calls of a minute
+    age_bucket(30)
+    assert [budget.acquire() for _ in range(3)] == [True, True, False]
+
+    age_bucket(10 * 60)
+    assert [budget.acquire() for _ in range(5)] == [True] * 4 + [False]
+
+
+@pytest.mark.django_db
+def test_background_leaves_a_reserve(calls_per_minute):
+    # half of the budget is kept for requests of users
+    assert [
+        budget.acquire(budget.PRIORITY_BACKGROUND) for _ in range(3)
+    ] == [True, True, False]
+
+    assert [budget.acquire() for _ in range(3)] == [True, True, False]
+
+    usage = budget.get_usage()
+
+    assert usage["capacity"] == 4
+    assert usage["tokens"] == pytest.approx(0, abs=0.01)
+    assert usage["granted"] == {"interactive": 2, "background": 2}
+    assert usage["denied"] == {"interactive": 1, "background": 1}
+
+
+@pytest.mark.django_db
+def test_unlimited_budget(settings):
+    settings.OPENWEATHERMAPORG_CALLS_PER_MINUTE = None
+
+    assert all(budget.acquire() for _ in range(100))
+    assert not models.CallBucket.objects.exists()
+    assert budget.get_usage()["tokens"] is None
+
+
+@pytest.mark.django_db
+def test_exhausted_budget_serves_stale_forecasts(
+        calls_per_minute, settings, upstream_calls, now_slot):
+
+    settings.FORECAST_STALE_WHILE_REVALIDATE = True
+    settings.FORECAST_STALE_AFTER = 60 * 60
+    settings.FORECAST_MAX_STALENESS = 6 * 60 * 60
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    openweather.add_forecasts("Berlin,DE")
+
+    # too old to be served, as long as there are calls left
+    models.City.objects.update(
+        fetched_at=datetime.datetime.now(tz=pytz.UTC) -
+        datetime.timedelta(hours=8)
+    )
+
+    while budget.acquire():
+        pass
+
+    forecast = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    assert forecast.stale
+    assert upstream_calls == ["Berlin,DE"]
+
+    with pytest.raises(budget.BudgetExhausted):
+        openweather.get_forecast("Hamburg,DE", timestamp, True)
+
+    assert upstream_calls == ["Berlin,DE"]
+
+
+@pytest.mark.django_db
+def test_exhausted_budget_response(calls_per_minute, client, weather_url):
+    while budget.acquire():
+        pass
+
+    data = client.get(weather_url()).json()
+
+    assert data["status"] == "error"
+    assert "budget" in data["message"]
+
+
+@pytest.mark.django_db
+def test_batch_refresh_spends_the_budget(calls_per_minute, monkeypatch,
+                                         payload, now_slot):
+    calls = []
+
+    def fake_query(location, *args, **kwargs):
+        calls.append(location)
+        return dict(
+            payload,
+            city=dict(payload["city"], id=len(calls), name=location)
+        )
+
+    monkeypatch.setattr(openweather, "query", fake_query)
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+    locations = ["City {}".format(index) for index in range(5)]
+
+    results = openweather.get_forecast_batch(
+        [(location, timestamp) for location in locations],
+        auto_update=True
+    )
+
+    # one call per location, as long as there are calls left
+    assert len(calls) == 4
+    assert sum(
+        isinstance(result, budget.BudgetExhausted) for result in results
+    ) == 1
+    assert budget.get_usage()["denied"]["interactive"] == 1
+
+
+@pytest.mark.django_db
+def test_call_budget_command(calls_per_minute, capsys):
+    budget.acquire()
+
+    call_command("call_budget")
+
+    assert "3.0 of 4 calls per minute left." in capsys.readouterr().out
@@ -0,0 +1,244 @@
+import datetime
+
+import pytest
+import pytz
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import bulk, models, openweather, prefetch
+from .testdata import load_payload
+
+
+def make_city(ref):
+    return models.City.objects.create(
+        ref=ref,
+        name="City {}".format(ref),
+        latitude=0,
+        longitude=0,
+        country_code="DE"
+    )
+
+
+def city_payload(payload, city):
+    return dict(payload, city=dict(payload["city"], id=city.ref))
+
+
+@pytest.fixture
+def current_payload(now_slot):
+    """A recorded forecast response, starting with the current slot."""
+    return load_payload(start=now_slot)
+
+
+@pytest.fixture
+def cities(current_payload):
+    """Three cities with the forecasts of current_payload."""
+    cities = [make_city(ref) for ref in (1, 2, 3)]
+
+    openweather.store_many_forecasts(
+        (city, list(openweather.parse_forecasts(current_payload["list"])))
+        for city in cities
+    )
+
+    return cities
+
+
+@pytest.fixture
+def group_upstream(monkeypatch, current_payload):
+    """Answer group queries with the observed temperatures in Kelvin per
+    city ref and forecast queries with current_payload for the city."""
+    calls = []
+    observed = {}
+
+    def fake_query_group(refs):
+        calls.append(("group", list(refs)))
+        return {
+            ref: models.kelvin_to_celsius(observed[ref])
+            for ref in refs
+            if ref in observed
+        }
+
+    def fake_query_forecasts(ref):
+        calls.append(("forecast", ref))
+        return dict(current_payload, city=dict(
+            current_payload["city"],
+            id=ref
+        ))
+
+    monkeypatch.setattr(bulk, "query_group", fake_query_group)
+    monkeypatch.setattr(bulk, "query_forecasts", fake_query_forecasts)
+
+    return calls, observed
+
+
+@pytest.mark.django_db
+def test_refresh_only_fetches_cities_that_are_off(cities, group_upstream,
+                                                  current_payload):
+    calls, observed = group_upstream
+    berlin, hamburg, munich = cities
+
+    forecasted = current_payload["list"][0]["main"]["temp"]
+    observed[berlin.ref] = forecasted + 1
+    observed[hamburg.ref] = forecasted + 5
+    # munich is missing from the response
+
+    report = bulk.refresh(
+        [
+            ("berlin", berlin.id),
+            ("hamburg", hamburg.id),
+            ("munich", munich.id)
+        ],
+        prefetch.CallBudget(10)
+    )
+
+    assert report == bulk.Report(
+        checked=3,
+        confirmed=1,
+        refreshed=2,
+        failed=0,
+        skipped=0,
+        checks=1,
+        fetches=2
+    )
+    assert report.calls == 3
+    assert report.calls_saved == 0
+    assert calls == [
+        ("group", [1, 2, 3]),
+        ("forecast", hamburg.ref),
+        ("forecast", munich.ref)
+    ]
+
+
+@pytest.mark.django_db
+def test_confirmed_forecasts_are_not_marked_as_fetched(
+        cities, group_upstream, current_payload):
+    calls, observed = group_upstream
+    berlin = cities[0]
+
+    fetched_at = models.City.objects.get(id=berlin.id).fetched_at
+    observed[berlin.ref] = current_payload["list"][0]["main"]["temp"]
+
+    now = datetime.datetime.now(tz=pytz.UTC)
+    report = bulk.refresh([("berlin", berlin.id)], prefetch.CallBudget(10),
+                          now=now)
+
+    assert report.confirmed == 1
+    assert report.refreshed == 0
+
+    berlin = models.City.objects.get(id=berlin.id)
+
+    assert berlin.fetched_at == fetched_at
+    assert berlin.checked_at == now
+
+
+@pytest.mark.django_db
+def test_refresh_saves_calls(group_upstream, current_payload):
+    calls, observed = group_upstream
+
+    due = []
+
+    for ref in range(bulk.GROUP_SIZE + 1):
+        city = make_city(ref)
+        due.append(("city {}".format(ref), city.id))
+        observed[ref] = current_payload["list"][0]["main"]["temp"]
+
+    # the first cycle fetches all of them, nothing to confirm yet
+    report = bulk.refresh(due, prefetch.CallBudget(100))
+
+    assert report.refreshed == len(due)
+    assert report.calls == 2 + len(due)
+    assert report.calls_saved == -2
+
+    # the second one just checks them
+    report = bulk.refresh(due, prefetch.CallBudget(100))
+
+    assert report.confirmed == len(due)
+    assert report.refreshed == 0
+    assert report.calls == 2
+    assert report.calls_saved == len(due) - 2
+
+
+@pytest.mark.django_db
+def test_refresh_respects_budget(group_upstream):
+    calls, _ = group_upstream
+
+    due = [("city {}".format(ref), make_city(ref).id) for ref in range(3)]
+
+    report = bulk.refresh(due, prefetch.CallBudget(2))
+
+    assert report.checked == 3
+    assert report.refreshed == 1
+    assert report.skipped == 2
+    assert report.calls == 2
+    assert calls == [("group", [0, 1, 2]), ("forecast", 0)]
+
+
+@pytest.mark.django_db
+def test_refresh_refetches_old_forecasts(cities, group_upstream,
+                                         current_payload, settings):
+    calls, observed = group_upstream
+    berlin = cities[0]
+
+    observed[berlin.ref] = current_payload["list"][0]["main"]["temp"]
+
+    # the forecasts match, but have been fetched too long ago
+    settings.FORECAST_PREFETCH_GROUP_MAX_AGE = 0
+
+    report = bulk.refresh([("berlin", berlin.id)], prefetch.CallBudget(10))
+
+    assert report.confirmed == 0
+    assert report.refreshed == 1
+
+
+@pytest.mark.django_db
+def test_refresh_counts_failures(cities, group_upstream, monkeypatch):
+
+    def failing_query_group(refs):
+        raise RuntimeError("group")
+
+    def failing_query_forecasts(ref):
+        if ref == cities[0].ref:
+            raise RuntimeError("forecast")
+        return {"cod": "404", "message": "city not found"}
+
+    monkeypatch.setattr(bulk, "query_group", failing_query_group)
+    monkeypatch.setattr(bulk, "query_forecasts", failing_query_forecasts)
+
+    report = bulk.refresh(
+        [(str(city.ref), city.id) for city in cities[:2]],
+        prefetch.CallBudget(10)
+    )
+
+    assert report == bulk.Report(
+        checked=2,
+        confirmed=0,
+        refreshed=0,
+        failed=2,
+        skipped=0,
+        checks=1,
+        fetches=2
+    )
+
+
+@pytest.mark.django_db
+def test_store_writes_all_cities_at_once(payload):
+
+    def forecast_statements(count):
+        cities = [make_city(ref) for ref in range(count * 10, count * 11)]
+        responses = [
+            (str(city.ref), city, city_payload(payload, city))
+            for city in cities
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            assert bulk.store(responses, datetime.datetime.now(tz=pytz.UTC)) \
+                == count
+
+        return [
+            query["sql"] for query in queries.captured_queries
+            if '"api_forecast"' in query["sql"]
+        ]
+
+    # the existing forecasts of all cities and one insert, no matter how
+    # many cities
+    assert len(forecast_statements(1)) == len(forecast_statements(3)) == 2
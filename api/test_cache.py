@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import openweather
+from .cache import ResponseCache
+
+
+def test_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2, ttl=60)
+
+    cache.set("a", 1, city_id=1, generation=cache.generation)
+    cache.set("b", 2, city_id=1, generation=cache.generation)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3, city_id=2, generation=cache.generation)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {
+        "size": 2,
+        "invalidated": 0,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1
+    }
+
+
+def test_expires_entries():
+    cache = ResponseCache(maxsize=2, ttl=-1)
+
+    cache.set("a", 1, city_id=1, generation=cache.generation)
+
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_invalidates_cities():
+    cache = ResponseCache(maxsize=10, ttl=60)
+
+    cache.set("a", 1, city_id=1, generation=cache.generation)
+    cache.set("b", 2, city_id=2, generation=cache.generation)
+
+    generation = cache.generation
+    cache.invalidate_city(1)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    # computed before the invalidation, so it's outdated already
+    cache.set("a", 1, city_id=1, generation=generation)
+    assert cache.get("a") is None
+
+    cache.set("a", 1, city_id=1, generation=cache.generation)
+    assert cache.get("a") == 1
+
+
+def test_forgets_old_invalidations():
+    cache = ResponseCache(maxsize=10, ttl=0.05)
+
+    generation = cache.generation
+
+    for city_id in range(100):
+        cache.invalidate_city(city_id)
+
+    time.sleep(0.1)
+    cache.invalidate_city(100)
+
+    assert cache.stats()["invalidated"] == 1
+
+    # still refused, even though the invalidation has been forgotten
+    cache.set("a", 1, city_id=1, generation=generation)
+    assert cache.get("a") is None
+
+    cache.set("a", 1, city_id=1, generation=cache.generation)
+    assert cache.get("a") == 1
+
+
+def test_disabled():
+    cache = ResponseCache(maxsize=0, ttl=60)
+
+    cache.set("a", 1, city_id=1, generation=cache.generation)
+
+    assert cache.get("a") is None
+
+
+@pytest.mark.django_db
+def test_weather_serves_hits_from_memory(client, upstream_calls, weather_url):
+
+    response = client.get(weather_url())
+    assert response.json()["status"] == "success"
+
+    # the first request refreshed the city's forecasts itself, which
+    # invalidates everything computed while it was running
+    client.get(weather_url())
+
+    with CaptureQueriesContext(connection) as queries:
+        cached = client.get(weather_url())
+
+    assert cached.json() == response.json()
+    assert len(queries.captured_queries) == 0
+    assert upstream_calls == ["Berlin,DE"]
+
+    # the partial data types and temperature scales are cached separately
+    fahrenheit = client.get(weather_url(), {"temp_scale": "f"})
+    assert fahrenheit.json()["temperature"]["unit"] == "℉"
+
+    pressure = client.get(weather_url("pressure"))
+    assert pressure.json()["value"] == response.json()["pressure"]["value"]
+
+
+@pytest.mark.django_db
+def test_weather_cache_is_invalidated_by_new_forecasts(
+        client, upstream_calls, payload, weather_url):
+
+    before = client.get(weather_url("temperature")).json()
+
+    payload["list"][0]["main"]["temp"] += 10
+    openweather.add_forecasts("Berlin,DE")
+
+    after = client.get(weather_url("temperature")).json()
+
+    assert after["value"] == before["value"] + 10
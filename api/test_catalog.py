@@ -0,0 +1,140 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from django.core.management import call_command
+
+from . import catalog, locations, models, openweather
+
+CITY_LIST = [
+    {
+        "id": 2950159,
+        "name": "Berlin",
+        "state": "",
+        "country": "DE",
+        "coord": {"lon": 13.41053, "lat": 52.524368}
+    },
+    {
+        "id": 2911298,
+        "name": "Hamburg",
+        "state": "",
+        "country": "DE",
+        "coord": {"lon": 10.0, "lat": 53.549999}
+    },
+    {
+        "id": 4951788,
+        "name": "Springfield",
+        "state": "MA",
+        "country": "US",
+        "coord": {"lon": -72.589813, "lat": 42.101479}
+    },
+    {
+        "id": 4250542,
+        "name": "Springfield",
+        "state": "IL",
+        "country": "US",
+        "coord": {"lon": -89.643707, "lat": 39.801151}
+    },
+]
+
+
+@pytest.fixture
+def city_list(tmpdir):
+    path = str(tmpdir.join("city.list.json.gz"))
+
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(CITY_LIST, f, indent=2)
+
+    return path
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(CITY_LIST),
+    json.dumps(CITY_LIST, indent=4),
+    "\n".join(json.dumps(city) for city in CITY_LIST) + "\n",
+    "[]",
+    ""
+])
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_iter_city_list(text, chunk_size):
+    parsed = list(catalog.iter_city_list(io.StringIO(text), chunk_size))
+
+    assert parsed == (CITY_LIST if text.strip("[]") else [])
+
+
+def test_iter_city_list_rejects_garbage():
+    with pytest.raises(ValueError):
+        list(catalog.iter_city_list(io.StringIO('[{"id": 1}, {"id": '), 4))
+
+
+@pytest.mark.django_db
+def test_import_cities(city_list, capsys):
+    call_command("import_cities", city_list, "--batch-size", "3")
+
+    assert "4 cities created, 0 updated." in capsys.readouterr().out
+
+    berlin = models.City.objects.get(ref=2950159)
+    assert berlin.name == "Berlin"
+    assert berlin.country_code == "DE"
+    assert berlin.latitude == pytest.approx(52.524368)
+
+    berlin.name = "Berlin (old)"
+    berlin.save()
+
+    call_command("import_cities", city_list)
+
+    assert "0 cities created, 1 updated." in capsys.readouterr().out
+    assert models.City.objects.get(ref=2950159).name == "Berlin"
+    assert models.City.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_query_known_cities_by_id(city_list, settings):
+    call_command("import_cities", city_list)
+
+    settings.OPENWEATHERMAPORG_API_KEY = "key"
+
+    assert openweather.query_params("Hamburg, DE") == {
+        "id": 2911298,
+        "APPID": "key"
+    }
+
+    # ambiguous and unknown locations are up to the API
+    for location in ("springfield,us", "hamburg", "Bremen,DE"):
+        assert openweather.query_params(location) == {
+            "q": location.casefold(),
+            "APPID": "key"
+        }
+
+    models.City.objects.create(
+        ref=1,
+        name="Bremen",
+        latitude=0,
+        longitude=0,
+        country_code="DE"
+    )
+
+    locations.cities.load()
+
+    assert openweather.query_params("Bremen,DE")["id"] == 1
+
+
+@pytest.mark.django_db
+def test_known_cities_need_no_query(city_list, upstream_calls, now_slot):
+    call_command("import_cities", city_list)
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    # fetched under a different name
+    openweather.get_forecast("Berlin", timestamp, auto_update=True)
+
+    forecast = openweather.get_forecast(
+        "Berlin,DE",
+        timestamp,
+        auto_update=True
+    )
+
+    assert forecast.city.ref == 2950159
+    assert upstream_calls == ["Berlin"]
@@ -0,0 +1,220 @@
+import datetime
+import threading
+import time
+
+import pytest
+import pytz
+
+from django.db import connection
+
+from . import coalesce, models, openweather
+
+PARALLEL_REQUESTS = 8
+
+
+def run_in_threads(func, count):
+    results = [None] * count
+    errors = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()
+
+        try:
+            results[index] = func()
+        except Exception as e:
+            errors[index] = e
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=run, args=(index,)) for index in range(count)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, errors
+
+
+@pytest.fixture
+def slow_upstream(monkeypatch, payload):
+    calls = []
+
+    def slow_query(location, *args, **kwargs):
+        calls.append(location)
+        time.sleep(0.2)
+        return payload
+
+    monkeypatch.setattr(openweather, "query", slow_query)
+
+    return calls
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_misses_query_upstream_once(slow_upstream, payload):
+
+    results, errors = run_in_threads(
+        lambda: openweather.refresh_forecasts("Berlin,DE").count(),
+        PARALLEL_REQUESTS
+    )
+
+    assert errors == [None] * PARALLEL_REQUESTS
+    assert results == [len(payload["list"])] * PARALLEL_REQUESTS
+    assert slow_upstream == ["Berlin,DE"]
+    assert not models.FetchLease.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_get_forecast_queries_upstream_once(slow_upstream, now_slot):
+
+    timestamp = now_slot + 2 * openweather.FORECAST_MAX_AGE
+
+    results, errors = run_in_threads(
+        lambda: openweather.get_forecast(
+            "Berlin,DE",
+            timestamp,
+            auto_update=True
+        ).timestamp,
+        PARALLEL_REQUESTS
+    )
+
+    assert errors == [None] * PARALLEL_REQUESTS
+    assert results == [timestamp] * PARALLEL_REQUESTS
+    assert len(slow_upstream) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_waiters_share_errors(monkeypatch):
+
+    calls = []
+
+    def failing_query(location, *args, **kwargs):
+        calls.append(location)
+        time.sleep(0.2)
+        return {"cod": "404", "message": "city not found"}
+
+    monkeypatch.setattr(openweather, "query", failing_query)
+
+    results, errors = run_in_threads(
+        lambda: openweather.refresh_forecasts("Nowhere"),
+        PARALLEL_REQUESTS
+    )
+
+    assert len(calls) == 1
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_waits_for_lease_of_other_process(upstream_calls, payload):
+
+    # pretend another process is fetching the location right now
+    models.FetchLease.objects.create(
+        key=openweather.normalize_location("Berlin,DE"),
+        owner="other",
+        expires_at=datetime.datetime.now(tz=pytz.UTC) +
+        datetime.timedelta(minutes=1)
+    )
+
+    def other_process():
+        time.sleep(0.2)
+        openweather.add_forecasts("Berlin,DE")
+        coalesce.release_lease(
+            openweather.normalize_location("Berlin,DE"),
+            "other"
+        )
+        connection.close()
+
+    thread = threading.Thread(target=other_process)
+    thread.start()
+
+    forecasts = openweather.refresh_forecasts("Berlin,DE")
+    thread.join()
+
+    assert forecasts.count() == len(payload["list"])
+
+    # only the other process talked to the API
+    assert upstream_calls == ["Berlin,DE"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_takes_over_expired_lease(upstream_calls):
+
+    models.FetchLease.objects.create(
+        key=openweather.normalize_location("Berlin,DE"),
+        owner="crashed",
+        expires_at=datetime.datetime.now(tz=pytz.UTC) -
+        datetime.timedelta(seconds=1)
+    )
+
+    openweather.refresh_forecasts("Berlin,DE")
+
+    assert upstream_calls == ["Berlin,DE"]
+    assert not models.FetchLease.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_and_single_refreshes_are_coalesced(slow_upstream, now_slot):
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    def refresh(index):
+        if index:
+            return openweather.refresh_forecasts("Berlin,DE").instance.id
+
+        return openweather.get_forecast_batch(
+            [("Berlin,DE", timestamp)],
+            auto_update=True
+        )[0].city_id
+
+    indices = iter(range(PARALLEL_REQUESTS))
+    lock = threading.Lock()
+
+    def next_refresh():
+        with lock:
+            index = next(indices)
+        return refresh(index)
+
+    results, errors = run_in_threads(next_refresh, PARALLEL_REQUESTS)
+
+    assert errors == [None] * PARALLEL_REQUESTS
+    assert len(set(results)) == 1
+
+    # the batch and the single refreshes share one query
+    assert len(slow_upstream) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_waits_for_lease_of_other_process(upstream_calls, payload,
+                                                now_slot):
+
+    models.FetchLease.objects.create(
+        key=openweather.normalize_location("Berlin,DE"),
+        owner="other",
+        expires_at=datetime.datetime.now(tz=pytz.UTC) +
+        datetime.timedelta(minutes=1)
+    )
+
+    def other_process():
+        time.sleep(0.2)
+        openweather.add_forecasts("Berlin,DE")
+        coalesce.release_lease(
+            openweather.normalize_location("Berlin,DE"),
+            "other"
+        )
+        connection.close()
+
+    thread = threading.Thread(target=other_process)
+    thread.start()
+
+    results = openweather.get_forecast_batch(
+        [("Berlin,DE", now_slot + openweather.FORECAST_MAX_AGE)],
+        auto_update=True
+    )
+    thread.join()
+
+    assert isinstance(results[0], models.Forecast)
+
+    # only the other process talked to the API
+    assert upstream_calls == ["Berlin,DE"]
@@ -0,0 +1,102 @@
+import math
+import random
+import struct
+
+import pytest
+
+from . import conversions, models
+
+UNITS = models.Forecast.SUPPORTED_TEMPERATURE_UNITS + [None]
+
+
+@pytest.fixture(params=["python", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        monkeypatch.setattr(
+            conversions,
+            "numpy",
+            pytest.importorskip("numpy")
+        )
+        monkeypatch.setattr(conversions, "NUMPY_MIN_SIZE", 0)
+    else:
+        monkeypatch.setattr(conversions, "numpy", None)
+
+    return request.param
+
+
+def next_float(value, direction):
+    """The closest float to value towards +inf (1) or -inf (-1)."""
+    if value == 0:
+        return math.copysign(5e-324, direction)
+
+    # the bits of floats of the same sign are ordered like their magnitude
+    bits = struct.unpack("<q", struct.pack("<d", value))[0]
+    bits += direction if value > 0 else -direction
+
+    return struct.unpack("<d", struct.pack("<q", bits))[0]
+
+
+def temperatures(count, seed):
+    """Temperatures as they are stored, and those where rounding is most
+    likely to differ: whole degrees - in Celsius and in Fahrenheit - and
+    their closest neighbours."""
+    rng = random.Random(seed)
+    values = [0.0, -0.0, 1e15, -1e15, 5e-324, -5e-324]
+
+    for _ in range(count):
+        values.append(rng.randint(-10000, 10000) / 100)
+        values.append(rng.uniform(-100, 100))
+
+        celsius = float(rng.randint(-100, 100))
+        # the Celsius value of a whole degree Fahrenheit
+        fahrenheit = (rng.randint(-150, 220) - 32) * 5 / 9
+
+        for value in (celsius, fahrenheit):
+            values.extend([
+                value,
+                next_float(value, 1),
+                next_float(value, -1)
+            ])
+
+    return values
+
+
+def scalar(values, unit):
+    return [
+        models.Forecast(temperature=value).get_temperature(unit)
+        for value in values
+    ]
+
+
+@pytest.mark.parametrize("unit", UNITS)
+@pytest.mark.parametrize("seed", range(5))
+def test_ceil_temperatures_matches_get_temperature(backend, unit, seed):
+
+    values = temperatures(1000, seed)
+
+    converted = conversions.ceil_temperatures(values, unit)
+
+    assert converted == scalar(values, unit)
+    assert all(type(value) is int for value in converted)
+
+
+def test_next_float():
+    for value in (1.0, -1.0, 0.1, 100.0, -37.5):
+        assert next_float(value, 1) > value
+        assert next_float(value, -1) < value
+        assert next_float(next_float(value, 1), -1) == value
+
+
+@pytest.mark.parametrize("size", [0, 1, conversions.NUMPY_MIN_SIZE + 1])
+def test_ceil_temperatures_takes_any_size(size):
+
+    values = [20.5] * size
+
+    assert conversions.ceil_temperatures(values, models.UNIT_FAHRENHEIT) == \
+        [69] * size
+
+
+def test_ceil_temperatures_rejects_unknown_units(backend):
+
+    with pytest.raises(ValueError):
+        conversions.ceil_temperatures([20.5], "K")
@@ -0,0 +1,181 @@
+import math
+import random
+
+import pytest
+
+from django.urls import resolve, reverse
+
+from . import converters, locations, models, openweather, spatial
+
+
+def coords_url(coordinates, slot, data_type="summary"):
+    return reverse(
+        "weather-coords",
+        kwargs={
+            "data_type": data_type,
+            "coordinates": coordinates,
+            "date": slot.date(),
+            "time": slot.time()
+        }
+    )
+
+
+def create_city(ref, name, latitude, longitude, country_code="DE"):
+    return models.City.objects.create(
+        ref=ref,
+        name=name,
+        latitude=latitude,
+        longitude=longitude,
+        country_code=country_code
+    )
+
+
+def test_nearest_matches_brute_force():
+    random.seed(13)
+
+    positions = [
+        (random.uniform(-90, 90), random.uniform(-180, 180))
+        for _ in range(500)
+    ]
+    tree = spatial.build_tree([
+        spatial.to_vector(*position) + (index,)
+        for index, position in enumerate(positions)
+    ])
+
+    for _ in range(200):
+        vector = spatial.to_vector(
+            random.uniform(-90, 90),
+            random.uniform(-180, 180)
+        )
+
+        point, distance = spatial.nearest(tree, vector)
+
+        assert distance == pytest.approx(
+            min(
+                math.sqrt(sum(
+                    (a - b) ** 2
+                    for a, b in zip(spatial.to_vector(*position), vector)
+                ))
+                for position in positions
+            )
+        )
+
+
+def test_nearest_in_empty_tree():
+    assert spatial.build_tree([]) is None
+    assert spatial.nearest(None, (1, 0, 0)) == (None, math.inf)
+
+
+def test_chord_to_km():
+    berlin = spatial.to_vector(52.52, 13.41)
+    hamburg = spatial.to_vector(53.55, 10.0)
+
+    distance = math.sqrt(sum((a - b) ** 2 for a, b in zip(berlin, hamburg)))
+
+    assert spatial.chord_to_km(distance) == pytest.approx(255, abs=1)
+
+
+@pytest.mark.parametrize("value, coordinates", [
+    ("52.52,13.41", (52.52, 13.41)),
+    ("-33.9,151", (-33.9, 151.0)),
+    ("90,-180", (90.0, -180.0)),
+])
+def test_coordinates_converter(value, coordinates):
+    converter = converters.CoordinatesConverter()
+
+    assert converter.to_python(value) == coordinates
+    assert converter.to_python(converter.to_url(coordinates)) == coordinates
+
+
+@pytest.mark.parametrize("value", ["91,0", "0,180.5"])
+def test_coordinates_out_of_range(value):
+    with pytest.raises(ValueError):
+        converters.CoordinatesConverter().to_python(value)
+
+
+@pytest.mark.django_db
+def test_positions():
+    assert locations.positions.nearest(0, 0) == (None, None)
+
+    create_city(1, "Taveuni", -16.8, 179.9, "FJ")
+    create_city(2, "Suva", -18.1, 178.4, "FJ")
+
+    locations.positions.clear()
+
+    # across the antimeridian
+    assert locations.positions.nearest(-16.8, -179.5)[0] == 1
+
+    locations.positions.add(create_city(3, "Tonga", -21.1, -175.2, "TO"))
+
+    ref, distance = locations.positions.nearest(-21, -175)
+    assert ref == 3
+    assert distance < 50
+
+
+@pytest.mark.django_db
+def test_nearby_positions_share_a_fetch(client, upstream_calls, now_slot):
+    berlin = create_city(2950159, "Berlin", 52.524, 13.411)
+    create_city(2911298, "Hamburg", 53.55, 10.0)
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    first = client.get(coords_url((52.5, 13.4), timestamp)).json()
+    second = client.get(coords_url((52.45, 13.3), timestamp)).json()
+
+    assert first["status"] == "success"
+    assert first == second
+    assert upstream_calls == ["id:2950159"]
+
+    assert berlin.forecasts.exists()
+    assert berlin.searches.get().search == "id:2950159"
+
+
+@pytest.mark.django_db
+def test_coords_without_cities(client, now_slot):
+    data = client.get(coords_url((52.5, 13.4), now_slot)).json()
+
+    assert data["status"] == "error"
+
+
+@pytest.mark.django_db
+def test_coords_beyond_max_distance(client, upstream_calls, now_slot,
+                                    settings):
+    create_city(2950159, "Berlin", 52.524, 13.411)
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    settings.FORECAST_COORDS_MAX_DISTANCE = 50
+
+    # Munich is about 500km away
+    response = client.get(coords_url((48.14, 11.58), timestamp))
+
+    assert response.status_code == 404
+    assert response.json()["status"] == "error"
+    assert upstream_calls == []
+
+    settings.FORECAST_COORDS_MAX_DISTANCE = None
+
+    response = client.get(coords_url((48.14, 11.58), timestamp))
+
+    assert response.json()["status"] == "success"
+    assert upstream_calls == ["id:2950159"]
+
+
+@pytest.mark.django_db
+def test_coords_rejects_invalid_data_types(client, now_slot, monkeypatch):
+
+    def nearest(*args):
+        raise AssertionError("looked up")
+
+    monkeypatch.setattr(locations.positions, "nearest", nearest)
+
+    response = client.get(coords_url((52.5, 13.4), now_slot, "invalid"))
+
+    assert response.status_code == 404
+
+
+def test_coords_route():
+    match = resolve("/weather/summary/coords/52.5,-13.4/20180718/1800/")
+
+    assert match.url_name == "weather-coords"
+    assert match.kwargs["coordinates"] == (52.5, -13.4)
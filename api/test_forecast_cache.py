@@ -0,0 +1,124 @@
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import openweather, views
+
+CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-forecasts",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+
+
+@pytest.fixture(params=sorted(CACHE_BACKENDS))
+def forecast_cache(request, settings, tmpdir):
+    config = dict(CACHE_BACKENDS[request.param])
+
+    if config["BACKEND"].endswith("FileBasedCache"):
+        config["LOCATION"] = str(tmpdir.join("forecasts"))
+
+    settings.CACHES = dict(settings.CACHES, forecasts=config)
+
+    cache = openweather.get_forecast_cache()
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_lookups_are_served_from_cache(
+        forecast_cache, upstream_calls, now_slot):
+
+    timestamp = now_slot + 2 * openweather.FORECAST_MAX_AGE
+
+    forecast = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    # any other timestamp and spelling within the same slot is a hit
+    with CaptureQueriesContext(connection) as queries:
+        cached = openweather.get_forecast(
+            " berlin,DE",
+            timestamp + openweather.FORECAST_MAX_AGE / 2,
+            True
+        )
+
+    assert len(queries.captured_queries) == 0
+    assert cached.pk == forecast.pk
+    assert cached.temperature == forecast.temperature
+    assert upstream_calls == ["Berlin,DE"]
+
+
+@pytest.mark.django_db
+def test_new_forecasts_invalidate_cached_lookups(
+        forecast_cache, upstream_calls, payload, now_slot):
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    before = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    payload["list"][0]["main"]["temp"] += 10
+    openweather.add_forecasts("Berlin,DE")
+
+    after = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    assert after.temperature == pytest.approx(before.temperature + 10)
+
+
+@pytest.mark.django_db
+def test_prerendered_responses(
+        forecast_cache, upstream_calls, client, settings, weather_url):
+
+    settings.FORECAST_PRERENDER = True
+
+    client.get(weather_url())
+
+    requests = [
+        (weather_url(data_type, slots=slots), {"temp_scale": temp_scale})
+        for data_type in views.VALID_DATATYPES
+        for temp_scale in ("c", "f")
+        for slots in (1, 5)
+    ]
+
+    prerendered = []
+
+    # answered by the rendered responses, even if this process hasn't
+    # seen them before
+    for url, params in requests:
+        openweather.response_cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, params)
+
+        assert len(queries.captured_queries) == 0
+        assert response["Content-Type"] == "application/json"
+
+        prerendered.append(response.json())
+
+    settings.FORECAST_PRERENDER = False
+    forecast_cache.clear()
+
+    for (url, params), data in zip(requests, prerendered):
+        openweather.response_cache.clear()
+
+        assert client.get(url, params).json() == data
+
+    assert upstream_calls == ["Berlin,DE"]
+
+
+@pytest.mark.django_db
+def test_browsable_api_renders_cached_responses(
+        forecast_cache, upstream_calls, client, weather_url):
+
+    data = client.get(weather_url()).json()
+
+    response = client.get(weather_url(), HTTP_ACCEPT="text/html")
+
+    assert response["Content-Type"].startswith("text/html")
+    assert data["description"] in response.content.decode("utf-8")
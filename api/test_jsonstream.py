@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from . import jsonstream
+from .testdata import load_payload
+
+
+def chunked(data, size):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 4096])
+def test_items_and_fields(size):
+    payload = load_payload()
+    # numbers and multi-byte characters split across chunks
+    payload["city"]["name"] = "Zürich ☀"
+    payload["list"][0]["main"]["pressure"] = 123456789.125
+
+    data = json.dumps(payload, indent=1).encode("utf-8")
+
+    stream = jsonstream.ObjectStream(chunked(data, size), "list")
+
+    assert list(stream) == payload["list"]
+    assert stream.fields == {
+        name: value for name, value in payload.items() if name != "list"
+    }
+
+
+@pytest.mark.parametrize("text, items, fields", [
+    ('{}', [], {}),
+    (' { "list" : [ ] , "cod" : "200" } ', [], {"cod": "200"}),
+    ('{"cod": "404", "message": "city not found"}', [],
+     {"cod": "404", "message": "city not found"}),
+    ('{"list": [1, -2.5e3, "x", null, [true]]}', [1, -2500.0, "x", None,
+                                                  [True]], {}),
+    # anything but an array is a plain field
+    ('{"list": {"a": 1}}', [], {"list": {"a": 1}}),
+])
+def test_shapes(text, items, fields):
+    stream = jsonstream.ObjectStream(chunked(text.encode("utf-8"), 2), "list")
+
+    assert list(stream) == items
+    assert stream.fields == fields
+
+
+@pytest.mark.parametrize("text", [
+    "<html></html>",
+    '{"list": [1, 2',
+    '{"list": [1 2]}',
+    '{"cod": }',
+    '{1: 2}',
+    '',
+])
+def test_invalid(text):
+    stream = jsonstream.ObjectStream(chunked(text.encode("utf-8"), 3), "list")
+
+    with pytest.raises(ValueError):
+        list(stream)
+
+
+def test_buffer_stays_bounded(monkeypatch):
+    monkeypatch.setattr(jsonstream, "COMPACT_THRESHOLD", 1024)
+
+    item = {"description": "x" * 100}
+    data = json.dumps({"list": [item] * 1000}).encode("utf-8")
+
+    stream = jsonstream.ObjectStream(chunked(data, 256), "list")
+    longest = 0
+
+    for parsed in stream:
+        assert parsed == item
+        longest = max(longest, len(stream.buffer))
+
+    assert longest < 2 * 1024
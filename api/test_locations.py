@@ -0,0 +1,125 @@
+import datetime
+import importlib
+
+import pytest
+import pytz
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import locations, models, openweather
+
+
+@pytest.mark.parametrize("location, normalized", [
+    ("Berlin,DE", "berlin,de"),
+    ("  berlin ,  de ", "berlin,de"),
+    ("Berlin,,DE,", "berlin,de"),
+    ("New   York, US", "new york,us"),
+    ("London,UK", "london,gb"),
+    ("UK", "uk"),
+    ("Ｂｅｒｌｉｎ，ＤＥ", "berlin,de"),
+    ("Straße", "strasse"),
+])
+def test_normalize_location(location, normalized):
+    assert locations.normalize_location(location) == normalized
+
+
+@pytest.mark.django_db
+def test_spellings_share_a_city(upstream_calls, now_slot):
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    for location in ("Berlin,DE", "berlin,de", " Berlin , DE "):
+        openweather.get_forecast(location, timestamp, auto_update=True)
+
+    assert upstream_calls == ["Berlin,DE"]
+    assert models.CitySearchResult.objects.get().search == "berlin,de"
+
+
+@pytest.mark.django_db
+def test_aliases_are_resolved_in_memory(upstream_calls, now_slot):
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    city = openweather.add_forecasts("Berlin,DE").instance
+
+    locations.aliases.load()
+
+    with CaptureQueriesContext(connection) as queries:
+        assert openweather.get_city("BERLIN,DE") == city
+
+    # just the city itself
+    assert len(queries) == 1
+
+    # added by another process
+    models.CitySearchResult.objects.create(search="berlin", city=city)
+
+    assert locations.aliases.get("berlin") == city.id
+    assert locations.aliases.get("hamburg") is None
+
+    openweather.get_forecast_cache().clear()
+
+    models.CitySearchResult.objects.filter(search="berlin,de").delete()
+
+    # still known by its name
+    assert openweather.get_city("Berlin,DE") == city
+    assert openweather.get_city("Berlin") == city
+
+    city.delete()
+
+    assert openweather.get_city("Berlin") is None
+    assert openweather.get_forecast(
+        "Berlin,DE",
+        timestamp,
+        auto_update=True
+    ).city.searches.get().search == "berlin,de"
+
+
+@pytest.mark.django_db
+def test_fold_searches():
+    migration = importlib.import_module(
+        "api.migrations.0006_normalize_searches"
+    )
+
+    berlin, hamburg = [
+        models.City.objects.create(
+            ref=ref,
+            name=name,
+            latitude=0,
+            longitude=0,
+            country_code="DE"
+        )
+        for ref, name in ((1, "Berlin"), (2, "Hamburg"))
+    ]
+
+    for search, city, count, day in (
+        ("Berlin,DE", berlin, 3, 1),
+        ("berlin,de", hamburg, 1, 3),
+        (" Berlin , DE", berlin, 5, None),
+        ("hamburg", hamburg, 2, 2),
+        ("Hamburg", hamburg, 0, None),
+        ("London,UK", berlin, 0, None),
+    ):
+        models.CitySearchResult.objects.create(
+            search=search,
+            city=city,
+            request_count=count,
+            last_requested_at=day and datetime.datetime(
+                2018, 7, day, tzinfo=pytz.UTC
+            )
+        )
+
+    migration.fold_searches(apps, None)
+
+    searches = {
+        search.search: search
+        for search in models.CitySearchResult.objects.all()
+    }
+
+    assert sorted(searches) == ["berlin,de", "hamburg", "london,gb"]
+
+    assert searches["berlin,de"].city == berlin
+    assert searches["berlin,de"].request_count == 9
+    assert searches["berlin,de"].last_requested_at.day == 3
+
+    assert searches["hamburg"].request_count == 2
+    assert searches["hamburg"].last_requested_at.day == 2
@@ -0,0 +1,109 @@
+import json
+import logging
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import log, openweather
+
+
+@pytest.fixture
+def log_level():
+    """Set the level of the api log for a test."""
+    level = log.logger.level
+
+    yield log.logger.setLevel
+
+    log.logger.setLevel(level)
+
+
+@pytest.fixture
+def request_records():
+    """Collect the structured records of the request log."""
+    records = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    handler = Handler()
+    log.request_logger.addHandler(handler)
+
+    yield records
+
+    log.request_logger.removeHandler(handler)
+
+
+@pytest.mark.django_db
+def test_lookup_queries(client, upstream_calls, weather_url, log_level):
+    log_level(logging.INFO)
+
+    url = weather_url()
+    client.get(url)
+
+    # a cache hit doesn't touch the DB
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).json()["status"] == "success"
+
+    assert len(queries) == 0
+
+    # a cache miss of a known location looks up the city and its forecast,
+    # no matter the log level
+    for level in (logging.INFO, logging.DEBUG):
+        log_level(level)
+
+        openweather.response_cache.clear()
+        openweather.get_forecast_cache().clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            assert client.get(url).json()["status"] == "success"
+
+        assert len(queries) == 2
+
+    assert upstream_calls == ["Berlin,DE"]
+
+
+def test_response_body_is_only_logged_for_debug(log_level):
+
+    class Response(object):
+        url = "http://api.openweathermap.org/data/2.5/forecast"
+
+        @property
+        def text(self):
+            raise AssertionError("The body has been decoded.")
+
+        def json(self):
+            return {"cod": "200"}
+
+    log_level(logging.INFO)
+
+    assert openweather.parse_response(Response()) == {"cod": "200"}
+
+    log_level(logging.DEBUG)
+
+    with pytest.raises(AssertionError):
+        openweather.parse_response(Response())
+
+
+@pytest.mark.django_db
+def test_sampled_request_log(client, upstream_calls, weather_url, settings,
+                             request_records):
+    settings.FORECAST_REQUEST_LOG_SAMPLE_RATE = 0
+
+    client.get(weather_url())
+
+    assert request_records == []
+
+    settings.FORECAST_REQUEST_LOG_SAMPLE_RATE = 1
+
+    client.get(weather_url())
+
+    record, = request_records
+
+    assert record.request == json.loads(record.getMessage())
+    assert record.request["view"] == "weather"
+    assert record.request["status"] == 200
+    assert record.request["db_queries"] == 0
+    assert record.request["duration_ms"] > 0
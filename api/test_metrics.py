@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from django.core.handlers.wsgi import WSGIHandler
+
+from . import asgi, metrics, openweather, upstream
+from .testdata.server import StubResponse
+
+
+def parse(text):
+    """Get the samples of a rendered registry by "name{labels}"."""
+    samples = {}
+
+    for line in text.decode("utf-8").splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+
+    return samples
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry to create metrics in."""
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def test_counter(registry):
+    counter = metrics.Counter("calls_total", "Calls.", ("type",))
+
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    counter.inc('say "hi"\n')
+
+    assert parse(registry.render()) == {
+        'calls_total{type="a"}': 3,
+        'calls_total{type="say \\"hi\\"\\n"}': 1
+    }
+    assert b"# TYPE calls_total counter" in registry.render()
+
+
+def test_histogram(registry):
+    histogram = metrics.Histogram("duration_seconds", "Time.", (0.1, 1))
+
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+
+    assert parse(registry.render()) == {
+        'duration_seconds_bucket{le="0.1"}': 2,
+        'duration_seconds_bucket{le="1.0"}': 3,
+        'duration_seconds_bucket{le="+Inf"}': 4,
+        "duration_seconds_sum": pytest.approx(3.65),
+        "duration_seconds_count": 4
+    }
+
+    @histogram.time()
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        fail()
+
+    assert histogram.get_count() == 5
+
+
+def test_collector(registry):
+    values = {("hit",): 2}
+
+    metrics.Collector("lookups_total", "Lookups.", "counter",
+                      lambda: values, ("result",))
+
+    assert parse(registry.render()) == {'lookups_total{result="hit"}': 2}
+
+    values[("miss",)] = 1
+
+    assert parse(registry.render())['lookups_total{result="miss"}'] == 1
+
+
+def test_disabled(registry, settings):
+    counter = metrics.Counter("calls_total", "Calls.")
+
+    settings.FORECAST_METRICS = False
+    counter.inc()
+
+    assert counter.get() == 0
+
+
+@pytest.mark.django_db
+def test_request_metrics(client, upstream_calls, weather_url):
+    requests = metrics.request_seconds.get_count("weather")
+    lookups = metrics.stage_seconds.get_count("get_forecast")
+    misses = metrics.forecast_cache_requests.get("miss")
+    errors = metrics.errors.get("ValueError")
+
+    client.get(weather_url())
+    client.get(weather_url(slots=100))
+
+    assert metrics.request_seconds.get_count("weather") == requests + 2
+    assert metrics.stage_seconds.get_count("get_forecast") == lookups + 2
+    assert metrics.forecast_cache_requests.get("miss") == misses + 1
+    assert metrics.errors.get("ValueError") == errors + 1
+
+    response = client.get("/metrics")
+
+    assert response["Content-Type"] == metrics.CONTENT_TYPE
+
+    samples = parse(response.content)
+
+    assert samples[
+        'http_request_duration_seconds_count{view="weather"}'
+    ] == requests + 2
+    assert samples['http_request_db_queries_bucket{view="weather",le="+Inf"}']
+    assert 'forecast_response_cache_requests_total{result="miss"}' in samples
+    assert "forecast_response_cache_evictions_total" in samples
+
+
+@pytest.mark.django_db
+def test_upstream_metrics(stub_server, settings, payload):
+    settings.OPENWEATHERMAPORG_MAX_RETRIES = 0
+
+    stub_server.enqueue(StubResponse({"cod": 502}, 502))
+    stub_server.default = StubResponse(payload)
+
+    queries = metrics.upstream_seconds.get_count()
+    errors = metrics.upstream_errors.get("UpstreamError")
+
+    with pytest.raises(upstream.UpstreamError):
+        openweather.query("Berlin,DE")
+
+    openweather.query("Berlin,DE")
+
+    assert metrics.upstream_seconds.get_count() == queries + 2
+    assert metrics.upstream_errors.get("UpstreamError") == errors + 1
+
+
+def test_asgi_serves_metrics(settings):
+    loop = asyncio.new_event_loop()
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    app = asgi.ForecastApplication(WSGIHandler())
+
+    try:
+        loop.run_until_complete(app(
+            {
+                "type": "http",
+                "method": "GET",
+                "path": "/metrics",
+                "query_string": b"",
+                "headers": [(b"host", b"testserver")]
+            },
+            receive,
+            send
+        ))
+
+    finally:
+        loop.close()
+
+    start, body = messages
+
+    assert start["status"] == 200
+    assert b"# TYPE forecast_stage_seconds histogram" in body["body"]
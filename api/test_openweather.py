@@ -0,0 +1,222 @@
+import datetime
+
+import pytest
+import pytz
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+
+from . import models, openweather
+
+
+@pytest.mark.django_db
+def test_add_forecasts_creates_city_and_forecasts(upstream_calls, payload):
+
+    forecasts = openweather.add_forecasts("Berlin,DE")
+
+    assert upstream_calls == ["Berlin,DE"]
+    assert forecasts.count() == len(payload["list"])
+
+    city = models.City.objects.get()
+    assert city.ref == payload["city"]["id"]
+    assert city.searches.get().search == "berlin,de"
+
+    first = forecasts.order_by("timestamp").first()
+    assert first.timestamp.strftime(openweather.DATETIME_FORMAT) == \
+        payload["list"][0]["dt_txt"]
+    assert first.temperature == pytest.approx(
+        models.kelvin_to_celsius(payload["list"][0]["main"]["temp"])
+    )
+
+
+@pytest.mark.django_db
+def test_add_forecasts_updates_known_slots(upstream_calls, payload):
+
+    openweather.add_forecasts("Berlin,DE")
+
+    payload["list"][0]["main"]["temp"] += 10
+    payload["list"][1]["weather"] = [{"description": "thunderstorm"}]
+
+    with CaptureQueriesContext(connection) as queries:
+        openweather.add_forecasts("Berlin,DE")
+
+    assert models.Forecast.objects.count() == len(payload["list"])
+
+    forecasts = models.Forecast.objects.order_by("timestamp")
+    assert forecasts[0].temperature == pytest.approx(
+        models.kelvin_to_celsius(payload["list"][0]["main"]["temp"]),
+        abs=0.005
+    )
+    assert forecasts[1].description == "thunderstorm"
+
+    # the call budget, city, search result, the lookup and insert of the new
+    # condition, existing forecasts, one batched update, the city's fetch
+    # time and the searches to invalidate cached lookups for - no matter how
+    # many slots the upstream reported
+    statements = [
+        query["sql"] for query in queries.captured_queries
+        if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+    ]
+    assert len(statements) == 9
+
+
+@pytest.mark.django_db
+def test_forecasts_are_stored_compactly(upstream_calls, payload):
+
+    payload["list"][0]["main"]["temp"] = 294.12345
+    payload["list"][1]["weather"] = payload["list"][0]["weather"]
+
+    parsed = openweather.parse_forecast(payload["list"][0])
+    openweather.add_forecasts("Berlin,DE")
+
+    # one condition per description
+    descriptions = set(
+        ", ".join(condition["description"] for condition in data["weather"])
+        for data in payload["list"]
+    )
+    assert set(
+        models.Condition.objects.values_list("description", flat=True)
+    ) == descriptions
+
+    forecasts = models.Forecast.objects.order_by("timestamp")
+    assert forecasts[0].condition_id == forecasts[1].condition_id
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT timestamp, temperature, pressure, humidity "
+            "FROM api_forecast ORDER BY timestamp"
+        )
+        row = cursor.fetchone()
+
+    assert all(isinstance(value, int) for value in row)
+    assert row[0] == int(parsed.timestamp.timestamp())
+    assert row[1] == 2097
+
+    # served the same, whether parsed or stored
+    assert parsed.temperature == 20.97
+    assert openweather.serialize_forecast(forecasts[0]) == \
+        openweather.serialize_forecast(parsed)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_compact_forecasts_migration():
+    executor = MigrationExecutor(connection)
+    before = [("api", "0008_forecastarchive")]
+    after = [("api", "0009_compact_forecasts")]
+
+    executor.migrate(before)
+    old_apps = executor.loader.project_state(before).apps
+
+    city = old_apps.get_model("api", "City").objects.create(
+        ref=1,
+        name="Berlin",
+        latitude=0,
+        longitude=0,
+        country_code="DE"
+    )
+    timestamp = datetime.datetime(2018, 7, 18, 18, tzinfo=pytz.UTC)
+
+    old_apps.get_model("api", "Forecast").objects.bulk_create(
+        old_apps.get_model("api", "Forecast")(
+            city=city,
+            timestamp=timestamp + datetime.timedelta(hours=3 * index),
+            description=description,
+            temperature=temperature,
+            pressure=1012.34,
+            humidity=56.7
+        )
+        for index, (description, temperature) in enumerate([
+            ("light rain", 21.97),
+            ("clear sky", -3.5),
+            ("light rain", 0.004)
+        ])
+    )
+
+    try:
+        executor.loader.build_graph()
+        executor.migrate(after)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT f.timestamp, c.description, f.temperature, "
+                "f.pressure, f.humidity FROM api_forecast f "
+                "JOIN api_condition c ON c.id = f.condition_id "
+                "ORDER BY f.timestamp"
+            )
+            rows = cursor.fetchall()
+
+        epoch = int(timestamp.timestamp())
+
+        assert rows == [
+            (epoch, "light rain", 2197, 101234, 567),
+            (epoch + 3 * 3600, "clear sky", -350, 101234, 567),
+            (epoch + 6 * 3600, "light rain", 0, 101234, 567)
+        ]
+
+        executor.loader.build_graph()
+        executor.migrate(before)
+
+        forecasts = executor.loader.project_state(before).apps.get_model(
+            "api",
+            "Forecast"
+        ).objects.order_by("timestamp")
+
+        assert [
+            (
+                forecast.timestamp,
+                forecast.description,
+                forecast.temperature,
+                forecast.pressure,
+                forecast.humidity
+            )
+            for forecast in forecasts
+        ] == [
+            (timestamp, "light rain", 21.97, 1012.34, 56.7),
+            (
+                timestamp + datetime.timedelta(hours=3),
+                "clear sky",
+                -3.5,
+                1012.34,
+                56.7
+            ),
+            (
+                timestamp + datetime.timedelta(hours=6),
+                "light rain",
+                0,
+                1012.34,
+                56.7
+            )
+        ]
+
+    finally:
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+@pytest.mark.django_db
+def test_add_forecasts_skips_invalid_slots(upstream_calls, payload):
+
+    payload["list"][0]["dt_txt"] = "not a timestamp"
+
+    forecasts = openweather.add_forecasts("Berlin,DE")
+
+    assert forecasts.count() == len(payload["list"]) - 1
+
+
+@pytest.mark.django_db
+def test_add_forecasts_raises_on_upstream_error(monkeypatch):
+
+    monkeypatch.setattr(
+        openweather,
+        "query",
+        lambda location, *args, **kwargs: {
+            "cod": "404",
+            "message": "city not found"
+        }
+    )
+
+    with pytest.raises(RuntimeError):
+        openweather.add_forecasts("Nowhere")
+
+    assert not models.City.objects.exists()
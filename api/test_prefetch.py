@@ -0,0 +1,273 @@
+import datetime
+import time
+
+import pytest
+import pytz
+
+from django.core.management import call_command
+
+from . import models, openweather, prefetch
+
+
+def make_city(ref, fetched_at=None):
+    return models.City.objects.create(
+        ref=ref,
+        name="City {}".format(ref),
+        latitude=0,
+        longitude=0,
+        country_code="DE",
+        fetched_at=fetched_at
+    )
+
+
+def make_search(search, city, request_count, requested_at=None):
+    return models.CitySearchResult.objects.create(
+        search=openweather.normalize_location(search),
+        city=city,
+        request_count=request_count,
+        last_requested_at=requested_at or datetime.datetime.now(tz=pytz.UTC)
+    )
+
+
+@pytest.fixture
+def now():
+    return datetime.datetime.now(tz=pytz.UTC)
+
+
+@pytest.mark.django_db
+def test_tracker_flushes_counts():
+    city = make_city(1)
+    make_search("Berlin,DE", city, 3, requested_at=datetime.datetime(
+        2018, 7, 30, tzinfo=pytz.UTC
+    ))
+
+    tracker = prefetch.RequestTracker(flush_interval=60)
+
+    for _ in range(2):
+        tracker.track("Berlin,DE")
+    tracker.track("Nowhere")
+
+    assert models.CitySearchResult.objects.get().request_count == 3
+    assert tracker.flush() == 2
+
+    search = models.CitySearchResult.objects.get()
+    assert search.request_count == 5
+    assert search.last_requested_at.year > 2018
+
+    assert tracker.flush() == 0
+
+
+def test_budget():
+    budget = prefetch.CallBudget(2, period=60)
+
+    assert budget.acquire()
+    assert budget.acquire()
+    assert not budget.acquire()
+
+    budget = prefetch.CallBudget(1, period=0)
+
+    assert budget.acquire()
+    assert budget.acquire()
+
+
+@pytest.mark.django_db
+def test_due_locations(now):
+    stale = now - openweather.FORECAST_MAX_AGE
+    fresh = now
+
+    berlin = make_city(1, fetched_at=stale)
+    make_search("Berlin,DE", berlin, 10)
+    make_search("berlin", berlin, 5)
+
+    hamburg = make_city(2, fetched_at=fresh)
+    make_search("Hamburg,DE", hamburg, 20)
+
+    munich = make_city(3)
+    make_search("Munich,DE", munich, 7)
+
+    # stale, but not requested lately
+    bonn = make_city(4, fetched_at=stale)
+    make_search("Bonn,DE", bonn, 100, requested_at=now - datetime.timedelta(
+        days=2
+    ))
+
+    window = datetime.timedelta(days=1)
+    lead = datetime.timedelta(minutes=30)
+
+    assert prefetch.get_due_locations(10, window, lead) == [
+        "berlin,de",
+        "munich,de"
+    ]
+
+    # Hamburg is the most requested one, but still fresh
+    assert prefetch.get_due_locations(2, window, lead) == ["berlin,de"]
+
+    # within the lead time, Hamburg is due as well
+    assert prefetch.get_due_locations(
+        10,
+        window,
+        openweather.FORECAST_MAX_AGE
+    ) == ["hamburg,de", "berlin,de", "munich,de"]
+
+
+@pytest.mark.django_db
+def test_confirmed_locations_are_due_by_their_check(now):
+    stale = now - openweather.FORECAST_MAX_AGE
+
+    berlin = make_city(1, fetched_at=stale)
+    make_search("Berlin,DE", berlin, 10)
+
+    window = datetime.timedelta(days=1)
+    lead = datetime.timedelta(minutes=30)
+
+    assert prefetch.get_due_locations(10, window, lead) == ["berlin,de"]
+
+    # a bulk refresh has just confirmed its forecasts
+    models.City.objects.update(checked_at=now)
+
+    assert prefetch.get_due_locations(10, window, lead) == []
+
+    models.City.objects.update(checked_at=stale)
+
+    assert prefetch.get_due_locations(10, window, lead) == ["berlin,de"]
+
+
+@pytest.mark.django_db
+def test_due_locations_are_ranked_by_recent_requests(now):
+    stale = now - openweather.FORECAST_MAX_AGE
+
+    # popular months ago, requested once today
+    make_search("Berlin,DE", make_city(1, fetched_at=stale), 1000)
+    make_search("Munich,DE", make_city(2, fetched_at=stale), 0)
+
+    tracker = prefetch.RequestTracker(flush_interval=60)
+
+    tracker.track("Berlin,DE")
+    for _ in range(3):
+        tracker.track("Munich,DE")
+    tracker.flush()
+
+    window = datetime.timedelta(days=1)
+    lead = datetime.timedelta(minutes=30)
+
+    assert prefetch.get_due_locations(10, window, lead) == [
+        "munich,de",
+        "berlin,de"
+    ]
+
+
+@pytest.mark.django_db
+def test_tracker_moves_on_to_the_next_window(settings):
+    search = make_search("Berlin,DE", make_city(1), 0)
+
+    current = prefetch.get_window(
+        datetime.datetime.now(tz=pytz.UTC),
+        settings.FORECAST_PREFETCH_WINDOW
+    )
+    tracker = prefetch.RequestTracker(flush_interval=60)
+
+    def flush(window, count):
+        models.CitySearchResult.objects.update(window=window)
+
+        for _ in range(count):
+            tracker.track("Berlin,DE")
+        tracker.flush()
+
+        search.refresh_from_db()
+        return search.window_count, search.previous_window_count
+
+    models.CitySearchResult.objects.update(window_count=5)
+    assert flush(current - 1, 2) == (2, 5)
+    assert flush(current, 3) == (5, 5)
+    assert flush(current - 2, 1) == (1, 0)
+    assert search.request_count == 6
+
+
+@pytest.fixture
+def city_upstream(monkeypatch, payload):
+    """Answer queries with the payload for the city searched for."""
+    calls = []
+
+    def fake_query(location, *args, **kwargs):
+        calls.append(location)
+
+        search = models.CitySearchResult.objects \
+            .select_related("city") \
+            .get(search=location)
+
+        return dict(payload, city=dict(payload["city"], id=search.city.ref))
+
+    monkeypatch.setattr(openweather, "query", fake_query)
+
+    return calls
+
+
+@pytest.mark.django_db
+def test_prefetch_respects_budget(city_upstream, now):
+    for ref, search in enumerate(["Berlin,DE", "Munich,DE", "Bonn,DE"]):
+        make_search(search, make_city(ref), 10 - ref)
+
+    budget = prefetch.CallBudget(2)
+
+    assert prefetch.prefetch(budget) == (2, 0, 1)
+    assert city_upstream == ["berlin,de", "munich,de"]
+
+    # refreshed cities are fresh, the remaining one has to wait for budget
+    assert prefetch.prefetch(budget) == (0, 0, 1)
+    assert prefetch.prefetch(prefetch.CallBudget(2)) == (1, 0, 0)
+
+    assert prefetch.prefetch(prefetch.CallBudget(2)) == (0, 0, 0)
+
+
+@pytest.mark.django_db
+def test_prefetch_command(upstream_calls, payload):
+    make_search("Berlin,DE", make_city(payload["city"]["id"]), 1)
+
+    call_command("prefetch_forecasts", "--budget", "1")
+
+    assert upstream_calls == ["berlin,de"]
+    assert models.City.objects.get().fetched_at is not None
+
+
+@pytest.mark.django_db
+def test_prefetch_command_without_bulk(upstream_calls, payload, settings):
+    make_search("Berlin,DE", make_city(payload["city"]["id"]), 1)
+
+    settings.FORECAST_PREFETCH_BULK = True
+
+    call_command("prefetch_forecasts", "--budget", "1", "--no-bulk")
+
+    assert upstream_calls == ["berlin,de"]
+
+
+@pytest.mark.django_db
+def test_weather_tracks_requests(client, upstream_calls, weather_url,
+                                 monkeypatch):
+    monkeypatch.setattr(
+        prefetch,
+        "tracker",
+        prefetch.RequestTracker(flush_interval=60)
+    )
+
+    client.get(weather_url())
+    client.get(weather_url())
+
+    # nothing is written while requests are answered
+    assert models.CitySearchResult.objects.get().request_count == 0
+
+    assert prefetch.tracker.flush() == 1
+    assert models.CitySearchResult.objects.get().request_count == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tracker_flushes_in_background():
+    make_search("Berlin,DE", make_city(1), 0)
+
+    tracker = prefetch.RequestTracker(flush_interval=0)
+
+    tracker.track("Berlin,DE")
+
+    while tracker.flusher is not None:
+        time.sleep(0.01)
+
+    assert models.CitySearchResult.objects.get().request_count == 1
@@ -0,0 +1,99 @@
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import models, openweather
+
+
+def range_url(from_datetime, to_datetime, data_type="summary",
+              location="Berlin,DE"):
+    return reverse(
+        "weather-range",
+        kwargs={
+            "data_type": data_type,
+            "location": location,
+            "from_datetime": from_datetime,
+            "to_datetime": to_datetime
+        }
+    )
+
+
+@pytest.mark.django_db
+def test_range(client, upstream_calls, now_slot):
+    slot = openweather.FORECAST_MAX_AGE
+    url = range_url(now_slot + slot, now_slot + 4 * slot)
+
+    response = client.get(url)
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["status"] == "success"
+    assert upstream_calls == ["Berlin,DE"]
+
+    forecasts = openweather.get_forecast("Berlin,DE", now_slot + slot) \
+        .city.forecasts.filter(
+            timestamp__range=(now_slot + slot, now_slot + 4 * slot)
+        ).order_by("timestamp")
+
+    assert data["forecasts"] == [
+        openweather.serialize_forecast(forecast) for forecast in forecasts
+    ]
+    assert len(data["forecasts"]) == 4
+
+    # known forecasts are served by a single query
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).json() == data
+
+    assert len(queries) == 2
+    assert upstream_calls == ["Berlin,DE"]
+
+
+@pytest.mark.django_db
+def test_range_partial(client, upstream_calls, now_slot):
+    slot = openweather.FORECAST_MAX_AGE
+    url = range_url(now_slot + slot, now_slot + 2 * slot, "temperature")
+
+    data = client.get(url, {"temp_scale": "f"}).json()
+
+    forecast = openweather.get_forecast("Berlin,DE", now_slot + slot)
+
+    assert data["forecasts"][0] == {
+        "status": "success",
+        "timestamp": forecast.timestamp.strftime(openweather.DATETIME_FORMAT),
+        "value": forecast.get_temperature(models.UNIT_FAHRENHEIT),
+        "unit": models.UNIT_FAHRENHEIT
+    }
+    assert len(data["forecasts"]) == 2
+
+
+@pytest.mark.django_db
+def test_range_errors(client, upstream_calls, now_slot):
+    slot = openweather.FORECAST_MAX_AGE
+
+    # the end before the start
+    data = client.get(range_url(now_slot + 2 * slot, now_slot + slot)).json()
+    assert data["status"] == "error"
+
+    # completely beyond the forecast window
+    data = client.get(
+        range_url(
+            now_slot + 2 * openweather.FORECAST_MAX_WINDOW,
+            now_slot + 3 * openweather.FORECAST_MAX_WINDOW
+        )
+    ).json()
+    assert data["status"] == "error"
+
+    # past ranges of unknown locations aren't fetched
+    data = client.get(
+        range_url(now_slot - 4 * slot, now_slot - 2 * slot)
+    ).json()
+    assert data == {"status": "success", "forecasts": []}
+
+    assert upstream_calls == []
+
+    response = client.get(
+        range_url(now_slot + slot, now_slot + 2 * slot, "invalid")
+    )
+    assert response.status_code == 404
@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from . import renderers
+
+DATA = {
+    "status": "success",
+    "timestamp": "2018-07-18 18:00:00",
+    "description": "light rain, mist\u2028\u2029",
+    "temperature": {"value": 21, "unit": "C"},
+    "pressure": {"value": 1012.5, "unit": "hPa"},
+    "message": gettext_lazy("Not found."),
+    "fetched_at": datetime.datetime(2018, 7, 18, 18, 0),
+}
+
+
+def test_fallback_renders_like_json_renderer(monkeypatch):
+    monkeypatch.setattr(renderers, "orjson", None)
+
+    assert renderers.render(DATA) == JSONRenderer().render(DATA)
+
+
+@pytest.mark.skipif(renderers.orjson is None, reason="orjson not installed")
+def test_orjson_renders_the_same_data():
+    import json
+
+    assert json.loads(renderers.render(DATA).decode("utf-8")) == \
+        json.loads(JSONRenderer().render(DATA).decode("utf-8"))
+
+
+def test_indented_json_takes_the_json_renderer():
+    renderer = renderers.FastJSONRenderer()
+
+    assert renderer.render(None) == b""
+    assert renderer.render(DATA, "application/json; indent=4") == \
+        JSONRenderer().render(DATA, "application/json; indent=4")
+    assert renderer.render(DATA, renderer_context={"indent": 2}) == \
+        JSONRenderer().render(DATA, renderer_context={"indent": 2})
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("accept, params, content_type", [
+    (None, {}, "application/json"),
+    ("*/*", {}, "application/json"),
+    ("application/json", {}, "application/json"),
+    ("text/html,application/xhtml+xml,*/*;q=0.8", {}, "text/html"),
+    (None, {"format": "api"}, "text/html"),
+    ("application/json; indent=2", {}, "application/json"),
+])
+def test_content_negotiation(client, upstream_calls, weather_url, accept,
+                             params, content_type):
+    headers = {} if accept is None else {"HTTP_ACCEPT": accept}
+
+    response = client.get(weather_url(), params, **headers)
+
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith(content_type)
+
+
+@pytest.mark.django_db
+def test_unsupported_media_type_is_not_acceptable(client, upstream_calls,
+                                                  weather_url):
+    response = client.get(weather_url(), HTTP_ACCEPT="application/xml")
+
+    assert response.status_code == 406
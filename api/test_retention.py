@@ -0,0 +1,141 @@
+import datetime
+
+import pytest
+import pytz
+
+from django.core.management import call_command
+
+from . import models, retention
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def city():
+    return models.City.objects.create(
+        name="Berlin",
+        latitude=52.52,
+        longitude=13.41,
+        country_code="DE"
+    )
+
+
+@pytest.fixture
+def start():
+    """Midnight, 10 days ago."""
+    now = datetime.datetime.now(tz=pytz.UTC)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0) \
+        - datetime.timedelta(days=10)
+
+
+def add_forecasts(city, start, count):
+    models.Forecast.objects.bulk_create(
+        models.Forecast(
+            city=city,
+            timestamp=start + index * datetime.timedelta(hours=3),
+            description="clear sky",
+            temperature=index,
+            pressure=1000 + index,
+            humidity=50
+        )
+        for index in range(count)
+    )
+
+
+def test_max_age(city, start):
+    # 10 days of forecasts, ending today
+    add_forecasts(city, start, 80)
+
+    removed = retention.compact(
+        max_age=5 * 24 * 60 * 60,
+        max_per_city=None,
+        batch_size=7,
+        archive=False
+    )
+
+    oldest = datetime.datetime.now(tz=pytz.UTC) - datetime.timedelta(days=5)
+
+    assert removed == 80 - city.forecasts.count()
+    assert removed > 0
+    assert not city.forecasts.filter(timestamp__lt=oldest).exists()
+    assert city.forecasts.filter(
+        timestamp__lt=oldest + datetime.timedelta(hours=3)
+    ).exists()
+    assert not models.ForecastArchive.objects.exists()
+
+
+def test_max_per_city(city, start):
+    add_forecasts(city, start, 20)
+
+    other = models.City.objects.create(
+        name="Hamburg",
+        latitude=53.55,
+        longitude=10.0,
+        country_code="DE"
+    )
+    add_forecasts(other, start, 5)
+
+    removed = retention.compact(
+        max_age=None,
+        max_per_city=8,
+        batch_size=5,
+        archive=False
+    )
+
+    assert removed == 12
+    assert city.forecasts.count() == 8
+    assert other.forecasts.count() == 5
+    assert min(city.forecasts.values_list("timestamp", flat=True)) == \
+        start + 12 * datetime.timedelta(hours=3)
+
+
+def test_archive(city, start):
+    # 3 days of forecasts
+    add_forecasts(city, start, 24)
+
+    # archived in batches that split the days, and in two runs
+    retention.compact(max_age=None, max_per_city=20, batch_size=3,
+                      archive=True)
+    retention.compact(max_age=None, max_per_city=0, batch_size=5,
+                      archive=True)
+
+    assert not city.forecasts.exists()
+
+    days = list(city.archived_forecasts.order_by("date"))
+
+    assert [day.date for day in days] == [
+        (start + datetime.timedelta(days=offset)).date()
+        for offset in range(3)
+    ]
+    assert [day.samples for day in days] == [8, 8, 8]
+    assert days[1].temperature_min == 8
+    assert days[1].temperature_max == 15
+    assert days[1].get_mean("temperature") == 11.5
+    assert days[1].get_mean("pressure") == 1011.5
+    assert days[1].get_mean("humidity") == 50
+
+
+def test_command(city, start, capsys):
+    add_forecasts(city, start, 10)
+
+    call_command("compact_forecasts", "--max-per-city", "4")
+
+    assert city.forecasts.count() == 4
+    assert "6 forecasts removed in" in capsys.readouterr().out
+
+
+def test_command_without_archive(city, start, settings):
+    add_forecasts(city, start, 10)
+
+    settings.FORECAST_RETENTION_ARCHIVE = True
+
+    call_command("compact_forecasts", "--max-per-city", "4", "--no-archive")
+
+    assert city.forecasts.count() == 4
+    assert not models.ForecastArchive.objects.exists()
+
+    add_forecasts(city, start - datetime.timedelta(days=10), 10)
+
+    call_command("compact_forecasts", "--max-per-city", "4")
+
+    assert models.ForecastArchive.objects.exists()
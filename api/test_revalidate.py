@@ -0,0 +1,139 @@
+import datetime
+
+import pytest
+import pytz
+
+from . import models, openweather
+
+
+@pytest.fixture
+def stale_while_revalidate(settings):
+    settings.FORECAST_STALE_WHILE_REVALIDATE = True
+    settings.FORECAST_STALE_AFTER = 60 * 60
+    settings.FORECAST_MAX_STALENESS = 6 * 60 * 60
+
+
+def age_city(hours):
+    models.City.objects.update(
+        fetched_at=datetime.datetime.now(tz=pytz.UTC) -
+        datetime.timedelta(hours=hours)
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_serves_stale_forecasts_while_revalidating(
+        stale_while_revalidate, upstream_calls, payload, now_slot,
+        monkeypatch):
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    openweather.add_forecasts("Berlin,DE")
+    age_city(hours=2)
+
+    payload["list"][0]["main"]["temp"] += 10
+
+    futures = []
+    revalidate = openweather.revalidate
+
+    def track_revalidate(*args):
+        futures.append(revalidate(*args))
+        return futures[-1]
+
+    monkeypatch.setattr(openweather, "revalidate", track_revalidate)
+
+    stale = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    assert stale.stale
+    assert openweather.serialize_forecast(stale)["stale"] is True
+    assert len(futures) == 1
+
+    futures[0].result()
+    assert len(upstream_calls) == 2
+
+    fresh = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    assert not getattr(fresh, "stale", False)
+    assert "stale" not in openweather.serialize_forecast(fresh)
+    assert fresh.temperature == pytest.approx(stale.temperature + 10)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_revalidates_each_city_once(stale_while_revalidate, monkeypatch):
+
+    city = models.City(id=1)
+    started = []
+
+    def slow_refresh(location, priority):
+        started.append(location)
+        # the first revalidation is still running, while the second one is
+        # requested
+        assert openweather.revalidate("berlin", city) is None
+
+    monkeypatch.setattr(openweather, "refresh_forecasts", slow_refresh)
+
+    openweather.revalidate("Berlin,DE", city).result()
+
+    assert started == ["Berlin,DE"]
+    assert openweather.revalidate("Berlin,DE", city).result() is None
+    assert started == ["Berlin,DE", "Berlin,DE"]
+
+
+@pytest.mark.django_db
+def test_waits_for_forecasts_older_than_max_staleness(
+        stale_while_revalidate, upstream_calls, payload, now_slot):
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    openweather.add_forecasts("Berlin,DE")
+    age_city(hours=12)
+
+    payload["list"][0]["main"]["temp"] += 10
+
+    forecast = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    assert not getattr(forecast, "stale", False)
+    assert len(upstream_calls) == 2
+    assert forecast.temperature == pytest.approx(
+        models.kelvin_to_celsius(payload["list"][0]["main"]["temp"])
+    )
+
+
+@pytest.mark.django_db
+def test_disabled_by_default(upstream_calls, now_slot):
+
+    openweather.add_forecasts("Berlin,DE")
+    age_city(hours=12)
+
+    forecast = openweather.get_forecast(
+        "Berlin,DE",
+        now_slot + openweather.FORECAST_MAX_AGE,
+        True
+    )
+
+    assert not getattr(forecast, "stale", False)
+    assert len(upstream_calls) == 1
+
+
+@pytest.mark.django_db
+def test_stale_responses_are_not_cached(
+        stale_while_revalidate, client, upstream_calls, weather_url,
+        monkeypatch):
+
+    revalidations = []
+    monkeypatch.setattr(
+        openweather,
+        "revalidate",
+        lambda *args: revalidations.append(args)
+    )
+
+    client.get(weather_url())
+
+    age_city(hours=2)
+    openweather.response_cache.clear()
+    openweather.get_forecast_cache().clear()
+
+    for _ in range(2):
+        response = client.get(weather_url("temperature")).json()
+        assert response["stale"] is True
+
+    assert len(revalidations) == 2
@@ -0,0 +1,183 @@
+import datetime
+import threading
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import locations, models, openweather, retention, snapshot
+
+
+@pytest.fixture
+def snapshot_path(settings, tmpdir):
+    settings.FORECAST_SNAPSHOT = True
+    settings.FORECAST_SNAPSHOT_PATH = str(tmpdir.join("forecasts.snapshot"))
+    # rebuilt on the thread of the test, that sees its DB transaction
+    settings.FORECAST_SNAPSHOT_DELAY = None
+
+    return settings.FORECAST_SNAPSHOT_PATH
+
+
+def forget_lookups():
+    """Forget what this process knows, like any other process would."""
+    openweather.get_forecast_cache().clear()
+    locations.aliases.clear()
+
+
+@pytest.mark.django_db
+def test_lookups_are_served_from_snapshot(
+        snapshot_path, upstream_calls, now_slot):
+
+    timestamp = now_slot + 2 * openweather.FORECAST_MAX_AGE
+
+    stored = openweather.get_forecast("Berlin,DE", timestamp, True)
+    forget_lookups()
+
+    with CaptureQueriesContext(connection) as queries:
+        forecast = openweather.get_forecast(
+            " berlin,DE",
+            timestamp + openweather.FORECAST_MAX_AGE / 2,
+            True
+        )
+
+    assert len(queries.captured_queries) == 0
+    assert upstream_calls == ["Berlin,DE"]
+
+    assert openweather.serialize_forecast(forecast) == \
+        openweather.serialize_forecast(stored)
+    assert forecast.max_age == openweather.FORECAST_MAX_AGE.total_seconds()
+
+
+@pytest.mark.django_db
+def test_snapshot_is_replaced_after_ingest(
+        snapshot_path, upstream_calls, payload, now_slot):
+
+    timestamp = now_slot + openweather.FORECAST_MAX_AGE
+
+    before = openweather.get_forecast("Berlin,DE", timestamp, True)
+    first = snapshot.get(snapshot_path)
+
+    payload["list"][0]["main"]["temp"] += 10
+    openweather.add_forecasts("Berlin,DE")
+    forget_lookups()
+
+    with CaptureQueriesContext(connection) as queries:
+        after = openweather.get_forecast("Berlin,DE", timestamp, True)
+
+    assert len(queries.captured_queries) == 0
+    assert after.temperature == pytest.approx(before.temperature + 10)
+
+    # lookups still holding the previous snapshot can finish with it
+    assert snapshot.get(snapshot_path) is not first
+    assert first.find(before.city_id, timestamp, 0)[0].temperature == \
+        before.temperature
+
+
+@pytest.mark.django_db
+def test_snapshot_lookups(snapshot_path, upstream_calls, now_slot):
+
+    openweather.add_forecasts("Berlin,DE")
+
+    city = models.City.objects.get()
+    current = snapshot.get(snapshot_path)
+    max_age = openweather.FORECAST_MAX_AGE.total_seconds()
+
+    first, last = [
+        forecast.timestamp
+        for forecast in (
+            city.forecasts.earliest("timestamp"),
+            city.forecasts.latest("timestamp")
+        )
+    ]
+
+    forecast, fetched_at = current.find(city.id, last, max_age)
+    assert forecast.timestamp == last
+    assert abs((fetched_at - city.fetched_at).total_seconds()) < 0.001
+
+    # up to FORECAST_MAX_AGE after the last one
+    assert current.find(
+        city.id,
+        last + openweather.FORECAST_MAX_AGE,
+        max_age
+    )[0].timestamp == last
+
+    for city_id, timestamp in (
+            (city.id, first - openweather.FORECAST_MAX_AGE / 2),
+            (city.id, last + openweather.FORECAST_MAX_AGE * 2),
+            (city.id + 1, last)):
+
+        assert current.find(city_id, timestamp, max_age) is None
+
+
+def test_invalid_snapshots_are_ignored(tmpdir):
+
+    path = tmpdir.join("forecasts.snapshot")
+
+    assert snapshot.get(str(path)) is None
+
+    path.write_binary(b"not a snapshot")
+
+    assert snapshot.get(str(path)) is None
+
+
+@pytest.mark.django_db
+def test_older_snapshots_dont_replace_newer_ones(snapshot_path,
+                                                 upstream_calls):
+    openweather.add_forecasts("Berlin,DE")
+
+    city = models.City.objects.get()
+    current = snapshot.get(snapshot_path)
+
+    assert current.generation == snapshot.get_generation([city.fetched_at])
+
+    # a rebuild that read the DB before the last refresh
+    models.City.objects.update(
+        fetched_at=city.fetched_at - datetime.timedelta(seconds=1)
+    )
+
+    assert snapshot.write(snapshot_path, city.fetched_at) is None
+    assert snapshot.get(snapshot_path) is current
+
+
+@pytest.mark.django_db
+def test_snapshot_is_rebuilt_after_retention(snapshot_path, upstream_calls,
+                                             now_slot):
+    openweather.add_forecasts("Berlin,DE")
+
+    def forecasts():
+        return len(snapshot.get(snapshot_path).columns["timestamp"])
+
+    before = forecasts()
+
+    retention.compact(max_age=None, max_per_city=before - 1)
+
+    assert forecasts() == before - 1
+
+
+def test_snapshot_writer_collects_requests():
+    written = []
+    writing = threading.Event()
+    proceed = threading.Event()
+
+    def write():
+        written.append(len(written))
+        writing.set()
+        proceed.wait()
+
+    writer = snapshot.Writer(write)
+
+    for _ in range(3):
+        writer.request(0.01)
+
+    writing.wait()
+
+    # the requests during a rebuild share the next one
+    for _ in range(3):
+        writer.request(0.01)
+
+    proceed.set()
+    writer.flush()
+
+    assert written == [0, 1]
+    assert writer.thread is None
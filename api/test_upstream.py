@@ -0,0 +1,237 @@
+import threading
+
+import pytest
+
+from django.db import connection
+
+from . import locations, models, openweather, upstream
+from .testdata.server import StubResponse
+
+# locations are looked up in the city catalog before asking the API
+pytestmark = pytest.mark.django_db
+
+
+def test_query_reuses_connections(stub_server, payload):
+    stub_server.default = StubResponse(payload)
+
+    for _ in range(3):
+        assert openweather.query("Berlin,DE") == payload
+
+    assert len(stub_server.requests) == 3
+    assert len(stub_server.connections) == 1
+
+    path, params = stub_server.requests[0]
+    assert path == "/data/2.5/forecast"
+    assert params["q"] == ["berlin,de"]
+
+
+def test_query_returns_api_errors(stub_server):
+    stub_server.enqueue(
+        StubResponse({"cod": "404", "message": "city not found"}, 404)
+    )
+
+    assert openweather.query("Nowhere")["cod"] == "404"
+    assert len(stub_server.requests) == 1
+
+
+def test_query_rejects_invalid_responses(stub_server):
+    stub_server.enqueue(StubResponse(b"<html></html>", 404))
+
+    with pytest.raises(upstream.UpstreamError):
+        openweather.query("Berlin,DE")
+
+
+def test_retries_server_errors(stub_server, payload):
+    stub_server.enqueue(
+        StubResponse({"cod": 503}, 503),
+        StubResponse({"cod": 429}, 429, headers={"Retry-After": "0"}),
+        StubResponse(payload)
+    )
+
+    assert openweather.query("Berlin,DE") == payload
+    assert len(stub_server.requests) == 3
+
+
+def test_gives_up_after_max_retries(stub_server, settings):
+    settings.OPENWEATHERMAPORG_MAX_RETRIES = 1
+    stub_server.default = StubResponse({"cod": 502}, 502)
+
+    with pytest.raises(upstream.UpstreamError):
+        openweather.query("Berlin,DE")
+
+    assert len(stub_server.requests) == 2
+
+
+def test_read_timeout(stub_server, settings, payload):
+    settings.OPENWEATHERMAPORG_READ_TIMEOUT = 0.1
+    stub_server.enqueue(StubResponse(payload, delay=0.5))
+    stub_server.default = StubResponse(payload)
+
+    # the first attempt times out, the retry succeeds
+    assert openweather.query("Berlin,DE") == payload
+    assert len(stub_server.requests) == 2
+
+
+def test_limits_concurrent_connections(stub_server, settings, payload):
+    settings.OPENWEATHERMAPORG_MAX_CONNECTIONS = 2
+    stub_server.default = StubResponse(payload, delay=0.1)
+
+    locations.cities.load()
+
+    threads = [
+        threading.Thread(target=openweather.query, args=("Berlin,DE",))
+        for _ in range(6)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(stub_server.requests) == 6
+    assert stub_server.max_active == 2
+
+
+def test_streamed_responses_hold_their_connection(stub_server, settings,
+                                                  payload):
+    settings.OPENWEATHERMAPORG_MAX_CONNECTIONS = 1
+    settings.OPENWEATHERMAPORG_CONNECT_TIMEOUT = 0.1
+    settings.OPENWEATHERMAPORG_READ_TIMEOUT = 0.1
+    stub_server.default = StubResponse(payload)
+
+    response = upstream.get("forecast", {}, stream=True)
+
+    # the body hasn't been read yet
+    with pytest.raises(upstream.UpstreamError):
+        upstream.get("forecast", {}, stream=True)
+
+    b"".join(upstream.iter_content(response, 1024))
+    response.close()
+
+    upstream.get("forecast", {}, stream=True).close()
+
+
+def test_add_forecasts_streams_the_response(stub_server, payload):
+    stub_server.default = StubResponse(payload)
+
+    forecasts = openweather.add_forecasts("Berlin,DE")
+
+    assert forecasts.count() == len(payload["list"])
+    assert len(stub_server.connections) == 1
+
+    # the connection is reused after a streamed response
+    openweather.add_forecasts("Berlin,DE")
+
+    assert len(stub_server.connections) == 1
+
+
+def test_streamed_invalid_response(stub_server):
+    stub_server.enqueue(StubResponse(b'{"cod": "200", "list": [{"dt', 200))
+
+    with pytest.raises(upstream.UpstreamError):
+        openweather.add_forecasts("Berlin,DE")
+
+
+def test_forecasts_are_written_in_batches(stub_server, payload,
+                                          monkeypatch):
+    stub_server.default = StubResponse(payload)
+
+    openweather.add_forecasts("Berlin,DE")
+
+    monkeypatch.setattr(openweather, "INGEST_BATCH_SIZE", 7)
+
+    stored = []
+    store_forecasts = openweather.store_forecasts
+
+    def store(city, forecasts):
+        stored.append(len(forecasts))
+        return store_forecasts(city, forecasts)
+
+    monkeypatch.setattr(openweather, "store_forecasts", store)
+
+    for forecast_data in payload["list"]:
+        forecast_data["main"]["temp"] += 1
+
+    forecasts = openweather.add_forecasts("Berlin,DE")
+
+    count = len(payload["list"])
+
+    assert stored == [7] * (count // 7) + [count % 7]
+    assert forecasts.count() == count
+    assert forecasts.order_by("timestamp").last().temperature == \
+        pytest.approx(payload["list"][-1]["main"]["temp"] - 273.15)
+
+
+def test_streamed_responses_are_read_outside_the_transaction(
+        stub_server, payload, monkeypatch):
+    stub_server.default = StubResponse(payload)
+
+    # the test itself runs in a transaction
+    savepoints = len(connection.savepoint_ids)
+    read = []
+
+    parse_forecasts = openweather.parse_forecasts
+
+    def parse(entries):
+        for forecast in parse_forecasts(entries):
+            read.append(len(connection.savepoint_ids) == savepoints)
+            yield forecast
+
+    monkeypatch.setattr(openweather, "parse_forecasts", parse)
+
+    openweather.add_forecasts("Berlin,DE")
+
+    assert read == [True] * len(payload["list"])
+
+
+@pytest.fixture
+def known_city(stub_server, payload, monkeypatch):
+    """Berlin is known, its forecasts are written in batches of 7."""
+    stub_server.default = StubResponse(payload)
+
+    openweather.add_forecasts("Berlin,DE")
+
+    monkeypatch.setattr(openweather, "INGEST_BATCH_SIZE", 7)
+
+    for forecast_data in payload["list"]:
+        forecast_data["main"]["temp"] += 1
+
+    return models.City.objects.get()
+
+
+def temperatures(city):
+    return list(
+        city.forecasts.order_by("timestamp").values_list(
+            "temperature",
+            flat=True
+        )
+    )
+
+
+def test_streamed_error_writes_nothing(known_city, payload):
+    before = temperatures(known_city)
+
+    payload["cod"] = "500"
+
+    with pytest.raises(RuntimeError):
+        openweather.add_forecasts("Berlin,DE")
+
+    assert temperatures(known_city) == before
+
+
+def test_streamed_forecasts_of_another_city(known_city, payload):
+    before = temperatures(known_city)
+
+    payload["city"]["id"] += 1
+
+    forecasts = openweather.add_forecasts("Berlin,DE")
+
+    # all of them went to the city the API answered with
+    assert forecasts.instance.ref == payload["city"]["id"]
+    assert forecasts.count() == len(payload["list"])
+    assert temperatures(forecasts.instance)[0] == pytest.approx(
+        payload["list"][0]["main"]["temp"] - 273.15,
+        abs=0.005
+    )
+
+    assert temperatures(known_city) == before
@@ -0,0 +1,57 @@
+import copy
+import datetime
+import json
+import os
+
+import pytz
+
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def load_payload(name="forecast_berlin.json", start=None):
+    """Load a recorded openweathermap.org forecast response.
+
+    :param name: The file name of the recording inside this directory
+    :param start: An optional aware datetime - if given, all forecast slots
+                  will be shifted, so the first one starts at that time
+    :return: The decoded response, ready to be used in place of
+             openweather.query()
+    """
+    with open(os.path.join(TESTDATA_DIR, name)) as f:
+        payload = json.load(f)
+
+    if start is not None:
+        payload = rebase_payload(payload, start)
+
+    return payload
+
+
+def rebase_payload(payload, start):
+    """Shift all forecast slots of a payload, so the first one is at start.
+
+    :param payload: A decoded openweathermap.org forecast response
+    :param start: An aware datetime the first forecast slot should start at
+    :return: A shifted copy of the payload
+    """
+    payload = copy.deepcopy(payload)
+
+    first = datetime.datetime.strptime(
+        payload["list"][0]["dt_txt"],
+        DATETIME_FORMAT
+    )
+    offset = start.astimezone(pytz.UTC).replace(tzinfo=None) - first
+
+    for forecast_data in payload["list"]:
+        timestamp = datetime.datetime.strptime(
+            forecast_data["dt_txt"],
+            DATETIME_FORMAT
+        ) + offset
+
+        forecast_data["dt"] = int(
+            pytz.UTC.localize(timestamp).timestamp()
+        )
+        forecast_data["dt_txt"] = timestamp.strftime(DATETIME_FORMAT)
+
+    return payload
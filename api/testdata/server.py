@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+
+class StubResponse(object):
+
+    def __init__(self, body=None, status=200, delay=0, headers=None):
+        self.body = body
+        self.status = status
+        self.delay = delay
+        self.headers = headers or {}
+
+    def encode(self):
+        if isinstance(self.body, bytes):
+            return self.body
+        return json.dumps(self.body).encode("utf-8")
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+
+    # keep connections alive, just like the real API
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        stub = self.server
+
+        with stub.lock:
+            stub.active += 1
+            stub.max_active = max(stub.max_active, stub.active)
+            stub.connections.add(self.client_address)
+
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            stub.requests.append((url.path, query))
+
+            if stub.queue:
+                response = stub.queue.pop(0)
+            else:
+                response = stub.default
+
+        # responses depending on the request are built by a callable
+        if callable(response):
+            response = response(url.path, query)
+
+        try:
+            if response.delay:
+                time.sleep(response.delay)
+
+            body = response.encode()
+
+            self.send_response(response.status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting, i.e. because of a timeout
+            self.close_connection = True
+
+        finally:
+            with stub.lock:
+                stub.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """A local stand-in for the openweathermap.org API.
+
+    Responses are served from a queue, the default response is used once
+    the queue is empty. Instead of a StubResponse, a callable taking the
+    path and the parsed query of the request can be given. All requests and
+    connections are recorded.
+    """
+
+    daemon_threads = True
+
+    # accept bursts of concurrent connections, i.e. from the benchmarks
+    request_queue_size = 256
+
+    def __init__(self, default=None):
+        super().__init__(("127.0.0.1", 0), StubRequestHandler)
+
+        self.lock = threading.Lock()
+        self.default = default or StubResponse(
+            {"cod": "404", "message": "city not found"},
+            status=404
+        )
+        self.queue = []
+        self.requests = []
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://{}:{}/data/2.5/".format(*self.server_address)
+
+    def enqueue(self, *responses):
+        with self.lock:
+            self.queue.extend(responses)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
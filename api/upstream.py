@@ -0,0 +1,257 @@
+import random
+import threading
+import time
+
+from urllib.parse import urljoin
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .log import logger
+
+# responses that are worth another try after backing off
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# never wait longer than this for a Retry-After header of the API
+MAX_RETRY_AFTER = 30
+
+SETTINGS_PREFIX = "OPENWEATHERMAPORG_"
+
+
+class UpstreamError(RuntimeError):
+    """Raised if the openweathermap.org API could not be queried."""
+
+
+def retry_delay(attempt, retry_backoff, response=None):
+    """Get the number of seconds to wait before the next attempt.
+
+    Uses exponential backoff with full jitter, unless the API told us
+    how long to wait via a Retry-After header.
+    """
+    if response is not None:
+        try:
+            return min(
+                float(response.headers["Retry-After"]),
+                MAX_RETRY_AFTER
+            )
+        except (KeyError, ValueError):
+            pass
+
+    return random.uniform(0, retry_backoff * 2 ** attempt)
+
+
+class Client(object):
+    """A pooled, keep-alive HTTP client for the openweathermap.org API.
+
+    All requests of a process share one requests.Session, so connections to
+    the API are reused, and the number of concurrent connections is capped
+    at OPENWEATHERMAPORG_MAX_CONNECTIONS.
+    """
+
+    def __init__(self, base_url, connect_timeout, read_timeout, max_retries,
+                 retry_backoff, max_connections):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_connections,
+            pool_block=True
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.slots = threading.BoundedSemaphore(max_connections)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            base_url=settings.OPENWEATHERMAPORG_API_URL,
+            connect_timeout=settings.OPENWEATHERMAPORG_CONNECT_TIMEOUT,
+            read_timeout=settings.OPENWEATHERMAPORG_READ_TIMEOUT,
+            max_retries=settings.OPENWEATHERMAPORG_MAX_RETRIES,
+            retry_backoff=settings.OPENWEATHERMAPORG_RETRY_BACKOFF,
+            max_connections=settings.OPENWEATHERMAPORG_MAX_CONNECTIONS
+        )
+
+    def close(self):
+        self.session.close()
+
+    def acquire_slot(self):
+        # don't queue up forever if all connections are busy, a waiting
+        # request would time out on its own anyway
+        if not self.slots.acquire(timeout=sum(self.timeout)):
+            raise UpstreamError(
+                "Too many concurrent requests to the openweathermap.org API."
+            )
+
+    def hold_slot(self, response):
+        """Keep the connection slot of a streamed response taken, until the
+        response is closed - its body is read after get() returned.
+
+        :param response: The streamed requests.Response
+        :return: The response
+        """
+        close = response.close
+        lock = threading.Lock()
+        held = True
+
+        def close_and_release():
+            nonlocal held
+
+            try:
+                close()
+
+            finally:
+                with lock:
+                    release, held = held, False
+
+                if release:
+                    self.slots.release()
+
+        response.close = close_and_release
+
+        return response
+
+    def backoff(self, attempt, response=None):
+        return retry_delay(attempt, self.retry_backoff, response)
+
+    def get(self, endpoint, params, stream=False):
+        """Send a GET request to an endpoint of the API.
+
+        Connection errors, timeouts and responses with a status code in
+        RETRY_STATUS_CODES are retried up to max_retries times.
+
+        :param endpoint: The path relative to the API's base URL, i.e.
+                         "forecast"
+        :param params: A dict with the query parameters
+        :param stream: Whether to return as soon as the headers are read,
+                       the body is left to iter_content() - the connection
+                       counts towards max_connections until the response
+                       is closed
+        :return: The requests.Response of the API
+        :raises UpstreamError: If no usable response could be obtained
+        """
+        url = urljoin(self.base_url, endpoint)
+
+        for attempt in range(self.max_retries + 1):
+
+            response = None
+
+            self.acquire_slot()
+
+            try:
+                response = self.session.get(
+                    url,
+                    params=params,
+                    timeout=self.timeout,
+                    stream=stream
+                )
+
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.slots.release()
+                error = "{}: {}".format(type(e).__name__, e)
+
+            except Exception:
+                self.slots.release()
+                raise
+
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    if stream:
+                        # the slot is taken until the body has been read
+                        return self.hold_slot(response)
+
+                    self.slots.release()
+                    return response
+
+                error = "HTTP {}".format(response.status_code)
+
+                # hand the connection back, a streamed body is never read
+                response.close()
+                self.slots.release()
+
+            if attempt < self.max_retries:
+                delay = self.backoff(attempt, response)
+
+                logger.warning(
+                    "Request to %s failed (%s), retrying in %.2fs.",
+                    endpoint,
+                    error,
+                    delay
+                )
+
+                time.sleep(delay)
+
+        raise UpstreamError(
+            "The openweathermap.org API is not available ({}).".format(error)
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Get the process wide Client, create it from the settings if needed."""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Client.from_settings()
+
+    return _client
+
+
+def reset_client():
+    """Close the process wide Client, the next request will create a new
+    one from the current settings."""
+    global _client
+
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+@receiver(setting_changed)
+def _reset_client_on_setting_changed(setting, **kwargs):
+    if setting.startswith(SETTINGS_PREFIX):
+        reset_client()
+
+
+def get(endpoint, params, stream=False):
+    return get_client().get(endpoint, params, stream)
+
+
+def iter_content(response, chunk_size):
+    """Read the body of a streamed response in chunks.
+
+    :param response: A requests.Response of get() with stream=True
+    :param chunk_size: The max. number of bytes per chunk
+    :return: A generator of the chunks, closing the response once it's done
+    :raises UpstreamError: If the body could not be read
+    """
+    try:
+        yield from response.iter_content(chunk_size)
+
+    except requests.RequestException as e:
+        raise UpstreamError(
+            "The openweathermap.org API is not available ({}: {}).".format(
+                type(e).__name__,
+                e
+            )
+        )
+
+    finally:
+        response.close()
@@ -20,14 +20,33 @@ from . import converters, views
 
 register_converter(converters.DateConverter, 'date')
 register_converter(converters.TimeConverter, 'time')
+register_converter(converters.DateTimeConverter, 'datetime')
+register_converter(converters.CoordinatesConverter, 'coordinates')
 
 
 urlpatterns = [
+    path(
+        "batch/",
+        views.weather_batch,
+        name="weather-batch"
+    ),
     path(
         "<data_type>/<location>/<date:date>/<time:time>/",
         views.weather,
         name="weather"
     ),
+    path(
+        "<data_type>/coords/<coordinates:coordinates>/<date:date>/"
+        "<time:time>/",
+        views.weather_coords,
+        name="weather-coords"
+    ),
+    path(
+        "<data_type>/<location>/range/<datetime:from_datetime>/"
+        "<datetime:to_datetime>/",
+        views.weather_range,
+        name="weather-range"
+    ),
     path(
         "protected/<data_type>/<location>/<date:date>/<time:time>/",
         views.protected_weather,
@@ -1,7 +1,9 @@
 import datetime
+import json
 import pytz
 
-from django.http import Http404
+from django.conf import settings
+from django.http import Http404, HttpResponse
 
 import coreapi
 import coreschema
@@ -11,10 +13,13 @@ from rest_framework.decorators \
 from rest_framework.authentication \
     import SessionAuthentication, BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.schemas import ManualSchema
 
-from . import openweather, serializers, models
+from . import conversions, locations, metrics, openweather, prefetch, \
+    serializers, models
 from .log import logger
 
 
@@ -34,6 +39,14 @@ VALID_DATATYPES = [
     DATATYPE_HUMIDITY
 ]
 
+# the data_type of the responses rendered by openweather.prerender_forecasts()
+PRERENDERED_DATA_TYPES = {
+    DATATYPE_SUMMARY: None,
+    DATATYPE_TEMPERATURE: DATATYPE_TEMPERATURE,
+    DATATYPE_PRESSURE: DATATYPE_PRESSURE,
+    DATATYPE_HUMIDITY: DATATYPE_HUMIDITY
+}
+
 PARTIAL_SERIALIZERS = {
     DATATYPE_TEMPERATURE: serializers.TemperaturePartialSerializer,
     DATATYPE_PRESSURE: serializers.PressurePartialSerializer,
@@ -41,63 +54,201 @@ PARTIAL_SERIALIZERS = {
 }
 
 
-weather_schema = ManualSchema(fields=[
-    coreapi.Field(
-        "data_type",
-        required=True,
-        location="path",
-        schema=coreschema.Enum(
-            ["summary", "temperature", "pressure", "humidity"],
-            title="Data Type",
-            description=(
-                "The type of response to render. One of ['summary',"
-                "'temperature','pressure','humidity']"
-            )
+data_type_field = coreapi.Field(
+    "data_type",
+    required=True,
+    location="path",
+    schema=coreschema.Enum(
+        ["summary", "temperature", "pressure", "humidity"],
+        title="Data Type",
+        description=(
+            "The type of response to render. One of ['summary',"
+            "'temperature','pressure','humidity']"
+        )
 
+    )
+)
+
+location_field = coreapi.Field(
+    "location",
+    required=True,
+    location="path",
+    schema=coreschema.String(
+        title="Location",
+        description=(
+            "The location the weather forecast is requested for, "
+            "i.e. 'Berlin,DE'"
         )
-    ),
-    coreapi.Field(
-        "location",
-        required=True,
-        location="path",
-        schema=coreschema.String(
-            title="Location",
-            description=(
-                "The location the weather forecast is requested for, "
-                "i.e. 'Berlin,DE'"
-            )
+    )
+)
+
+temp_scale_field = coreapi.Field(
+    "temp_scale",
+    required=False,
+    location="query",
+    schema=coreschema.String(
+        description=(
+            "Indicator of the scale to be used for the temperature "
+            "values. Possible values are 'c' for Celsius (default) or 'f' "
+            "for Fahrenheit. Other values will silently be ignored and "
+            "Celsius will be assumed."
         )
     ),
-    coreapi.Field(
-        "date",
-        required=True,
-        location="path",
-        schema=coreschema.String(
-            description="The date in the format YYYYMMDD"
-        ),
+)
+
+date_field = coreapi.Field(
+    "date",
+    required=True,
+    location="path",
+    schema=coreschema.String(
+        description="The date in the format YYYYMMDD"
     ),
-    coreapi.Field(
-        "time",
-        required=True,
-        location="path",
-        schema=coreschema.String(
-            description="The time in the format HHMM"
-        ),
+)
+
+time_field = coreapi.Field(
+    "time",
+    required=True,
+    location="path",
+    schema=coreschema.String(
+        description="The time in the format HHMM"
     ),
-    coreapi.Field(
-        "temp_scale",
-        required=False,
-        location="query",
-        schema=coreschema.String(
-            description=(
-                "Indicator of the scale to be used for the temperature "
-                "values. Possible values are 'c' for Celsius (default) or 'f' "
-                "for Fahrenheit. Other values will silently be ignored and "
-                "Celsius will be assumed."
-            )
+)
+
+weather_schema = ManualSchema(fields=[
+    data_type_field,
+    location_field,
+    date_field,
+    time_field,
+    temp_scale_field
+])
+
+
+coords_schema = ManualSchema(
+    fields=[
+        data_type_field,
+        coreapi.Field(
+            "coordinates",
+            required=True,
+            location="path",
+            schema=coreschema.String(
+                description="The position as <latitude>,<longitude> in "
+                            "degrees, i.e. 52.52,13.41"
+            ),
         ),
+        date_field,
+        time_field,
+        temp_scale_field
+    ],
+    description=(
+        "Get the weather information of the known city nearest to a "
+        "position for a given date and time."
     )
-])
+)
+
+
+range_schema = ManualSchema(
+    fields=[
+        data_type_field,
+        location_field,
+        coreapi.Field(
+            "from_datetime",
+            required=True,
+            location="path",
+            schema=coreschema.String(
+                description="The start of the range in the format "
+                            "YYYYMMDDHHMM (UTC)"
+            ),
+        ),
+        coreapi.Field(
+            "to_datetime",
+            required=True,
+            location="path",
+            schema=coreschema.String(
+                description="The end of the range in the format "
+                            "YYYYMMDDHHMM (UTC)"
+            ),
+        ),
+        temp_scale_field
+    ],
+    description=(
+        "Get the weather information for all forecast slots of a location "
+        "within a time range."
+    )
+)
+
+
+batch_schema = ManualSchema(
+    fields=[
+        coreapi.Field(
+            "items",
+            required=True,
+            location="body",
+            schema=coreschema.Array(
+                items=coreschema.Object(
+                    properties={
+                        "location": coreschema.String(),
+                        "datetime": coreschema.String(),
+                        "data_type": coreschema.Enum(VALID_DATATYPES),
+                        "temp_scale": coreschema.Enum(
+                            [
+                                TEMPERATURE_SCALE_CELSIUS,
+                                TEMPERATURE_SCALE_FAHRENHEIT
+                            ]
+                        )
+                    },
+                    required=["location", "datetime"]
+                ),
+                title="Items",
+                description=(
+                    "A JSON list of objects with the 'location' (i.e. "
+                    "'Berlin,DE') and 'datetime' (in the format "
+                    "'YYYY-MM-DD HH:MM:SS', UTC) to get the forecast for and "
+                    "optionally the 'data_type' (default 'summary') and "
+                    "'temp_scale' (default 'c') to render it with."
+                )
+            )
+        )
+    ],
+    description=(
+        "Get the weather information for many locations and timestamps at "
+        "once. The response is a list with one result per item, in the "
+        "same order."
+    )
+)
+
+
+def get_temperature_unit(temp_scale):
+    if temp_scale == TEMPERATURE_SCALE_FAHRENHEIT:
+        return models.UNIT_FAHRENHEIT
+    else:
+        return models.UNIT_CELSIUS
+
+
+@metrics.stage_seconds.time("serialize")
+def serialize(forecast, data_type, temperature_unit, temperature=None):
+    """Render a forecast the way the weather endpoints respond with it.
+
+    :param forecast: The models.Forecast to render
+    :param data_type: One of VALID_DATATYPES
+    :param temperature_unit: One of models.Forecast.SUPPORTED_TEMPERATURE_UNITS
+    :param temperature: The temperature in temperature_unit, if it has been
+                        converted already
+    :return: The response data
+    """
+    UnitSerializer = serializers.CelsiusForecastSerializer \
+        if temperature_unit == models.UNIT_CELSIUS \
+        else serializers.FahrenheitForecastSerializer
+
+    data = UnitSerializer(
+        forecast,
+        context={"temperature": temperature}
+    ).data
+
+    if not data_type == DATATYPE_SUMMARY:
+        PartialSerializer = PARTIAL_SERIALIZERS.get(data_type)
+        data = PartialSerializer(data).data
+
+    return data
 
 
 def search(request, data_type, location, date, time):
@@ -109,55 +260,118 @@ def search(request, data_type, location, date, time):
     :param location: A string with the query of the location, i.e. Berlin,DE
     :param date: A date in the format YYYYMMDD
     :param time: A time in the format HHMM
-    :return: A django REST framework Response object with the JSON
-             representation of the matching forecast or error if any
+    :return: A response with the JSON representation of the matching
+             forecast or error if any
     """
 
     if data_type not in VALID_DATATYPES:
         raise Http404
 
-    logger.debug(
-        "Searching for {} on {} @ {}".format(
-            location,
+    prefetch.tracker.track(location)
+
+    content = lookup(
+        data_type,
+        location,
+        date,
+        time,
+        request.query_params.get(
+            TEMPERATURE_SCALE_QUERY_PARAM,
+            TEMPERATURE_SCALE_CELSIUS
+        )
+    )
+
+    # the rendered JSON is sent as is, only the browsable API renders the
+    # data itself
+    if isinstance(request.accepted_renderer, JSONRenderer):
+        return HttpResponse(content, content_type="application/json")
+
+    return Response(json.loads(content.decode("utf-8")))
+
+
+def lookup(data_type, location, date, time, temp_scale, refresh=None):
+    """Get the response of the weather endpoints.
+
+    :param data_type: One of VALID_DATATYPES
+    :param location: A string with the query of the location, i.e. Berlin,DE
+    :param date: A date instance
+    :param time: A time instance
+    :param temp_scale: The value of the TEMPERATURE_SCALE_QUERY_PARAM
+    :param refresh: Passed on to openweather.get_forecast()
+    :return: The rendered JSON of the matching forecast or error
+    """
+    logger.debug("Searching for %s on %s @ %s", location, date, time)
+
+    temperature_unit = get_temperature_unit(temp_scale)
+
+    timestamp = pytz.UTC.localize(
+        datetime.datetime.combine(
             date,
             time
         )
     )
+    slot = openweather.get_slot(timestamp)
 
-    if request.query_params.get(
-        TEMPERATURE_SCALE_QUERY_PARAM,
-        TEMPERATURE_SCALE_CELSIUS
-    ) == TEMPERATURE_SCALE_FAHRENHEIT:
-        temperature_unit = models.UNIT_FAHRENHEIT
-    else:
-        temperature_unit = models.UNIT_CELSIUS
+    # all timestamps within a forecast slot share the same response
+    cache_key = (
+        openweather.normalize_location(location),
+        slot,
+        data_type,
+        temperature_unit
+    )
+
+    content = openweather.response_cache.get(cache_key)
+
+    if content is not None:
+        return content
+
+    generation = openweather.response_cache.generation
+
+    if settings.FORECAST_PRERENDER:
+        city_id, content = openweather.get_prerendered(
+            location,
+            slot,
+            PRERENDERED_DATA_TYPES[data_type],
+            temperature_unit
+        )
+
+        if content is not None:
+            openweather.response_cache.set(
+                cache_key,
+                content,
+                city_id,
+                generation
+            )
+            return content
 
     try:
         forecast = openweather.get_forecast(
             location,
-            pytz.UTC.localize(
-                datetime.datetime.combine(
-                    date,
-                    time
-                )
-            ),
-            auto_update=True
+            timestamp,
+            auto_update=True,
+            refresh=refresh
         )
 
-        UnitSerializer = serializers.CelsiusForecastSerializer \
-            if temperature_unit == models.UNIT_CELSIUS \
-            else serializers.FahrenheitForecastSerializer
+        content = openweather.render(
+            serialize(forecast, data_type, temperature_unit)
+        )
 
-        data = UnitSerializer(forecast).data
+        if not getattr(forecast, "stale", False):
+            openweather.response_cache.set(
+                cache_key,
+                content,
+                forecast.city_id,
+                generation,
+                ttl=getattr(forecast, "max_age", None)
+            )
 
-        if not data_type == DATATYPE_SUMMARY:
-            PartialSerializer = PARTIAL_SERIALIZERS.get(data_type)
-            data = PartialSerializer(data).data
+    except openweather.RefreshRequired:
+        raise
 
     except Exception as e:
-        data = serializers.ErrorSerializer(e).data
+        metrics.errors.inc(type(e).__name__)
+        content = openweather.render(serializers.ErrorSerializer(e).data)
 
-    return Response(data)
+    return content
 
 
 @api_view(['GET'])
@@ -172,3 +386,237 @@ def weather(request, data_type, location, date, time):
 @permission_classes((IsAuthenticated,))
 def protected_weather(*args, **kwargs):
     return search(*args, **kwargs)
+
+
+@api_view(['GET'])
+@schema(coords_schema)
+def weather_coords(request, data_type, coordinates, date, time):
+    """Get the weather information for the known city nearest to a
+    position, so all requests near a city share its forecasts.
+
+    :param request: The django REST framework Request object
+    :param data_type: One of ["summary", "temperature", "pressure", "humidity"]
+    :param coordinates: A tuple (latitude, longitude)
+    :param date: A date in the format YYYYMMDD
+    :param time: A time in the format HHMM
+    :return: A django REST framework Response object with the JSON
+             representation of the matching forecast or error if any
+    """
+
+    # rejected before the positions are looked up
+    if data_type not in VALID_DATATYPES:
+        raise Http404
+
+    ref, distance = locations.positions.nearest(*coordinates)
+
+    if ref is None:
+        return Response(
+            serializers.ErrorSerializer(
+                "No city known near {},{}.".format(*coordinates)
+            ).data
+        )
+
+    logger.debug(
+        "Nearest city to %s,%s is %s (%.1fkm)",
+        coordinates[0],
+        coordinates[1],
+        ref,
+        distance
+    )
+
+    max_distance = settings.FORECAST_COORDS_MAX_DISTANCE
+
+    if max_distance is not None and distance > max_distance:
+        return Response(
+            serializers.ErrorSerializer(
+                "No city known within {}km of {},{}.".format(
+                    max_distance,
+                    *coordinates
+                )
+            ).data,
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    return search(
+        request,
+        data_type,
+        locations.city_location(ref),
+        date,
+        time
+    )
+
+
+@api_view(['GET'])
+@schema(range_schema)
+def weather_range(request, data_type, location, from_datetime, to_datetime):
+    """Get the weather information for all forecasts of a location within a
+    time range.
+
+    :param request: The django REST framework Request object
+    :param data_type: One of ["summary", "temperature", "pressure", "humidity"]
+    :param location: A string with the query of the location, i.e. Berlin,DE
+    :param from_datetime: The start of the range
+    :param to_datetime: The end of the range
+    :return: A django REST framework Response object with the JSON
+             representation of the matching forecasts or error if any
+    """
+
+    if data_type not in VALID_DATATYPES:
+        raise Http404
+
+    prefetch.tracker.track(location)
+
+    use_fahrenheit = get_temperature_unit(
+        request.query_params.get(
+            TEMPERATURE_SCALE_QUERY_PARAM,
+            TEMPERATURE_SCALE_CELSIUS
+        )
+    ) == models.UNIT_FAHRENHEIT
+
+    try:
+        rows = openweather.get_forecast_range(
+            location,
+            pytz.UTC.localize(from_datetime),
+            pytz.UTC.localize(to_datetime),
+            auto_update=True
+        )
+
+        data = {
+            "status": "success",
+            "forecasts": openweather.serialize_forecast_rows(
+                rows,
+                use_fahrenheit=use_fahrenheit,
+                data_type=None
+                if data_type == DATATYPE_SUMMARY
+                else data_type
+            )
+        }
+
+    except Exception as e:
+        metrics.errors.inc(type(e).__name__)
+        data = serializers.ErrorSerializer(e).data
+
+    return Response(data)
+
+
+def parse_batch_item(item):
+    """Validate an item of a batch request.
+
+    :param item: The item as sent by the client
+    :return: A tuple (location, timestamp, data_type, temperature_unit)
+    :raises ValueError: If the item is invalid
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Items need to be objects.")
+
+    location = item.get("location")
+
+    if not location or not isinstance(location, str):
+        raise ValueError("Items need a 'location'.")
+
+    try:
+        timestamp = pytz.UTC.localize(
+            datetime.datetime.strptime(
+                item.get("datetime"),
+                openweather.DATETIME_FORMAT
+            )
+        )
+    except (TypeError, ValueError):
+        raise ValueError(
+            "Items need a 'datetime' in the format YYYY-MM-DD HH:MM:SS."
+        )
+
+    data_type = item.get("data_type", DATATYPE_SUMMARY)
+
+    if data_type not in VALID_DATATYPES:
+        raise ValueError(
+            "Invalid 'data_type', please use any of {}.".format(
+                VALID_DATATYPES
+            )
+        )
+
+    temperature_unit = get_temperature_unit(
+        item.get("temp_scale", TEMPERATURE_SCALE_CELSIUS)
+    )
+
+    return location, timestamp, data_type, temperature_unit
+
+
+@api_view(['POST'])
+@schema(batch_schema)
+def weather_batch(request):
+    items = request.data
+
+    if not isinstance(items, list):
+        return Response(
+            serializers.ErrorSerializer("Expected a list of items.").data,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if len(items) > settings.FORECAST_BATCH_MAX_ITEMS:
+        return Response(
+            serializers.ErrorSerializer(
+                "Too many items, the limit is {}.".format(
+                    settings.FORECAST_BATCH_MAX_ITEMS
+                )
+            ).data,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(items)
+    queries = []
+
+    for index, item in enumerate(items):
+        try:
+            queries.append((index, ) + parse_batch_item(item))
+        except ValueError as e:
+            results[index] = serializers.ErrorSerializer(e).data
+
+    for _, location, _, _, _ in queries:
+        prefetch.tracker.track(location)
+
+    forecasts = openweather.get_forecast_batch(
+        [(location, timestamp) for _, location, timestamp, _, _ in queries],
+        auto_update=True
+    )
+
+    found = []
+
+    for (index, _, _, data_type, temperature_unit), forecast in zip(
+        queries,
+        forecasts
+    ):
+        if isinstance(forecast, Exception):
+            metrics.errors.inc(type(forecast).__name__)
+            results[index] = serializers.ErrorSerializer(forecast).data
+        else:
+            found.append((index, forecast, data_type, temperature_unit))
+
+    # convert the temperatures of all forecasts of a unit in one go
+    temperatures = {}
+
+    for unit in models.Forecast.SUPPORTED_TEMPERATURE_UNITS:
+        items = [item for item in found if item[3] == unit]
+
+        temperatures.update(zip(
+            [index for index, _, _, _ in items],
+            conversions.ceil_temperatures(
+                [forecast.temperature for _, forecast, _, _ in items],
+                unit
+            )
+        ))
+
+    for index, forecast, data_type, temperature_unit in found:
+        results[index] = serialize(
+            forecast,
+            data_type,
+            temperature_unit,
+            temperatures[index]
+        )
+
+    return Response(results)
+
+
+def prometheus_metrics(request):
+    """Render the metrics of this process in the Prometheus text format."""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,79 @@
+"""Stand-alone benchmarks, run them from the repository root, i.e.
+
+    python -m benchmarks.ingest
+
+They use a throw-away test database and never talk to openweathermap.org.
+"""
+import os
+import statistics
+import time
+
+
+def setup(database=None):
+    """Configure django and create an empty test database.
+
+    :param database: An optional file name for the test database, by
+                     default it's kept in memory
+    :return: A callable that tears the test database down again
+    """
+    os.environ.setdefault(
+        "DJANGO_SETTINGS_MODULE",
+        "openweathermap_rest.settings"
+    )
+    os.environ.setdefault("OPENWEATHERMAPORG_API_KEY", "benchmark")
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment, teardown_test_environment
+    )
+
+    setup_test_environment()
+
+    if database:
+        connection.settings_dict["TEST"]["NAME"] = database
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+
+    def teardown():
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    return teardown
+
+
+def measure(func, repeat=20):
+    """Call func repeatedly and collect the wall time of each call.
+
+    :param func: A callable without arguments
+    :param repeat: How many times to call it
+    :return: A list of durations in seconds
+    """
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def report(title, timings, **extra):
+    """Print a one-line summary of a list of timings."""
+    details = "".join(
+        ", {}={}".format(key, value) for key, value in sorted(extra.items())
+    )
+
+    print(
+        "{:<40} median={:8.3f}ms min={:8.3f}ms max={:8.3f}ms{}".format(
+            title,
+            statistics.median(timings) * 1000,
+            min(timings) * 1000,
+            max(timings) * 1000,
+            details
+        )
+    )
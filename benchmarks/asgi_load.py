@@ -0,0 +1,202 @@
+"""Compare the WSGI and the ASGI request path under load.
+
+    python -m benchmarks.asgi_load --requests 400 --latency 0.25
+
+Every request is for a location that hasn't been searched before, so each
+one queries the (local, fake) API, which answers after --latency seconds.
+The WSGI path is run by --threads threads, just like a threaded WSGI server
+would, the ASGI path keeps up to --concurrency requests in flight in one
+thread.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import pytz
+
+from benchmarks import report, setup
+
+
+def urls(count, offset, data_type="summary"):
+    from django.urls import reverse
+
+    from api import openweather
+
+    timestamp = datetime.datetime.now(tz=pytz.UTC) + \
+        openweather.FORECAST_MAX_AGE
+
+    return [
+        reverse(
+            "weather",
+            kwargs={
+                "data_type": data_type,
+                "location": "City {}".format(offset + index),
+                "date": timestamp.date(),
+                "time": timestamp.time()
+            }
+        )
+        for index in range(count)
+    ]
+
+
+def run_wsgi(paths, threads):
+    from django.test import Client
+
+    def get(path):
+        start = time.perf_counter()
+        response = Client().get(path)
+        assert response.json()["status"] == "success", response.content
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(get, paths))
+
+
+def run_asgi(paths, concurrency):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    from api import aioupstream, asgi
+
+    app = asgi.ForecastApplication(WSGIHandler())
+
+    async def get(path, slots):
+        async with slots:
+            start = time.perf_counter()
+            messages = []
+
+            async def receive():
+                return {"type": "http.request", "body": b""}
+
+            async def send(message):
+                messages.append(message)
+
+            await app(
+                {
+                    "type": "http",
+                    "method": "GET",
+                    "path": unquote(path),
+                    "query_string": b"",
+                    "headers": [(b"host", b"testserver")]
+                },
+                receive,
+                send
+            )
+
+            assert b'"success"' in messages[1]["body"], messages[1]["body"]
+            return time.perf_counter() - start
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*[get(path, slots) for path in paths])
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(aioupstream.close_client())
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.25)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    # SQLite's in-memory databases don't cope with concurrent writers
+    database = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+    teardown = setup(database)
+
+    from django.conf import settings
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.db.backends.sqlite3.base import DatabaseWrapper
+    from django.test.utils import override_settings
+
+    from api.testdata import load_payload
+    from api.testdata.server import StubResponse, StubServer
+
+    settings.DATABASES["default"]["OPTIONS"]["timeout"] = 60
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+    # SQLite allows a single writer only - take the write lock when a
+    # transaction starts, so concurrent ones wait for each other instead of
+    # failing when they turn from reading to writing
+    DatabaseWrapper._start_transaction_under_autocommit = \
+        lambda self: self.cursor().execute("BEGIN IMMEDIATE")
+
+    # the data is thrown away anyway
+    def disable_sync(connection, **kwargs):
+        connection.cursor().execute("PRAGMA synchronous=OFF")
+
+    connection_created.connect(disable_sync)
+
+    payload = load_payload(start=datetime.datetime.now(tz=pytz.UTC))
+
+    def respond(path, query):
+        # every location is a city of its own
+        location = query["q"][0]
+
+        return StubResponse(
+            dict(
+                payload,
+                city=dict(
+                    payload["city"],
+                    id=int(location.split()[-1]),
+                    name=location
+                )
+            ),
+            delay=args.latency
+        )
+
+    server = StubServer(respond).start()
+
+    try:
+        with override_settings(
+            OPENWEATHERMAPORG_API_URL=server.url,
+            OPENWEATHERMAPORG_MAX_CONNECTIONS=max(
+                args.threads,
+                args.concurrency
+            )
+        ):
+            for index, (title, run, workers) in enumerate((
+                ("WSGI, {} threads", run_wsgi, args.threads),
+                ("ASGI, {} concurrent", run_asgi, args.concurrency),
+            )):
+                server.max_active = 0
+
+                start = time.perf_counter()
+                timings = run(
+                    urls(args.requests, index * args.requests),
+                    workers
+                )
+                total = time.perf_counter() - start
+
+                report(
+                    title.format(workers),
+                    timings,
+                    requests=args.requests,
+                    total="{:.2f}s".format(total),
+                    rps="{:.1f}".format(args.requests / total),
+                    in_flight=server.max_active
+                )
+
+    finally:
+        server.stop()
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Compare the API calls and the time it takes to refresh the forecasts of
+many cities one location at a time with refreshing them in bulk
+(FORECAST_PREFETCH_BULK).
+
+    python -m benchmarks.bulk_refresh --cities 500 --drifted 0.1
+
+A fake of the API answers every call after --latency seconds. "bulk cold" is
+the first bulk refresh - there are no forecasts to confirm yet - and "bulk
+warm" the following ones, when the observed weather of a share of --drifted
+cities is off their forecasts. "single" is prefetch.prefetch(), one call per
+city.
+"""
+import argparse
+import datetime
+import random
+import time
+
+import pytz
+
+from benchmarks import report, setup
+
+
+def seed(cities, fetched_at):
+    from api import models
+
+    models.City.objects.bulk_create(
+        models.City(
+            ref=index,
+            name="City {}".format(index),
+            latitude=0,
+            longitude=0,
+            country_code="XX",
+            fetched_at=fetched_at
+        )
+        for index in range(cities)
+    )
+
+    models.CitySearchResult.objects.bulk_create(
+        models.CitySearchResult(
+            search="city {}".format(city.ref),
+            city=city,
+            request_count=cities - city.ref,
+            last_requested_at=fetched_at
+        )
+        for city in models.City.objects.all()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--drifted", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--cycles", type=int, default=3)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from django.test import override_settings
+
+    from api import bulk, models, openweather, prefetch
+    from api.testdata import load_payload
+
+    now = datetime.datetime.now(tz=pytz.UTC)
+    slot = now.replace(
+        hour=now.hour - now.hour % 3,
+        minute=0,
+        second=0,
+        microsecond=0
+    )
+    payload = load_payload(start=slot)
+    forecasted = models.kelvin_to_celsius(payload["list"][0]["main"]["temp"])
+
+    calls = []
+    drifted = set()
+
+    def fake_query(location, *query_args, **kwargs):
+        calls.append(location)
+        time.sleep(args.latency)
+        return dict(payload, city=dict(
+            payload["city"],
+            id=int(location.split()[-1])
+        ))
+
+    def fake_query_group(refs):
+        calls.append(refs)
+        time.sleep(args.latency)
+        return {
+            ref: forecasted + (5 if ref in drifted else 0.5)
+            for ref in refs
+        }
+
+    def fake_query_forecasts(ref):
+        calls.append(ref)
+        time.sleep(args.latency)
+        return dict(payload, city=dict(payload["city"], id=ref))
+
+    openweather.query = fake_query
+    bulk.query_group = fake_query_group
+    bulk.query_forecasts = fake_query_forecasts
+
+    def run(name, func):
+        # all cities are due
+        models.City.objects.update(
+            fetched_at=now - datetime.timedelta(hours=6),
+            checked_at=None
+        )
+        del calls[:]
+
+        start = time.perf_counter()
+        result = func()
+        duration = time.perf_counter() - start
+
+        report(name, [duration], calls=len(calls), cities=args.cities)
+
+        return result
+
+    try:
+        seed(args.cities, now)
+
+        with override_settings(
+                OPENWEATHERMAPORG_CALLS_PER_MINUTE=None,
+                FORECAST_PREFETCH_TOP=args.cities):
+
+            budget = prefetch.CallBudget(10 ** 6)
+
+            run("bulk cold", lambda: prefetch.prefetch_bulk(budget))
+
+            random.seed(13)
+
+            for cycle in range(args.cycles):
+                drifted.clear()
+                drifted.update(
+                    ref for ref in range(args.cities)
+                    if random.random() < args.drifted
+                )
+
+                outcome = run(
+                    "bulk warm {}".format(cycle + 1),
+                    lambda: prefetch.prefetch_bulk(budget)
+                )
+                print(
+                    "    {} confirmed, {} refreshed, {} checks, {} fetches, "
+                    "{} calls saved".format(
+                        outcome.confirmed,
+                        outcome.refreshed,
+                        outcome.checks,
+                        outcome.fetches,
+                        outcome.calls_saved
+                    )
+                )
+
+            run("single", lambda: prefetch.prefetch(budget))
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Compare the size and the range scans of the Forecast table as it was
+stored before and after the compact storage (migration 0009).
+
+    python -m benchmarks.compact_storage --rows 1000000
+
+Both tables are written to throw-away SQLite files with the same forecasts,
+"before" as datetime strings, floats and a description per row, "after" as
+seconds since the epoch, fixed-point integers and a reference to its
+condition. The sizes are taken after a VACUUM, with and without the indexes.
+A range scan reads the forecasts of a city for five days and decodes them to
+the values a response is rendered from.
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+
+import pytz
+
+from benchmarks import measure, report, setup
+
+CITIES = 1000
+
+DESCRIPTIONS = [
+    "clear sky",
+    "few clouds",
+    "scattered clouds",
+    "broken clouds",
+    "overcast clouds",
+    "light rain",
+    "moderate rain",
+    "light rain, mist",
+    "thunderstorm",
+    "snow"
+]
+
+# the schema up to migration 0008
+BEFORE = """
+CREATE TABLE "api_forecast" (
+    "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    "timestamp" datetime NOT NULL,
+    "description" varchar(256) NOT NULL,
+    "temperature" real NOT NULL,
+    "pressure" real NOT NULL,
+    "humidity" real NOT NULL,
+    "city_id" integer NOT NULL
+);
+CREATE INDEX "api_forecast_city_id" ON "api_forecast" ("city_id");
+CREATE UNIQUE INDEX "api_forecast_city_id_timestamp_uniq"
+    ON "api_forecast" ("city_id", "timestamp");
+"""
+
+BEFORE_INSERT = """
+INSERT INTO "api_forecast"
+    ("city_id", "timestamp", "description", "temperature", "pressure",
+     "humidity")
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+BEFORE_RANGE = """
+SELECT "timestamp", "description", "temperature", "pressure", "humidity"
+FROM "api_forecast"
+WHERE "city_id" = ? AND "timestamp" BETWEEN ? AND ?
+ORDER BY "timestamp"
+"""
+
+# the schema since migration 0009
+AFTER = """
+CREATE TABLE "api_condition" (
+    "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    "description" varchar(256) NOT NULL UNIQUE
+);
+CREATE TABLE "api_forecast" (
+    "id" integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+    "city_id" integer NOT NULL,
+    "condition_id" integer NOT NULL,
+    "timestamp" integer NOT NULL,
+    "temperature" integer NOT NULL,
+    "pressure" integer NOT NULL,
+    "humidity" integer NOT NULL
+);
+CREATE INDEX "api_forecast_city_id" ON "api_forecast" ("city_id");
+CREATE UNIQUE INDEX "api_forecast_city_id_timestamp_uniq"
+    ON "api_forecast" ("city_id", "timestamp");
+"""
+
+AFTER_INSERT = """
+INSERT INTO "api_forecast"
+    ("city_id", "timestamp", "condition_id", "temperature", "pressure",
+     "humidity")
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+AFTER_RANGE = """
+SELECT "api_forecast"."timestamp", "api_condition"."description",
+       "api_forecast"."temperature", "api_forecast"."pressure",
+       "api_forecast"."humidity"
+FROM "api_forecast"
+INNER JOIN "api_condition"
+    ON "api_forecast"."condition_id" = "api_condition"."id"
+WHERE "api_forecast"."city_id" = ?
+    AND "api_forecast"."timestamp" BETWEEN ? AND ?
+ORDER BY "api_forecast"."timestamp"
+"""
+
+
+def forecasts(rows, start):
+    """The same pseudo random forecasts for every run."""
+    random.seed(13)
+
+    for slot in range(rows // CITIES):
+        timestamp = start + slot * datetime.timedelta(hours=3)
+
+        for city_id in range(1, CITIES + 1):
+            yield (
+                city_id,
+                timestamp,
+                random.choice(DESCRIPTIONS),
+                random.uniform(-20, 40),
+                random.uniform(950, 1050),
+                random.randint(0, 100)
+            )
+
+
+def size(path):
+    connection = sqlite3.connect(path)
+    connection.execute("VACUUM")
+    connection.close()
+
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from django.utils.dateparse import parse_datetime
+
+    from api import models
+
+    fields = models.Forecast._meta
+    epoch = fields.get_field("timestamp")
+    temperature = fields.get_field("temperature")
+    pressure = fields.get_field("pressure")
+    humidity = fields.get_field("humidity")
+
+    def encode_before(row):
+        city_id, timestamp, description, *values = row
+        return (
+            city_id,
+            timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            description
+        ) + tuple(values)
+
+    conditions = {
+        description: index + 1
+        for index, description in enumerate(DESCRIPTIONS)
+    }
+
+    def encode_after(row):
+        city_id, timestamp, description, t, p, h = row
+        return (
+            city_id,
+            epoch.get_prep_value(timestamp),
+            conditions[description],
+            temperature.get_prep_value(t),
+            pressure.get_prep_value(p),
+            humidity.get_prep_value(h)
+        )
+
+    # the conversions of the DB values to python ones Django applies
+    def decode_before(row):
+        timestamp, description, t, p, h = row
+        return (
+            parse_datetime(timestamp).replace(tzinfo=pytz.UTC),
+            description, t, p, h
+        )
+
+    def decode_after(row):
+        timestamp, description, t, p, h = row
+        return (
+            epoch.from_db_value(timestamp, None, None),
+            description,
+            temperature.from_db_value(t, None, None),
+            pressure.from_db_value(p, None, None),
+            humidity.from_db_value(h, None, None)
+        )
+
+    start = datetime.datetime(2018, 1, 1, tzinfo=pytz.UTC)
+    slots = args.rows // CITIES
+
+    random.seed(17)
+    lookups = []
+
+    for _ in range(args.lookups):
+        offset = random.randrange(max(slots - 40, 1))
+        lookups.append((
+            random.randint(1, CITIES),
+            start + offset * datetime.timedelta(hours=3),
+            start + (offset + 39) * datetime.timedelta(hours=3)
+        ))
+
+    variants = [
+        ("before", BEFORE, BEFORE_INSERT, BEFORE_RANGE, encode_before,
+         decode_before),
+        ("after", AFTER, AFTER_INSERT, AFTER_RANGE, encode_after,
+         decode_after)
+    ]
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        for name, ddl, insert, select, encode, decode in variants:
+            path = os.path.join(directory, "{}.sqlite3".format(name))
+
+            connection = sqlite3.connect(path)
+            connection.executescript(ddl)
+
+            if name == "after":
+                connection.executemany(
+                    'INSERT INTO "api_condition" VALUES (?, ?)',
+                    [(id_, description)
+                     for description, id_ in conditions.items()]
+                )
+
+            connection.executemany(
+                insert,
+                (encode(row) for row in forecasts(args.rows, start))
+            )
+            connection.commit()
+            connection.close()
+
+            total = size(path)
+
+            connection = sqlite3.connect(path)
+
+            bounds = [
+                (
+                    city_id,
+                    encode((city_id, from_date, DESCRIPTIONS[0], 0, 0, 0))[1],
+                    encode((city_id, to_date, DESCRIPTIONS[0], 0, 0, 0))[1]
+                )
+                for city_id, from_date, to_date in lookups
+            ]
+
+            def scan():
+                for parameters in bounds:
+                    for row in connection.execute(select, parameters):
+                        decode(row)
+
+            # per range of 40 forecasts
+            timings = [
+                timing / len(bounds)
+                for timing in measure(scan, repeat=5)
+            ]
+
+            connection.executescript(
+                'DROP INDEX "api_forecast_city_id";'
+                'DROP INDEX "api_forecast_city_id_timestamp_uniq";'
+            )
+            connection.commit()
+            connection.close()
+
+            table = size(path)
+
+            report(
+                "range scan {}".format(name),
+                timings,
+                db_bytes=total,
+                table_bytes=table,
+                row_bytes=round(table / args.rows, 1)
+            )
+
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare converting the temperatures of a response one at a time with
+converting them as a column.
+
+    python -m benchmarks.conversions --rows 40 4000
+
+"scalar" converts and rounds each temperature on its own, like
+serialize_forecast_rows() used to. "column" is conversions.ceil_temperatures()
+value by value and, if it's installed, with numpy. "serialize" is the whole
+serialize_forecast_rows() of a range response of that many rows.
+"""
+import argparse
+import datetime
+import math
+import random
+
+import pytz
+
+from benchmarks import measure, report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[40, 4000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from api import conversions, models, openweather
+
+    numpy = conversions.numpy
+
+    variants = [("column python", None)]
+
+    if numpy is not None:
+        variants.append(("column numpy", numpy))
+
+    try:
+        random.seed(13)
+        start = datetime.datetime(2018, 7, 18, tzinfo=pytz.UTC)
+
+        for count in args.rows:
+            temperatures = [
+                random.randint(-2000, 4000) / 100 for _ in range(count)
+            ]
+
+            rows = [
+                (
+                    start + index * openweather.FORECAST_MAX_AGE,
+                    "light rain",
+                    temperature,
+                    1013.25,
+                    80.0
+                )
+                for index, temperature in enumerate(temperatures)
+            ]
+
+            def scalar():
+                return [
+                    math.ceil(models.celsius_to_fahrenheit(temperature))
+                    for temperature in temperatures
+                ]
+
+            report(
+                "{} rows scalar".format(count),
+                measure(scalar, args.repeat)
+            )
+
+            for name, module in variants:
+                conversions.numpy = module
+
+                def column():
+                    return conversions.ceil_temperatures(
+                        temperatures,
+                        models.UNIT_FAHRENHEIT
+                    )
+
+                def serialize():
+                    return openweather.serialize_forecast_rows(
+                        rows,
+                        use_fahrenheit=True
+                    )
+
+                assert column() == scalar()
+
+                report(
+                    "{} rows {}".format(count, name),
+                    measure(column, args.repeat)
+                )
+                report(
+                    "{} rows serialize {}".format(count, name),
+                    measure(serialize, args.repeat)
+                )
+
+        conversions.numpy = numpy
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
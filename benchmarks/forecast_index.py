@@ -0,0 +1,128 @@
+"""Compare forecast lookups with and without the (city, timestamp) index.
+
+    python -m benchmarks.forecast_index --rows 1000000
+"""
+import argparse
+import datetime
+import random
+
+import pytz
+
+from benchmarks import measure, report, setup
+
+CITIES = 1000
+
+
+def seed(rows, batch_size=10000):
+    from api import models
+
+    cities = models.City.objects.bulk_create(
+        models.City(
+            ref=index,
+            name="City {}".format(index),
+            latitude=0,
+            longitude=0,
+            country_code="XX"
+        )
+        for index in range(CITIES)
+    )
+    city_ids = list(
+        models.City.objects.values_list("id", flat=True).order_by("id")
+    )
+
+    start = datetime.datetime(2018, 1, 1, tzinfo=pytz.UTC)
+    slots = rows // len(cities)
+
+    batch = []
+
+    for slot in range(slots):
+        timestamp = start + slot * datetime.timedelta(hours=3)
+
+        for city_id in city_ids:
+            batch.append(
+                models.Forecast(
+                    city_id=city_id,
+                    timestamp=timestamp,
+                    description="light rain",
+                    temperature=20.5,
+                    pressure=1013.25,
+                    humidity=80
+                )
+            )
+
+            if len(batch) == batch_size:
+                models.Forecast.objects.bulk_create(batch)
+                batch = []
+
+    models.Forecast.objects.bulk_create(batch)
+
+    return city_ids, start, slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from django.db import connection
+
+    from api import models, openweather
+
+    try:
+        unique_together = models.Forecast._meta.unique_together
+
+        # start without the index, just like before it was introduced
+        with connection.schema_editor() as schema_editor:
+            schema_editor.alter_unique_together(
+                models.Forecast,
+                unique_together,
+                ()
+            )
+
+        print("Seeding {} forecasts...".format(args.rows))
+        city_ids, start, slots = seed(args.rows)
+
+        random.seed(13)
+        lookups = [
+            (
+                random.choice(city_ids),
+                start + random.randrange(slots) *
+                datetime.timedelta(hours=3)
+            )
+            for _ in range(args.lookups)
+        ]
+
+        def lookup():
+            for city_id, timestamp in lookups:
+                openweather.filter_forecasts(
+                    models.City(id=city_id).forecasts,
+                    timestamp - openweather.FORECAST_MAX_AGE,
+                    timestamp
+                )
+
+        report(
+            "filter_forecasts (FK index only)",
+            [t / len(lookups) for t in measure(lookup, repeat=5)]
+        )
+
+        with connection.schema_editor() as schema_editor:
+            schema_editor.alter_unique_together(
+                models.Forecast,
+                (),
+                unique_together
+            )
+
+        report(
+            "filter_forecasts (city, timestamp)",
+            [t / len(lookups) for t in measure(lookup, repeat=5)]
+        )
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
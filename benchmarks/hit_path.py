@@ -0,0 +1,121 @@
+"""Measure the requests per second of the weather endpoint for forecasts
+that are already stored.
+
+    python -m benchmarks.hit_path --requests 2000
+
+Requests go through the full django stack to the weather endpoint, for all
+data types and temperature scales of a day of forecasts:
+
+- "response cache": every request is answered by the response cache of the
+  process
+- "prerendered": the response cache is cleared before each request, so
+  they are answered by the responses rendered when the forecasts were
+  stored (FORECAST_PRERENDER)
+- "forecast cache": the same without prerendered responses, the forecast
+  is taken from the forecast cache, serialized and rendered
+"""
+import argparse
+import datetime
+import itertools
+import os
+import statistics
+import time
+
+import pytz
+
+from benchmarks import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # room for the lookups and prerendered responses of all requests
+    os.environ.setdefault("FORECAST_CACHE_MAX_ENTRIES", "10000")
+
+    teardown = setup()
+
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    from api import openweather, views
+    from api.testdata import load_payload
+
+    try:
+        now = datetime.datetime.now(tz=pytz.UTC)
+        start = now.replace(
+            hour=now.hour - now.hour % 3,
+            minute=0,
+            second=0,
+            microsecond=0
+        )
+
+        with override_settings(FORECAST_PRERENDER=True):
+            openweather.ingest_forecasts(
+                "Berlin,DE",
+                load_payload(start=start + openweather.FORECAST_MAX_AGE)
+            )
+
+        requests = []
+
+        for slots in range(1, 9):
+            timestamp = start + slots * openweather.FORECAST_MAX_AGE
+
+            for data_type in views.VALID_DATATYPES:
+                url = reverse(
+                    "weather",
+                    kwargs={
+                        "data_type": data_type,
+                        "location": "Berlin,DE",
+                        "date": timestamp.date(),
+                        "time": timestamp.time()
+                    }
+                )
+
+                for temp_scale in ("c", "f"):
+                    requests.append((url, {"temp_scale": temp_scale}))
+
+        client = Client()
+
+        def run(clear):
+            start = time.perf_counter()
+
+            for url, params in itertools.islice(
+                    itertools.cycle(requests), args.requests):
+                if clear:
+                    openweather.response_cache.clear()
+
+                response = client.get(url, params)
+
+            assert response.json()["status"] == "success"
+
+            return args.requests / (time.perf_counter() - start)
+
+        scenarios = (
+            ("response cache", False, True),
+            ("prerendered", True, True),
+            ("forecast cache", True, False)
+        )
+
+        # warm up, fills the forecast cache
+        for _, clear, prerender in scenarios:
+            with override_settings(FORECAST_PRERENDER=prerender):
+                run(clear)
+
+        for name, clear, prerender in scenarios:
+            with override_settings(FORECAST_PRERENDER=prerender):
+                rates = [run(clear) for _ in range(args.rounds)]
+
+            print("{:<15} {:8.0f} requests/s".format(
+                name,
+                statistics.median(rates)
+            ))
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Measure queries and wall time of a single forecast refresh."""
+import datetime
+
+import pytz
+
+from benchmarks import measure, report, setup
+
+
+def main():
+    teardown = setup()
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from api import models, openweather
+    from api.testdata import load_payload
+
+    payload = load_payload(start=datetime.datetime.now(tz=pytz.UTC))
+    openweather.query = lambda location, *args, **kwargs: payload
+
+    try:
+        def first_refresh():
+            models.City.objects.all().delete()
+            openweather.add_forecasts("Berlin,DE")
+
+        def refresh():
+            for forecast_data in payload["list"]:
+                forecast_data["main"]["temp"] += 0.01
+            openweather.add_forecasts("Berlin,DE")
+
+        for title, func in (
+            ("add_forecasts (new city)", first_refresh),
+            ("add_forecasts (known city)", refresh),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+
+            report(
+                title,
+                measure(func),
+                slots=len(payload["list"]),
+                queries=len(queries.captured_queries)
+            )
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compare the peak memory of storing a forecast response that is decoded
+as a whole with one that is parsed while it's read.
+
+    python -m benchmarks.ingest_memory --slots 40 400 4000
+
+The recorded payload is repeated to the given number of slots, as the
+hourly or 16 day endpoints of the API return more of them. The body is
+read in chunks of openweather.STREAM_CHUNK_SIZE bytes, like a streamed
+response. Only memory allocated while the response is decoded and stored
+is measured, the body itself is not.
+"""
+import argparse
+import datetime
+import json
+import tracemalloc
+
+import pytz
+
+from benchmarks import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slots", type=int, nargs="+",
+                        default=[40, 400, 4000])
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from api import models, openweather
+    from api.testdata import load_payload
+
+    try:
+        start = datetime.datetime(2018, 7, 18, tzinfo=pytz.UTC)
+        recorded = load_payload(start=start)
+
+        def build(slots):
+            payload = dict(recorded, cnt=slots, list=[])
+
+            for index in range(slots):
+                forecast_data = dict(
+                    recorded["list"][index % len(recorded["list"])]
+                )
+                forecast_data["dt_txt"] = (
+                    start + datetime.timedelta(hours=index)
+                ).strftime(openweather.DATETIME_FORMAT)
+
+                payload["list"].append(forecast_data)
+
+            return json.dumps(payload).encode("utf-8")
+
+        def chunks(body):
+            size = openweather.STREAM_CHUNK_SIZE
+
+            for offset in range(0, len(body), size):
+                yield body[offset:offset + size]
+
+        def decoded(body):
+            return json.loads(b"".join(chunks(body)).decode("utf-8"))
+
+        def streamed(body):
+            return openweather.jsonstream.ObjectStream(chunks(body), "list")
+
+        def peak(body, parse):
+            tracemalloc.start()
+
+            try:
+                openweather.ingest_forecasts("Berlin,DE", parse(body))
+                return tracemalloc.get_traced_memory()[1]
+
+            finally:
+                tracemalloc.stop()
+
+        for slots in args.slots:
+            body = build(slots)
+
+            for name, parse in (("decoded", decoded), ("streamed", streamed)):
+                models.City.objects.all().delete()
+
+                # a new city, and a known one
+                new = peak(body, parse)
+                known = peak(body, parse)
+
+                print(
+                    "{:>5} slots {:>9} body={:7.0f}KiB new city={:7.0f}KiB "
+                    "known city={:7.0f}KiB".format(
+                        slots,
+                        name,
+                        len(body) / 1024,
+                        new / 1024,
+                        known / 1024
+                    )
+                )
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Measure what collecting the metrics adds to the time of a request.
+
+    python -m benchmarks.metrics_overhead --requests 1000
+
+Requests go through the full django stack - middleware included - to the
+weather endpoint, for forecasts that are already stored. "cached" requests
+are answered from the response cache, the cheapest possible request and so
+the one the metrics weigh most on, "uncached" ones look the forecast up in
+the DB. As the difference is close to the noise of such a measurement, the
+cost of the metrics a request records is measured on its own, too.
+"""
+import argparse
+import datetime
+import statistics
+import time
+
+import pytz
+
+from benchmarks import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    from api import metrics, openweather
+    from api.testdata import load_payload
+
+    try:
+        now = datetime.datetime.now(tz=pytz.UTC)
+        timestamp = now + openweather.FORECAST_MAX_AGE
+
+        openweather.ingest_forecasts(
+            "Berlin,DE",
+            load_payload(start=now.replace(minute=0, second=0))
+        )
+
+        url = reverse(
+            "weather",
+            kwargs={
+                "data_type": "summary",
+                "location": "Berlin,DE",
+                "date": timestamp.date(),
+                "time": timestamp.time()
+            }
+        )
+
+        client = Client()
+
+        def run(cached):
+            start = time.perf_counter()
+
+            for _ in range(args.requests):
+                if not cached:
+                    openweather.response_cache.clear()
+                    openweather.get_forecast_cache().clear()
+
+                response = client.get(url)
+
+            assert response.json()["status"] == "success"
+
+            return (time.perf_counter() - start) / args.requests
+
+        # warm up
+        run(True)
+        run(False)
+
+        for cached in (True, False):
+            timings = {True: [], False: []}
+
+            # alternate, so both see the same conditions
+            for _ in range(args.rounds):
+                for enabled in (False, True):
+                    with override_settings(FORECAST_METRICS=enabled):
+                        timings[enabled].append(run(cached))
+
+            without = statistics.median(timings[False])
+            with_metrics = statistics.median(timings[True])
+
+            if cached:
+                without_cached = without
+
+            print(
+                "{:<10} without={:7.3f}ms with={:7.3f}ms "
+                "overhead={:+.2f}%".format(
+                    "cached" if cached else "uncached",
+                    without * 1000,
+                    with_metrics * 1000,
+                    (with_metrics / without - 1) * 100
+                )
+            )
+
+        # what the middleware, the stages of an uncached request and the
+        # cache lookup record
+        def record():
+            start = time.perf_counter()
+
+            for _ in range(args.requests):
+                metrics.request_seconds.observe(0.001, "weather")
+                metrics.request_queries.observe(3, "weather")
+                metrics.stage_seconds.observe(0.001, "get_forecast")
+                metrics.stage_seconds.observe(0.001, "filter")
+                metrics.stage_seconds.observe(0.001, "serialize")
+                metrics.forecast_cache_requests.inc("miss")
+
+            return (time.perf_counter() - start) / args.requests
+
+        cost = statistics.median(record() for _ in range(args.rounds))
+
+        print(
+            "{:<10} {:7.3f}ms per request, {:.2f}% of a cached one".format(
+                "recording",
+                cost * 1000,
+                cost / without_cached * 100
+            )
+        )
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
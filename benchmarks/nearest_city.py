@@ -0,0 +1,98 @@
+"""Compare nearest-city lookups with and without the k-d tree.
+
+    python -m benchmarks.nearest_city --cities 200000
+"""
+import argparse
+import math
+import random
+
+from benchmarks import measure, report, setup
+
+
+def seed(count, batch_size=10000):
+    from api import models
+
+    random.seed(13)
+
+    batch = []
+
+    for ref in range(count):
+        batch.append(
+            models.City(
+                ref=ref,
+                name="City {}".format(ref),
+                # points are spread evenly over the sphere
+                latitude=math.degrees(math.asin(random.uniform(-1, 1))),
+                longitude=random.uniform(-180, 180),
+                country_code="XX"
+            )
+        )
+
+        if len(batch) == batch_size:
+            models.City.objects.bulk_create(batch)
+            batch = []
+
+    models.City.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from api import locations, models, spatial
+
+    try:
+        print("Seeding {} cities...".format(args.cities))
+        seed(args.cities)
+
+        positions = [
+            (random.uniform(-90, 90), random.uniform(-180, 180))
+            for _ in range(args.lookups)
+        ]
+
+        def build():
+            locations.positions.clear()
+            locations.positions.load()
+
+        report("build the k-d tree", measure(build, repeat=3))
+
+        def lookup():
+            for latitude, longitude in positions:
+                locations.positions.nearest(latitude, longitude)
+
+        report(
+            "nearest city (k-d tree)",
+            [t / len(positions) for t in measure(lookup, repeat=5)]
+        )
+
+        # what it takes without an index: a scan of all cities
+        vectors = [
+            spatial.to_vector(latitude, longitude) + (ref,)
+            for latitude, longitude, ref in models.City.objects
+            .values_list("latitude", "longitude", "ref")
+        ]
+
+        def scan():
+            for latitude, longitude in positions[:20]:
+                x, y, z = spatial.to_vector(latitude, longitude)
+                min(
+                    vectors,
+                    key=lambda v: (v[0] - x) ** 2 + (v[1] - y) ** 2 +
+                    (v[2] - z) ** 2
+                )
+
+        report(
+            "nearest city (linear scan)",
+            [t / 20 for t in measure(scan, repeat=3)]
+        )
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the time it takes to render a response of the weather and the
+range endpoint to JSON.
+
+    python -m benchmarks.render --responses 10000
+
+"drf" is the JSONRenderer of the REST framework, "fast" the renderer of the
+api app with the json module and, if it's installed, with orjson.
+"""
+import argparse
+import datetime
+
+import pytz
+
+from benchmarks import measure, report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--responses", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    teardown = setup()
+
+    from rest_framework.renderers import JSONRenderer
+
+    from api import openweather, renderers
+    from api.testdata import load_payload
+
+    try:
+        start = datetime.datetime(2018, 7, 18, tzinfo=pytz.UTC)
+
+        forecasts = [
+            openweather.parse_forecast(forecast_data)
+            for forecast_data in load_payload(start=start)["list"]
+        ]
+
+        payloads = {
+            "weather": openweather.serialize_forecast(forecasts[0]),
+            "range": {
+                "status": "success",
+                "forecasts": openweather.serialize_forecast_rows(
+                    [
+                        [
+                            getattr(forecast, field)
+                            for field in openweather.FORECAST_VALUE_FIELDS
+                        ]
+                        for forecast in forecasts
+                    ]
+                )
+            }
+        }
+
+        orjson = renderers.orjson
+        drf = JSONRenderer()
+
+        variants = [
+            ("drf", drf.render),
+            ("fast json", renderers.render)
+        ]
+
+        if orjson is not None:
+            variants.append(("fast orjson", renderers.render))
+
+        for name, data in sorted(payloads.items()):
+            for variant, render in variants:
+                renderers.orjson = orjson if variant == "fast orjson" \
+                    else None
+
+                def run():
+                    for _ in range(args.responses):
+                        render(data)
+
+                timings = [
+                    timing / args.responses
+                    for timing in measure(run, args.repeat)
+                ]
+
+                # per response
+                report(
+                    "{} {}".format(name, variant),
+                    timings,
+                    bytes=len(render(data))
+                )
+
+        renderers.orjson = orjson
+
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
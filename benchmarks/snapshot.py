@@ -0,0 +1,137 @@
+"""Compare forecast lookups through the DB with lookups in the memory-mapped
+snapshot of the current forecasts (FORECAST_SNAPSHOT).
+
+    python -m benchmarks.snapshot --cities 1000 --lookups 2000
+
+The forecast cache is cleared before each lookup, so every lookup is either
+answered by the DB or by the snapshot. The test database is a file, like a
+deployed one.
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+
+import pytz
+
+from benchmarks import measure, report, setup
+
+SLOTS = 40
+
+
+def seed(cities, now):
+    from api import models, openweather
+
+    models.City.objects.bulk_create(
+        models.City(
+            ref=index,
+            name="City {}".format(index),
+            latitude=0,
+            longitude=0,
+            country_code="XX",
+            fetched_at=now
+        )
+        for index in range(cities)
+    )
+
+    city_ids = list(
+        models.City.objects.values_list("id", flat=True).order_by("id")
+    )
+
+    models.CitySearchResult.objects.bulk_create(
+        models.CitySearchResult(search="city {}".format(index), city_id=id_)
+        for index, id_ in enumerate(city_ids)
+    )
+
+    random.seed(13)
+
+    for city_id in city_ids:
+        models.Forecast.objects.bulk_create(
+            models.Forecast(
+                city_id=city_id,
+                timestamp=now + slot * openweather.FORECAST_MAX_AGE,
+                description=random.choice(["clear sky", "light rain"]),
+                temperature=random.uniform(-20, 40),
+                pressure=random.uniform(950, 1050),
+                humidity=random.randint(0, 100)
+            )
+            for slot in range(SLOTS)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+
+    teardown = setup(database=os.path.join(directory, "db.sqlite3"))
+
+    from django.test import override_settings
+
+    from api import openweather
+
+    path = os.path.join(directory, "forecasts.snapshot")
+
+    try:
+        now = datetime.datetime.now(tz=pytz.UTC).replace(microsecond=0)
+
+        print("Seeding {} forecasts...".format(args.cities * SLOTS))
+        seed(args.cities, now)
+
+        random.seed(17)
+        lookups = [
+            (
+                "city {}".format(random.randrange(args.cities)),
+                now + random.uniform(0, SLOTS - 1) *
+                openweather.FORECAST_MAX_AGE
+            )
+            for _ in range(args.lookups)
+        ]
+
+        forecast_cache = openweather.get_forecast_cache()
+
+        def lookup():
+            for location, timestamp in lookups:
+                forecast_cache.clear()
+                openweather.get_forecast(location, timestamp)
+
+        with override_settings(FORECAST_SNAPSHOT_PATH=path):
+            timings = measure(openweather.write_snapshot, repeat=5)
+
+        report(
+            "write snapshot",
+            timings,
+            bytes=os.path.getsize(path)
+        )
+
+        for name, enabled in (("db", False), ("snapshot", True)):
+            with override_settings(
+                    FORECAST_SNAPSHOT=enabled,
+                    FORECAST_SNAPSHOT_PATH=path):
+
+                # warm up, the locations are known to the process afterwards
+                lookup()
+
+                # per lookup
+                report(
+                    "get_forecast {}".format(name),
+                    [
+                        timing / len(lookups)
+                        for timing in measure(lookup, repeat=5)
+                    ]
+                )
+
+    finally:
+        teardown()
+
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+ASGI config for openweathermap_rest project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+run it with any ASGI 3 server, i.e.
+
+    uvicorn openweathermap_rest.asgi:application
+
+The weather endpoint is served without blocking a thread while the
+openweathermap.org API is queried, all other requests are handled by the
+WSGI application in a thread pool.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "openweathermap_rest.settings")
+
+wsgi_application = get_wsgi_application()
+
+from api.asgi import ForecastApplication  # noqa: E402
+
+application = ForecastApplication(wsgi_application)
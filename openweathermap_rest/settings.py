@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it observes the other middleware as well
+    'api.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +86,52 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+# Forecast lookups go through the "forecasts" cache. The default is a
+# per-process cache, to share entries between processes and hosts point it
+# to a shared backend, i.e. memcached or a Redis-compatible backend like
+# FORECAST_CACHE_BACKEND=django_redis.cache.RedisCache
+# FORECAST_CACHE_LOCATION=redis://127.0.0.1:6379/1
+# Backends evicting entries on their own, i.e. the per-process one, hold up
+# to FORECAST_CACHE_MAX_ENTRIES entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'forecasts': {
+        'BACKEND': os.getenv(
+            'FORECAST_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('FORECAST_CACHE_LOCATION', 'forecasts'),
+        'KEY_PREFIX': 'openweathermap_rest',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('FORECAST_CACHE_MAX_ENTRIES', 300)),
+        },
+    },
+}
+
+FORECAST_CACHE_ALIAS = 'forecasts'
+
+
+# Django REST framework
+# http://www.django-rest-framework.org/api-guide/settings/
+
+# JSON is rendered with orjson, if it's installed, and the renderers are only
+# negotiated for clients that might want the browsable API
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS':
+        'api.renderers.FastContentNegotiation',
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -122,6 +170,175 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# openweathermap.org API client
+OPENWEATHERMAPORG_API_URL = "http://api.openweathermap.org/data/2.5/"
+
+# timeouts in seconds for establishing a connection to and waiting for a
+# response from the API
+OPENWEATHERMAPORG_CONNECT_TIMEOUT = 3.05
+OPENWEATHERMAPORG_READ_TIMEOUT = 10
+
+# how often to retry a request that failed with a connection error, a 5xx or
+# a 429 response and the base delay in seconds for the (jittered)
+# exponential backoff between the attempts
+OPENWEATHERMAPORG_MAX_RETRIES = 2
+OPENWEATHERMAPORG_RETRY_BACKOFF = 0.5
+
+# max. number of concurrent connections to the API per process
+OPENWEATHERMAPORG_MAX_CONNECTIONS = 10
+
+# max. number of calls per minute the API key allows, shared by all processes
+# using the same DB - None disables the limit. Background refreshes leave the
+# given share of the budget to requests of users. If the budget is exhausted,
+# stale forecasts are served where possible.
+OPENWEATHERMAPORG_CALLS_PER_MINUTE = 60
+OPENWEATHERMAPORG_INTERACTIVE_RESERVE = 0.25
+
+# max. number of seconds a process may block others from fetching the same
+# location, before its fetch is considered to have failed
+FORECAST_FETCH_LEASE = 60
+
+# max. number of rendered responses of the weather endpoints kept in memory
+# per process, 0 disables the cache
+FORECAST_RESPONSE_CACHE_SIZE = 10000
+
+# render the responses to all requests for freshly stored forecasts right
+# away and keep them in the forecast cache, so the first request of every
+# process for a slot is answered without a DB query as well. That's 8
+# entries per forecast - 320 per location - so give the cache enough room,
+# see FORECAST_CACHE_MAX_ENTRIES.
+FORECAST_PRERENDER = False
+
+# keep the current forecasts of all cities in a memory-mapped file, rebuilt
+# after refreshes, and answer lookups from it without a DB query - all
+# processes on a host share its pages. The file is replaced atomically, so
+# processes pick up a new snapshot with their next lookup. It's rebuilt by
+# a background thread, FORECAST_SNAPSHOT_DELAY seconds after a refresh, so
+# the refreshes of that time share one rebuild - None rebuilds it right
+# away, on the thread of the refresh.
+FORECAST_SNAPSHOT = False
+FORECAST_SNAPSHOT_PATH = os.getenv(
+    "FORECAST_SNAPSHOT_PATH",
+    os.path.join(BASE_DIR, "forecasts.snapshot")
+)
+FORECAST_SNAPSHOT_DELAY = 1
+
+# Forecasts of frequently requested locations are refreshed in the
+# background, before they expire. Run the refreshes either via the
+# prefetch_forecasts management command or in a worker thread of each
+# process by setting FORECAST_PREFETCH_WORKER to True.
+FORECAST_PREFETCH_WORKER = False
+
+# seconds between two refresh cycles
+FORECAST_PREFETCH_INTERVAL = 60
+
+# max. number of locations to keep fresh, only locations requested within
+# the last FORECAST_PREFETCH_WINDOW seconds are considered
+FORECAST_PREFETCH_TOP = 100
+FORECAST_PREFETCH_WINDOW = 24 * 60 * 60
+
+# refresh forecasts that many seconds before they expire
+FORECAST_PREFETCH_LEAD = 30 * 60
+
+# max. number of API calls per minute for background refreshes
+FORECAST_PREFETCH_BUDGET = 30
+
+# Refresh the due forecasts in bulk: the current weather of their cities is
+# checked first, with up to 20 cities per call to the API. Forecasts whose
+# temperature for now is within FORECAST_PREFETCH_GROUP_TOLERANCE degrees of
+# the observed one are kept, the prefetch picks them up again when they are
+# due by the time of the check - as long as they have been fetched within
+# FORECAST_PREFETCH_GROUP_MAX_AGE seconds. All others are fetched
+# concurrently and stored in one transaction.
+FORECAST_PREFETCH_BULK = False
+FORECAST_PREFETCH_GROUP_TOLERANCE = 2
+FORECAST_PREFETCH_GROUP_MAX_AGE = 12 * 60 * 60
+
+# seconds between writing the collected request counts to the DB, which is
+# done by a background thread
+REQUEST_TRACKING_FLUSH_INTERVAL = 10
+
+# Stale-while-revalidate: once the forecasts of a city are older than
+# FORECAST_STALE_AFTER seconds, they are still served (flagged as stale) while
+# fresh ones are fetched in the background by up to
+# FORECAST_REVALIDATE_WORKERS threads. Forecasts older than
+# FORECAST_MAX_STALENESS seconds are not served, requests wait for the
+# refresh instead.
+FORECAST_STALE_WHILE_REVALIDATE = False
+FORECAST_STALE_AFTER = 3 * 60 * 60
+FORECAST_MAX_STALENESS = 24 * 60 * 60
+FORECAST_REVALIDATE_WORKERS = 4
+
+# max. number of items per request to the batch endpoint and the max. number
+# of locations fetched from the API concurrently while answering it
+FORECAST_BATCH_MAX_ITEMS = 2000
+FORECAST_BATCH_WORKERS = 8
+
+# max. distance in km between a position requested from the coords endpoint
+# and the nearest known city, positions farther away are answered with a
+# 404 - None disables the limit
+FORECAST_COORDS_MAX_DISTANCE = 50
+
+# number of threads the ASGI application (openweathermap_rest.asgi) runs DB
+# queries and requests to non-async views in, the API is queried without
+# blocking any of them - see OPENWEATHERMAPORG_MAX_CONNECTIONS for the max.
+# number of queries in flight
+FORECAST_ASYNC_THREADS = 10
+
+# Past forecasts are removed by the compact_forecasts management command:
+# those older than FORECAST_RETENTION_MAX_AGE seconds and all but the newest
+# FORECAST_RETENTION_MAX_PER_CITY of a city, None disables either rule. They
+# are deleted in transactions of up to FORECAST_RETENTION_BATCH_SIZE rows,
+# so writers aren't locked out for long. With FORECAST_RETENTION_ARCHIVE,
+# the removed forecasts are kept as daily aggregates in ForecastArchive.
+# Run with --loop, the command compacts every FORECAST_RETENTION_INTERVAL
+# seconds.
+FORECAST_RETENTION_MAX_AGE = 30 * 24 * 60 * 60
+FORECAST_RETENTION_MAX_PER_CITY = 1000
+FORECAST_RETENTION_BATCH_SIZE = 500
+FORECAST_RETENTION_ARCHIVE = False
+FORECAST_RETENTION_INTERVAL = 60 * 60
+
+# collect metrics of the request handling and serve them in the Prometheus
+# text format on /metrics
+FORECAST_METRICS = True
+
+# level of the log of the api app, i.e. DEBUG for the details of every lookup
+FORECAST_LOG_LEVEL = os.getenv("FORECAST_LOG_LEVEL", "INFO")
+
+# share of the requests logged as a structured record (a line of JSON) with
+# their view, status, duration and number of DB queries - 0 disables it
+FORECAST_REQUEST_LOG_SAMPLE_RATE = 0.01
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {
+            "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        }
+    },
+    "handlers": {
+        "stdout": {
+            "class": "logging.StreamHandler",
+            "stream": "ext://sys.stdout",
+            "formatter": "default"
+        }
+    },
+    "loggers": {
+        "openweathermap_rest.api": {
+            "handlers": ["stdout"],
+            "level": FORECAST_LOG_LEVEL,
+            "propagate": False
+        },
+        "openweathermap_rest.api.requests": {
+            "handlers": ["stdout"],
+            "level": "INFO",
+            "propagate": False
+        }
+    }
+}
+
 # used for i.e. testing
 BASE_URL = "http://127.0.0.1:8000"
 TEST_RUNNER = "openweathermap_rest.pytest_runner.PytestTestRunner"
@@ -16,9 +16,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include, re_path
 
+from api import views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("weather/", include("api.urls")),
+    path("metrics", views.prometheus_metrics, name="metrics"),
     re_path(
         r'^api-auth/',
         include('rest_framework.urls', namespace='rest_framework')